@@ -0,0 +1,43 @@
+# Generated by Django 4.2.26 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    Cart.objects.update(
+        item_count=Coalesce(
+            Subquery(lines.annotate(value=Count('id')).values('value'), output_field=IntegerField()),
+            Value(0)
+        ),
+        total_quantity=Coalesce(
+            Subquery(lines.annotate(value=Sum('quantity')).values('value'), output_field=IntegerField()),
+            Value(0)
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Позиций в корзине'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0, verbose_name='Единиц товара'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,24 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from django.contrib.auth.models import User
 from food.models import FoodItem
 import uuid
 from datetime import datetime
 from decimal import Decimal
 
+from .pricing import get_cart_totals
+
+def adjust_cart_counters(cart_id, items=0, quantity=0, using='default'):
+    """Изменить счётчики корзины на разницу (не ниже нуля) и отметить время изменения"""
+    Cart.objects.using(using).filter(pk=cart_id).update(
+        item_count=Greatest(F('item_count') + items, Value(0)),
+        total_quantity=Greatest(F('total_quantity') + quantity, Value(0)),
+        updated_at=timezone.now()
+    )
+
+
 class Cart(models.Model):
     """Корзина пользователя для покупок"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -13,6 +27,10 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Счётчики для значка корзины (обновляются сигналами строк, см. cart/signals.py)
+    item_count = models.PositiveIntegerField(default=0, verbose_name='Позиций в корзине')
+    total_quantity = models.PositiveIntegerField(default=0, verbose_name='Единиц товара')
+    
     class Meta:
         verbose_name = 'Корзина покупок'
         verbose_name_plural = 'Корзины покупок'
@@ -20,44 +38,34 @@ class Cart(models.Model):
     def __str__(self):
         return f"Корзина {self.user.username}"
     
+    def adjust_counters(self, items=0, quantity=0):
+        """Атомарно изменить счётчики одним UPDATE с F-выражениями"""
+        adjust_cart_counters(self.pk, items=items, quantity=quantity)
+    
+    # Все суммы считает cart.pricing: строки загружаются один раз на объект корзины
+    def get_totals(self, user=None, delivery_method='courier'):
+        return get_cart_totals(self, user=user, delivery_method=delivery_method)
+    
     @property
     def total_items(self):
-        return self.items.count()
+        return get_cart_totals(self).item_count
     
     @property
     def subtotal(self):
-        return sum(item.total_price for item in self.items.all())
+        return get_cart_totals(self).subtotal
     
     def get_discount(self, subscription_type=None):
-        if subscription_type:
-            if subscription_type == 'pro':
-                return self.subtotal * Decimal('0.20')  # Правильно: Decimal * Decimal
-            elif subscription_type == 'premium':
-                return self.subtotal * Decimal('0.10')   # Правильно: Decimal * Decimal
-        return Decimal('0')
+        return get_cart_totals(self, tier=subscription_type or '').discount
     
     def get_delivery_cost(self, delivery_method='courier', subscription_type=None):
         """Получить стоимость доставки с учетом подписки"""
-        if subscription_type in ['premium', 'pro'] and self.subtotal >= 2000:
-            # Бесплатная доставка для premium/pro при заказе от 2000₽
-            return 0
-        
-        if delivery_method == 'pickup':
-            return 0
-        elif delivery_method == 'post':
-            return 300
-        else:  # courier
-            return 500
+        return get_cart_totals(
+            self, delivery_method=delivery_method, tier=subscription_type or ''
+        ).delivery_cost
     
     def get_assembly_cost(self):
         """Стоимость сборки товара"""
-        try:
-            subtotal = self.subtotal
-            # Правильно: используем Decimal для операций
-            assembly_cost = subtotal * Decimal('0.05')
-            return max(assembly_cost, Decimal('100'))
-        except:
-            return Decimal('100')
+        return get_cart_totals(self).assembly_cost
 class CartItem(models.Model):
     """Элемент корзины"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
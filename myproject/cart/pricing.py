@@ -0,0 +1,146 @@
+# cart/pricing.py - расчёт итогов корзины
+"""
+Строки корзины загружаются одним запросом (вместе с товаром и категорией),
+все суммы считаются за один проход и запоминаются на объекте корзины.
+Представления, шаблоны и модель Cart берут итоги отсюда.
+"""
+from decimal import Decimal
+
+from django.utils import timezone
+
+
+# Скидка по активной подписке
+DISCOUNT_RATES = {
+    'pro': Decimal('0.20'),
+    'premium': Decimal('0.10'),
+}
+
+DELIVERY_COSTS = {
+    'courier': Decimal('500'),
+    'post': Decimal('300'),
+    'pickup': Decimal('0'),
+}
+FREE_DELIVERY_FROM = Decimal('2000')  # бесплатная доставка для подписчиков
+
+ASSEMBLY_RATE = Decimal('0.05')
+MIN_ASSEMBLY_COST = Decimal('100')
+
+
+def subscription_tier(user):
+    """'pro' / 'premium' для активной подписки, иначе ''"""
+    from user_profile.pricing import pricing_tier
+    return pricing_tier(user)
+
+
+class CartTotals:
+    """Итоги корзины, посчитанные за один проход по строкам"""
+
+    def __init__(self, lines, tier='', delivery_method='courier'):
+        self.lines = lines
+        self.tier = tier
+        self.delivery_method = delivery_method if delivery_method in DELIVERY_COSTS else 'courier'
+
+        subtotal = Decimal('0')
+        quantity = 0
+        for line in lines:
+            subtotal += line.price_at_addition * line.quantity
+            quantity += line.quantity
+
+        self.subtotal = subtotal
+        self.item_count = len(lines)
+        self.total_quantity = quantity
+
+        self.discount_rate = DISCOUNT_RATES.get(tier, Decimal('0'))
+        self.discount = subtotal * self.discount_rate
+
+        if tier in DISCOUNT_RATES and subtotal >= FREE_DELIVERY_FROM:
+            self.delivery_cost = Decimal('0')
+        else:
+            self.delivery_cost = DELIVERY_COSTS[self.delivery_method]
+
+        self.assembly_cost = max(subtotal * ASSEMBLY_RATE, MIN_ASSEMBLY_COST)
+        self.total = subtotal - self.discount + self.delivery_cost + self.assembly_cost
+
+    @property
+    def discount_percentage(self):
+        return self.discount_rate * 100
+
+    def as_dict(self):
+        """Числа для JSON-ответов"""
+        return {
+            'subtotal': float(self.subtotal),
+            'discount': float(self.discount),
+            'discount_percentage': float(self.discount_percentage),
+            'delivery_cost': float(self.delivery_cost),
+            'assembly_cost': float(self.assembly_cost),
+            'total': float(self.total),
+            'total_items': self.item_count,
+            'total_quantity': self.total_quantity,
+        }
+
+
+def cart_lines(cart):
+    """Строки корзины с товарами; загружаются один раз на объект корзины"""
+    lines = getattr(cart, '_pricing_lines', None)
+    if lines is None:
+        lines = list(
+            cart.items.select_related('food', 'food__category').order_by('food__name', 'id')
+        )
+        cart._pricing_lines = lines
+    return lines
+
+
+def get_cart_totals(cart, user=None, delivery_method='courier', tier=None):
+    """Итоги корзины; повторные вызовы с теми же параметрами не обращаются к базе"""
+    if tier is None:
+        tier = subscription_tier(user) if user is not None else ''
+    cache = getattr(cart, '_pricing_totals', None)
+    if cache is None:
+        cache = cart._pricing_totals = {}
+    key = (tier, delivery_method)
+    if key not in cache:
+        cache[key] = CartTotals(cart_lines(cart), tier, delivery_method)
+    return cache[key]
+
+
+def reprice_cart(cart, user=None, tier=None):
+    """Пересчитать цены строк по текущему тарифу пользователя.
+
+    Тариф определяется один раз, новые цены считаются в памяти, а изменившиеся
+    строки сохраняются одним bulk_update. Возвращает список изменённых строк.
+    """
+    from .models import CartItem
+
+    if tier is None:
+        tier = subscription_tier(user) if user is not None else ''
+
+    changed = []
+    for line in cart_lines(cart):
+        price = line.food.get_price_for_tier(tier)
+        if line.price_at_addition != price:
+            line.price_at_addition = price
+            changed.append(line)
+
+    if changed:
+        CartItem.objects.bulk_update(changed, ['price_at_addition'])
+        # Время изменения корзины - часть ключей кэша, зависящих от её итогов
+        type(cart).objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+        # Строки в памяти уже с новыми ценами - сбрасываем только итоги
+        cart.__dict__.pop('_pricing_totals', None)
+    return changed
+
+
+def reprice_user_cart(user):
+    """Пересчитать корзину пользователя, если она есть (например, после смены подписки)"""
+    from .models import Cart
+
+    cart = Cart.objects.filter(user=user).first()
+    if cart is None:
+        return []
+    return reprice_cart(cart, user)
+
+
+def invalidate_cart_totals(cart):
+    """Сбросить запомненные строки и итоги после изменения корзины"""
+    cart.__dict__.pop('_pricing_lines', None)
+    cart.__dict__.pop('_pricing_totals', None)
@@ -0,0 +1,159 @@
+# cart/services.py - оформление заказа
+import uuid
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from food.models import FoodItem
+
+from .models import Cart, FoodOrder, FoodOrderItem
+from .pricing import cart_lines, get_cart_totals, invalidate_cart_totals, reprice_cart, subscription_tier
+
+
+class CheckoutError(Exception):
+    """Заказ не может быть оформлен"""
+    status = 400
+
+
+class EmptyCartError(CheckoutError):
+    def __init__(self):
+        super().__init__('Корзина пуста')
+
+
+class StockConflict(CheckoutError):
+    """Товара на складе меньше, чем в корзине"""
+    status = 409
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        names = ', '.join(item['name'] for item in shortages)
+        super().__init__(f'Недостаточно товара на складе: {names}')
+
+
+def generate_order_number():
+    return f"AKZ-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
+
+
+def reserve_stock(quantities):
+    """Списать остатки {food_id: количество} одним UPDATE или выбросить StockConflict.
+
+    Строки товаров сначала блокируются в порядке id (select_for_update), чтобы параллельные
+    заказы с пересекающимися товарами не взаимоблокировались; условие stock >= количество
+    в самом UPDATE не даёт уйти в минус даже там, где блокировок строк нет (SQLite).
+    Вызывать внутри transaction.atomic().
+    """
+    rows = FoodItem.objects.select_for_update().filter(id__in=quantities).order_by('id').values_list(
+        'id', 'stock', 'name'
+    )
+    stocks = {}
+    names = {}
+    for food_id, stock, name in rows:
+        stocks[food_id] = stock
+        names[food_id] = name
+
+    shortages = [
+        {'food_id': str(food_id), 'name': names.get(food_id, ''),
+         'requested': quantity, 'available': stocks.get(food_id, 0)}
+        for food_id, quantity in quantities.items()
+        if stocks.get(food_id, 0) < quantity
+    ]
+    if shortages:
+        raise StockConflict(shortages)
+
+    requested = Case(
+        *[When(id=food_id, then=Value(quantity)) for food_id, quantity in quantities.items()],
+        output_field=IntegerField()
+    )
+    updated = FoodItem.objects.filter(id__in=quantities, stock__gte=requested).update(
+        stock=F('stock') - requested
+    )
+    if updated != len(quantities):
+        # Остаток успели изменить между проверкой и списанием
+        current = dict(FoodItem.objects.filter(id__in=quantities).values_list('id', 'stock'))
+        raise StockConflict([
+            {'food_id': str(food_id), 'name': names.get(food_id, ''),
+             'requested': quantity, 'available': current.get(food_id, 0)}
+            for food_id, quantity in quantities.items()
+            if current.get(food_id, 0) < quantity
+        ])
+
+
+def checkout_cart(user, data):
+    """Оформить заказ из корзины пользователя атомарно: заказ, строки, остатки и очистка корзины"""
+    delivery_method = data.get('delivery_method', 'courier')
+    tier = subscription_tier(user)
+
+    with transaction.atomic():
+        # Первый запрос транзакции - запись: он блокирует строку корзины (в SQLite - сразу всю базу,
+        # без взаимоблокировки при повышении уровня блокировки). Повторное нажатие "Оформить"
+        # ждёт первое и видит уже пустую корзину.
+        # Счётчики значка уменьшают сигналы удаления строк при очистке корзины.
+        if not Cart.objects.filter(user=user).update(updated_at=timezone.now()):
+            raise EmptyCartError()
+        cart = Cart.objects.get(user=user)
+
+        reprice_cart(cart, tier=tier)
+        lines = cart_lines(cart)
+        if not lines:
+            raise EmptyCartError()
+
+        quantities = {}
+        for line in lines:
+            quantities[line.food_id] = quantities.get(line.food_id, 0) + line.quantity
+        reserve_stock(quantities)
+
+        totals = get_cart_totals(cart, delivery_method=delivery_method, tier=tier)
+
+        order = FoodOrder.objects.create(
+            user=user,
+            order_number=generate_order_number(),
+
+            # Контактная информация
+            customer_name=data.get('customer_name'),
+            customer_phone=data.get('customer_phone'),
+            customer_email=data.get('customer_email', ''),
+
+            # Адрес доставки
+            delivery_city=data.get('delivery_city'),
+            delivery_street=data.get('delivery_street'),
+            delivery_house=data.get('delivery_house'),
+            delivery_apartment=data.get('delivery_apartment', ''),
+            delivery_index=data.get('delivery_index', ''),
+
+            # Способ доставки и оплаты
+            delivery_method=totals.delivery_method,
+            payment_method=data.get('payment_method', 'card'),
+
+            # Финансовая информация - те же суммы, что показаны в корзине
+            subtotal=totals.subtotal,
+            discount=totals.discount,
+            delivery_cost=totals.delivery_cost,
+            assembly_cost=totals.assembly_cost,
+            total=totals.total,
+
+            # Подписка
+            subscription_applied=totals.tier,
+            subscription_savings=totals.discount,
+
+            # Дополнительно
+            promo_code=data.get('promo_code', ''),
+            notes=data.get('notes', ''),
+        )
+
+        FoodOrderItem.objects.bulk_create([
+            FoodOrderItem(
+                order=order,
+                food_id=line.food_id,
+                quantity=line.quantity,
+                price=line.price_at_addition
+            )
+            for line in lines
+        ])
+
+        # Очищаем корзину
+        cart.items.all().delete()
+        invalidate_cart_totals(cart)
+
+    return order
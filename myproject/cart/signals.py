@@ -0,0 +1,37 @@
+# cart/signals.py
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import CartItem, adjust_cart_counters
+
+
+@receiver(pre_save, sender=CartItem)
+def remember_cart_item_quantity(sender, instance, raw=False, using='default', **kwargs):
+    """Запомнить прежнее количество строки - для разницы в счётчиках корзины"""
+    instance._previous_quantity = None
+    if instance._state.adding or raw:
+        return
+    instance._previous_quantity = CartItem.objects.using(using).filter(pk=instance.pk).values_list(
+        'quantity', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=CartItem)
+def count_saved_cart_item(sender, instance, created, raw=False, using='default', **kwargs):
+    """Счётчики значка при добавлении строки и изменении количества через save()"""
+    if raw:
+        return
+    previous = getattr(instance, '_previous_quantity', None)
+    if created:
+        adjust_cart_counters(instance.cart_id, items=1, quantity=instance.quantity, using=using)
+    elif previous is not None and instance.quantity != previous:
+        adjust_cart_counters(instance.cart_id, quantity=instance.quantity - previous, using=using)
+
+
+@receiver(post_delete, sender=CartItem)
+def count_deleted_cart_item(sender, instance, using='default', **kwargs):
+    """
+    Счётчики значка при удалении строки - из представления, массовым delete()
+    или каскадом (удалён товар каталога)
+    """
+    adjust_cart_counters(instance.cart_id, items=-1, quantity=-instance.quantity, using=using)
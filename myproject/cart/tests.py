@@ -1,3 +1,376 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from food.models import FoodItem
+from food.testing import assert_endpoint_queries, assert_max_queries
+
+from .models import Cart, CartItem, FoodOrder
+from .pricing import CartTotals, get_cart_totals, invalidate_cart_totals, reprice_cart, reprice_user_cart
+from .services import StockConflict, checkout_cart
+
+
+ORDER_DATA = {
+    'customer_name': 'Покупатель',
+    'customer_phone': '+70000000000',
+    'delivery_city': 'Алексин',
+    'delivery_street': 'Заводская',
+    'delivery_house': '1',
+    'delivery_method': 'pickup',
+}
+
+
+def create_buyer(username, food, quantity=1):
+    """Пользователь с товаром в корзине"""
+    user = User.objects.create_user(username=username, password='pass')
+    cart = Cart.objects.create(user=user)
+    CartItem.objects.create(cart=cart, food=food, quantity=quantity, price_at_addition=food.base_price)
+    return user
+
+
+# Число запросов страниц корзины вместе с сессией и пользователем; не зависит от числа строк
+CART_QUERY_BUDGETS = {
+    'cart': 4,
+    'get_cart_data': 5,
+}
+
+
+def create_food(stock):
+    return FoodItem.objects.create(
+        name='Овёс плющеный', base_price=Decimal('100'), premium_price=Decimal('90'),
+        pro_price=Decimal('80'), stock=stock,
+    )
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Параллельные заказы одного товара с ограниченным остатком"""
+
+    buyers = 8
+    stock = 3
+
+    def test_no_oversell(self):
+        food = create_food(self.stock)
+        users = [create_buyer(f'buyer{number}', food) for number in range(self.buyers)]
+
+        results = {'ok': 0, 'conflict': 0}
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.buyers)
+
+        def buy(user):
+            try:
+                barrier.wait()
+                checkout_cart(user, ORDER_DATA)
+                outcome = 'ok'
+            except StockConflict:
+                outcome = 'conflict'
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                return
+            finally:
+                connection.close()
+            with lock:
+                results[outcome] += 1
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results, {'ok': self.stock, 'conflict': self.buyers - self.stock})
+        food.refresh_from_db()
+        self.assertEqual(food.stock, 0)
+        self.assertEqual(FoodOrder.objects.filter(items__food=food).count(), self.stock)
+        # У проигравших корзина не тронута: заказ можно оформить, когда товар появится
+        self.assertEqual(CartItem.objects.filter(food=food).count(), self.buyers - self.stock)
+
+
+class CheckoutViewTests(TestCase):
+    def test_stock_conflict_returns_409(self):
+        food = create_food(1)
+        user = create_buyer('buyer', food, quantity=2)
+        self.client.force_login(user)
+
+        response = self.client.post(reverse('checkout'), data=json.dumps(ORDER_DATA),
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(response.json()['success'])
+        food.refresh_from_db()
+        self.assertEqual(food.stock, 1)
+        self.assertFalse(FoodOrder.objects.exists())
+
+
+class CartCountersTests(TestCase):
+    """Счётчики значка Cart.item_count/total_quantity при любом способе изменения строк"""
+
+    def setUp(self):
+        self.food = create_food(10)
+        self.other = FoodItem.objects.create(name='Сено луговое', base_price=Decimal('50'), stock=10)
+        self.user = create_buyer('buyer', self.food, quantity=2)
+        self.cart = Cart.objects.get(user=self.user)
+        self.client.force_login(self.user)
+
+    def assert_counters(self, items, quantity):
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.item_count, self.cart.total_quantity), (items, quantity))
+
+    def post(self, url_name, data):
+        response = self.client.post(reverse(url_name), data=json.dumps(data), content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        return response
+
+    def test_views_keep_counters(self):
+        self.assert_counters(1, 2)
+        self.post('add_to_cart', {'food_id': str(self.food.id), 'quantity': 3})
+        self.assert_counters(1, 5)
+        self.post('add_to_cart', {'food_id': str(self.other.id), 'quantity': 1})
+        self.assert_counters(2, 6)
+
+        item = CartItem.objects.get(cart=self.cart, food=self.food)
+        self.post('update_cart_item', {'item_id': str(item.id), 'quantity': 4})
+        self.assert_counters(2, 5)
+        self.post('update_cart_item', {'item_id': str(item.id), 'quantity': 0})
+        self.assert_counters(1, 1)
+
+        other_item = CartItem.objects.get(cart=self.cart, food=self.other)
+        self.post('remove_from_cart', {'item_id': str(other_item.id)})
+        self.assert_counters(0, 0)
+
+    def test_save_outside_views_keeps_counters(self):
+        item = CartItem.objects.get(cart=self.cart)
+        item.quantity = 7
+        item.save()
+        self.assert_counters(1, 7)
+
+    def test_cascade_from_deleted_food(self):
+        CartItem.objects.create(cart=self.cart, food=self.other, quantity=3, price_at_addition=Decimal('50'))
+        self.assert_counters(2, 5)
+
+        self.other.delete()
+
+        self.assert_counters(1, 2)
+
+    def test_bulk_delete(self):
+        CartItem.objects.create(cart=self.cart, food=self.other, quantity=3, price_at_addition=Decimal('50'))
+        CartItem.objects.filter(cart=self.cart).delete()
+        self.assert_counters(0, 0)
+
+    def test_checkout_clears_counters(self):
+        checkout_cart(self.user, ORDER_DATA)
+        self.assert_counters(0, 0)
+
+
+class CartCountETagTests(TestCase):
+    """cart_count отвечает 304 на If-None-Match, пока корзина не изменилась"""
+
+    def setUp(self):
+        self.food = create_food(10)
+        self.user = create_buyer('buyer', self.food, quantity=2)
+        self.client.force_login(self.user)
+        self.url = reverse('cart_count')
+
+    def test_not_modified_until_cart_changes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'count': 1, 'quantity': 2, 'success': True})
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        CartItem.objects.get(cart__user=self.user).delete()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 0)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_is_per_user(self):
+        etag = self.client.get(self.url)['ETag']
+        other = create_buyer('other', self.food, quantity=2)
+        self.client.force_login(other)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+
+
+def line(price, quantity):
+    return SimpleNamespace(price_at_addition=Decimal(price), quantity=quantity)
+
+
+class CartTotalsTests(SimpleTestCase):
+    """Итоги корзины по тарифу и способу доставки"""
+
+    def test_free_tier(self):
+        totals = CartTotals([line('1000', 2), line('250', 2)])
+
+        self.assertEqual((totals.item_count, totals.total_quantity), (2, 4))
+        self.assertEqual(totals.subtotal, Decimal('2500'))
+        self.assertEqual(totals.discount, Decimal('0'))
+        self.assertEqual(totals.delivery_cost, Decimal('500'))
+        self.assertEqual(totals.assembly_cost, Decimal('125'))
+        self.assertEqual(totals.total, Decimal('3125'))
+
+    def test_subscription_discount_and_free_delivery(self):
+        premium = CartTotals([line('1000', 2), line('250', 2)], tier='premium', delivery_method='post')
+        self.assertEqual(premium.discount, Decimal('250'))
+        self.assertEqual(premium.discount_percentage, Decimal('10'))
+        self.assertEqual(premium.delivery_cost, Decimal('0'))
+        self.assertEqual(premium.total, Decimal('2375'))
+
+        # Меньше FREE_DELIVERY_FROM - доставка платная, сборка не меньше минимальной
+        pro = CartTotals([line('300', 1)], tier='pro', delivery_method='post')
+        self.assertEqual(pro.discount, Decimal('60'))
+        self.assertEqual(pro.delivery_cost, Decimal('300'))
+        self.assertEqual(pro.assembly_cost, Decimal('100'))
+        self.assertEqual(pro.total, Decimal('640'))
+
+    def test_unknown_delivery_method_is_courier(self):
+        totals = CartTotals([line('100', 1)], delivery_method='teleport')
+        self.assertEqual(totals.delivery_method, 'courier')
+        self.assertEqual(totals.as_dict()['delivery_cost'], 500.0)
+
+    def test_empty_cart(self):
+        totals = CartTotals([])
+        self.assertEqual((totals.subtotal, totals.item_count, totals.assembly_cost), (0, 0, Decimal('100')))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CartTotalsQueryTests(TestCase):
+    """Строки корзины загружаются одним запросом на объект корзины"""
+
+    def setUp(self):
+        self.food = create_food(10)
+        self.user = create_buyer('buyer', self.food, quantity=2)
+        self.cart = Cart.objects.get(user=self.user)
+        self.client.force_login(self.user)
+
+    def add_lines(self, count):
+        for index in range(count):
+            food = FoodItem.objects.create(name=f'Сено луговое {index}', base_price=Decimal('50'), stock=5)
+            CartItem.objects.create(cart=self.cart, food=food, quantity=1, price_at_addition=food.base_price)
+
+    def test_totals_reuse_loaded_lines(self):
+        self.add_lines(2)
+        cart = Cart.objects.get(pk=self.cart.pk)
+
+        with assert_max_queries(1):
+            totals = get_cart_totals(cart)
+            self.assertIs(get_cart_totals(cart), totals)
+            self.assertEqual(get_cart_totals(cart, delivery_method='pickup').delivery_cost, 0)
+            self.assertEqual((cart.total_items, cart.subtotal), (3, Decimal('300')))
+            self.assertEqual(cart.get_discount('pro'), Decimal('60'))
+            self.assertEqual([item.food.name for item in totals.lines][0], 'Овёс плющеный')
+
+        invalidate_cart_totals(cart)
+        with self.assertNumQueries(1):
+            get_cart_totals(cart)
+
+    def test_cart_pages_within_budget(self):
+        counts = {}
+        for url_name, budget in CART_QUERY_BUDGETS.items():
+            with self.subTest(url_name=url_name):
+                with CaptureQueriesContext(connection) as context:
+                    response = assert_endpoint_queries(self.client, reverse(url_name), max_queries=budget)
+                self.assertEqual(response.status_code, 200)
+                counts[url_name] = len(context.captured_queries)
+
+        self.add_lines(5)
+        for url_name, expected in counts.items():
+            with self.subTest(url_name=url_name):
+                with CaptureQueriesContext(connection) as context:
+                    self.client.get(reverse(url_name))
+                self.assertEqual(len(context.captured_queries), expected)
+
+
+class RepriceCartTests(TestCase):
+    """Пересчёт цен строк по тарифу: один bulk_update и отметка времени корзины"""
+
+    def setUp(self):
+        self.food = create_food(10)
+        self.user = create_buyer('buyer', self.food, quantity=2)
+        self.cart = Cart.objects.get(user=self.user)
+        self.stamp = timezone.now() - timedelta(days=1)
+
+    def add_lines(self, count):
+        for index in range(count):
+            food = FoodItem.objects.create(
+                name=f'Сено луговое {index}', base_price=Decimal('50'), premium_price=Decimal('45'),
+                pro_price=Decimal('40'), stock=5,
+            )
+            CartItem.objects.create(cart=self.cart, food=food, quantity=1, price_at_addition=food.base_price)
+        # Новые строки отмечают время изменения корзины - отодвигаем его в прошлое
+        Cart.objects.filter(pk=self.cart.pk).update(updated_at=self.stamp)
+
+    def reprice_queries(self, tier):
+        cart = Cart.objects.get(pk=self.cart.pk)
+        with CaptureQueriesContext(connection) as context:
+            changed = reprice_cart(cart, tier=tier)
+        return cart, changed, len(context.captured_queries)
+
+    def test_changed_lines_saved_and_cart_stamped(self):
+        self.add_lines(1)
+        cart = Cart.objects.get(pk=self.cart.pk)
+        self.assertEqual(get_cart_totals(cart).subtotal, Decimal('250'))
+
+        changed = reprice_cart(cart, tier='pro')
+
+        self.assertEqual(len(changed), 2)
+        # Итоги сброшены, строки в памяти уже с новыми ценами
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_totals(cart, tier='pro').subtotal, Decimal('200'))
+        self.assertEqual(
+            sorted(CartItem.objects.filter(cart=self.cart).values_list('price_at_addition', flat=True)),
+            [Decimal('40'), Decimal('80')],
+        )
+        cart.refresh_from_db()
+        self.assertGreater(cart.updated_at, self.stamp)
+
+    def test_unchanged_prices_write_nothing(self):
+        self.add_lines(1)
+        cart, changed, queries = self.reprice_queries('')
+
+        self.assertEqual((changed, queries), ([], 1))
+        cart.refresh_from_db()
+        self.assertEqual(cart.updated_at, self.stamp)
+
+    def test_queries_do_not_grow_with_lines(self):
+        self.add_lines(2)
+        _, changed, expected = self.reprice_queries('premium')
+        self.assertEqual(len(changed), 3)
+
+        self.add_lines(6)
+        cart = Cart.objects.get(pk=self.cart.pk)
+        with assert_max_queries(expected, label='reprice_cart'):
+            changed = reprice_cart(cart, tier='pro')
+        self.assertEqual(len(changed), 9)
+
+    def test_subscription_change_reprices_cart_data(self):
+        profile = self.user.profile
+        profile.subscription = 'premium'
+        profile.subscription_active = True
+        profile.save()
+        self.client.force_login(self.user)
+
+        data = self.client.get(reverse('get_cart_data')).json()
+
+        self.assertEqual(data['items'][0]['price'], 90.0)
+        self.assertEqual(data['subtotal'], 180.0)
+        self.assertTrue(data['is_premium'])
+        self.assertEqual(reprice_user_cart(self.user), [])
+        self.assertEqual(reprice_user_cart(User.objects.create_user('guest', password='pass')), [])
@@ -2,9 +2,15 @@ from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.db import transaction
+from django.db.models import F
 import json
 from .models import Cart, CartItem, FoodOrder, FoodOrderItem
+from .pricing import cart_lines, get_cart_totals, reprice_cart
+from .services import CheckoutError, StockConflict, checkout_cart
 from food.models import FoodItem
+from user_profile.pricing import invalidate_pricing_context
 import uuid
 from datetime import datetime
 from decimal import Decimal
@@ -12,57 +18,28 @@ from decimal import Decimal
 @login_required
 def cart_view(request):
     """Страница корзины"""
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.all()
-    
-    assembly_cost = cart.get_assembly_cost()
-    
-    try:
-        profile = request.user.profile
-        subscription = profile.subscription
-        is_premium = profile.is_premium()
-        
-        if subscription == 'pro' and is_premium:
-            discount_percentage = Decimal('20')
-        elif subscription == 'premium' and is_premium:
-            discount_percentage = Decimal('10')
-        else:
-            discount_percentage = Decimal('0')
-            
-        # Правильно: используем Decimal
-        discount = cart.subtotal * (discount_percentage / Decimal('100'))
-        delivery_cost = cart.get_delivery_cost('courier', subscription if is_premium else None)
-        
-    except:
-        discount_percentage = Decimal('0')
-        discount = Decimal('0')
-        delivery_cost = cart.get_delivery_cost('courier')
-    
-    subtotal = cart.subtotal
-    total_amount = subtotal - discount + delivery_cost + assembly_cost
+    # Корзина уже загружена вместе с пользователем в контексте цен
+    cart = request.pricing.cart
+    if cart is None:
+        cart, created = Cart.objects.get_or_create(user=request.user)
+    totals = get_cart_totals(cart, request.user)
     
     # Конвертируем Decimal в float для шаблона (если нужно)
     context = {
         'cart': cart,
-        'cart_items': cart_items,
-        'subtotal': float(subtotal),
-        'discount': float(discount),
-        'discount_percentage': float(discount_percentage),
-        'delivery_cost': float(delivery_cost),
-        'assembly_cost': float(assembly_cost),
-        'total_amount': float(total_amount),
+        'cart_items': totals.lines,
+        'totals': totals,
+        'total_items': totals.item_count,
+        'subtotal': float(totals.subtotal),
+        'discount': float(totals.discount),
+        'discount_percentage': float(totals.discount_percentage),
+        'delivery_cost': float(totals.delivery_cost),
+        'assembly_cost': float(totals.assembly_cost),
+        'total_amount': float(totals.total),
         'today': datetime.now(),
     }
     
-    try:
-        profile = request.user.profile
-        context['user_profile'] = {
-            'subscription': profile.subscription,
-            'subscription_display': profile.get_subscription_display_name(),
-            'is_premium': profile.is_premium()
-        }
-    except:
-        context['user_profile'] = None
+    context['user_profile'] = request.pricing.as_dict()
     
     return render(request, 'cart/cart.html', context)
    
@@ -82,25 +59,29 @@ def add_to_cart(request):
             # Получаем цену для пользователя
             price = food.get_price_for_user(request.user)
             
-            # Проверяем, есть ли уже такой товар в корзине
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                food=food,
-                defaults={'quantity': quantity, 'price_at_addition': price}
-            )
-            
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.price_at_addition = price
-                cart_item.save()
-            
-            # Обновляем время изменения корзины
-            cart.save()
+            with transaction.atomic():
+                # Проверяем, есть ли уже такой товар в корзине
+                cart_item, created = CartItem.objects.get_or_create(
+                    cart=cart,
+                    food=food,
+                    defaults={'quantity': quantity, 'price_at_addition': price}
+                )
+                
+                if not created:
+                    # Увеличиваем количество в базе - параллельные добавления не теряются
+                    CartItem.objects.filter(pk=cart_item.pk).update(
+                        quantity=F('quantity') + quantity,
+                        price_at_addition=price
+                    )
+                    cart_item.refresh_from_db(fields=['quantity', 'price_at_addition'])
+                    # update() минует сигналы строки - счётчики значка меняем сами
+                    cart.adjust_counters(quantity=quantity)
+            invalidate_pricing_context(request.user)
             
             return JsonResponse({
                 'success': True,
                 'message': 'Товар добавлен в корзину',
-                'cart_total': cart.total_items,
+                'cart_total': get_cart_totals(cart).item_count,
                 'item_total': cart_item.total_price,
             })
             
@@ -122,23 +103,28 @@ def update_cart_item(request):
             item_id = data.get('item_id')
             quantity = int(data.get('quantity', 1))
             
-            cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-            
-            if quantity <= 0:
-                cart_item.delete()
-                message = 'Товар удален из корзины'
-            else:
-                cart_item.quantity = quantity
-                cart_item.save()
-                message = 'Количество обновлено'
+            with transaction.atomic():
+                cart_item = get_object_or_404(
+                    CartItem.objects.select_for_update(), id=item_id, cart__user=request.user
+                )
+                
+                # Счётчики значка корзины обновляют сигналы строки (cart/signals.py)
+                if quantity <= 0:
+                    cart_item.delete()
+                    message = 'Товар удален из корзины'
+                else:
+                    cart_item.quantity = quantity
+                    cart_item.save(update_fields=['quantity'])
+                    message = 'Количество обновлено'
+            invalidate_pricing_context(request.user)
             
-            cart = cart_item.cart
+            totals = get_cart_totals(cart_item.cart, request.user)
             
             return JsonResponse({
                 'success': True,
                 'message': message,
-                'cart_total': cart.total_items,
-                'subtotal': float(cart.subtotal),
+                'cart_total': totals.item_count,
+                'subtotal': float(totals.subtotal),
                 'item_total': float(cart_item.total_price),
             })
             
@@ -159,15 +145,20 @@ def remove_from_cart(request):
             data = json.loads(request.body)
             item_id = data.get('item_id')
             
-            cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-            cart = cart_item.cart
-            cart_item.delete()
+            with transaction.atomic():
+                cart_item = get_object_or_404(
+                    CartItem.objects.select_for_update(), id=item_id, cart__user=request.user
+                )
+                cart = cart_item.cart
+                cart_item.delete()
+            invalidate_pricing_context(request.user)
+            totals = get_cart_totals(cart, request.user)
             
             return JsonResponse({
                 'success': True,
                 'message': 'Товар удален из корзины',
-                'cart_total': cart.total_items,
-                'subtotal': float(cart.subtotal),
+                'cart_total': totals.item_count,
+                'subtotal': float(totals.subtotal),
             })
             
         except Exception as e:
@@ -187,62 +178,34 @@ def get_cart_data(request):
         cart = Cart.objects.create(user=request.user)
         cart.save()
     
+    # Актуальные цены по тарифу пользователя: один bulk_update для изменившихся строк
+    tier = request.pricing.tier
+    reprice_cart(cart, tier=tier)
+    
     items_data = []
-    for item in cart.items.all():
-        current_price = item.food.get_price_for_user(request.user)
-        
-        if item.price_at_addition != current_price:
-            item.price_at_addition = current_price
-            item.save()
-        
+    for item in cart_lines(cart):
         items_data.append({
             'id': str(item.id),
             'food_id': str(item.food.id),
             'name': item.food.name,
             'quantity': item.quantity,
-            'price': float(current_price),
+            'price': float(item.price_at_addition),
             'total': float(item.total_price),
             'unit': item.food.unit,
             'image_url': item.food.image.url if item.food.image else '/static/images/food_default.jpg',
         })
     
-    try:
-        profile = request.user.profile
-        subscription = profile.subscription
-        is_premium = profile.is_premium()
-        
-        if subscription == 'pro' and is_premium:
-            discount_percentage = Decimal('20')
-        elif subscription == 'premium' and is_premium:
-            discount_percentage = Decimal('10')
-        else:
-            discount_percentage = Decimal('0')
-    except:
-        discount_percentage = Decimal('0')
-        subscription = 'free'
-        is_premium = False
-    
-    subtotal = float(cart.subtotal)
-    discount = float(cart.subtotal * (discount_percentage / Decimal('100')))
+    subscription = request.pricing.subscription
     
-    delivery_method = 'courier'
-    delivery_cost = float(cart.get_delivery_cost(delivery_method, subscription if is_premium else None))
-    assembly_cost = float(cart.get_assembly_cost())
-    
-    total = subtotal - discount + delivery_cost + assembly_cost
+    # Цены строк уже обновлены в памяти - итоги считаются по тем же объектам
+    totals = get_cart_totals(cart, tier=tier)
     
     return JsonResponse({
         'success': True,
         'items': items_data,
-        'subtotal': subtotal,
-        'discount': discount,
-        'discount_percentage': float(discount_percentage),
-        'delivery_cost': delivery_cost,
-        'assembly_cost': assembly_cost,
-        'total': total,
-        'total_items': cart.total_items,
+        **totals.as_dict(),
         'user_subscription': subscription,
-        'is_premium': is_premium,
+        'is_premium': bool(totals.tier),
     })
 @csrf_exempt
 @login_required
@@ -251,104 +214,28 @@ def checkout(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            
-            # Получаем корзину пользователя
-            cart = get_object_or_404(Cart, user=request.user)
-            if cart.total_items == 0:
-                return JsonResponse({
-                    'success': False,
-                    'message': 'Корзина пуста'
-                })
-            
-            # Создаем заказ
-            order_number = f"AKZ-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
-            
-            # Рассчитываем суммы
-            subtotal = cart.subtotal
-            
-            try:
-                profile = request.user.profile
-                if profile.subscription == 'pro':
-                    discount = subtotal * 0.20
-                    subscription_applied = 'pro'
-                    subscription_savings = discount
-                elif profile.subscription == 'premium':
-                    discount = subtotal * 0.10
-                    subscription_applied = 'premium'
-                    subscription_savings = discount
-                else:
-                    discount = 0
-                    subscription_applied = ''
-                    subscription_savings = 0
-            except:
-                discount = 0
-                subscription_applied = ''
-                subscription_savings = 0
-            
-            delivery_method = data.get('delivery_method', 'courier')
-            delivery_cost = cart.get_delivery_cost(delivery_method, subscription_applied)
-            assembly_cost = cart.get_assembly_cost()
-            total = subtotal - discount + delivery_cost + assembly_cost
-            
-            # Создаем заказ кормов
-            order = FoodOrder.objects.create(
-                user=request.user,
-                order_number=order_number,
-                
-                # Контактная информация
-                customer_name=data.get('customer_name'),
-                customer_phone=data.get('customer_phone'),
-                customer_email=data.get('customer_email', ''),
-                
-                # Адрес доставки
-                delivery_city=data.get('delivery_city'),
-                delivery_street=data.get('delivery_street'),
-                delivery_house=data.get('delivery_house'),
-                delivery_apartment=data.get('delivery_apartment', ''),
-                delivery_index=data.get('delivery_index', ''),
-                
-                # Способ доставки и оплаты
-                delivery_method=delivery_method,
-                payment_method=data.get('payment_method', 'card'),
-                
-                # Финансовая информация
-                subtotal=subtotal,
-                discount=discount,
-                delivery_cost=delivery_cost,
-                assembly_cost=assembly_cost,
-                total=total,
-                
-                # Подписка
-                subscription_applied=subscription_applied,
-                subscription_savings=subscription_savings,
-                
-                # Дополнительно
-                promo_code=data.get('promo_code', ''),
-                notes=data.get('notes', ''),
-            )
-            
-            # Добавляем товары в заказ кормов
-            for cart_item in cart.items.all():
-                FoodOrderItem.objects.create(
-                    order=order,
-                    food=cart_item.food,
-                    quantity=cart_item.quantity,
-                    price=cart_item.price_at_addition
-                )
-            
-            # Очищаем корзину
-            cart.items.all().delete()
-            cart.save()
+            order = checkout_cart(request.user, data)
             
             return JsonResponse({
                 'success': True,
                 'message': 'Заказ успешно оформлен',
-                'order_number': order_number,
+                'order_number': order.order_number,
                 'order_id': str(order.id),
-                'total': float(total),
+                'total': float(order.total),
                 'redirect_url': f'/cart/order-success/{order.id}/'
             })
             
+        except StockConflict as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e),
+                'conflicts': e.shortages
+            }, status=e.status)
+        except CheckoutError as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            })
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -424,14 +311,28 @@ def apply_promo_code(request):
     
     return JsonResponse({'success': False, 'message': 'Неверный метод запроса'})
 
+def _cart_counters(request):
+    """(позиций, единиц) из счётчиков корзины в контексте цен запроса"""
+    pricing = request.pricing
+    return pricing.cart_count, pricing.cart_quantity
+
+
+def _cart_count_etag(request):
+    count, quantity = _cart_counters(request)
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    return f'cart-{user_id}-{count}-{quantity}'
+
+
+@condition(etag_func=_cart_count_etag)
 def cart_count(request):
-    """Получить количество товаров в корзине"""
-    count = 0
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            count = cart.total_items  # Используем свойство total_items
-        except Cart.DoesNotExist:
-            pass
-    
-    return JsonResponse({'count': count, 'success': True})
\ No newline at end of file
+    """Получить количество товаров в корзине (значок в шапке).
+
+    Значение берётся из счётчиков Cart без обхода строк; при неизменной корзине
+    клиент с If-None-Match получает пустой ответ 304.
+    """
+    count, quantity = _cart_counters(request)
+    response = JsonResponse({'count': count, 'quantity': quantity, 'success': True})
+    # Ответ персональный: прокси не кэшируют, браузер каждый раз сверяет ETag
+    response['Cache-Control'] = 'private, no-cache'
+    response['Vary'] = 'Cookie'
+    return response
\ No newline at end of file
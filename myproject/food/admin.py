@@ -1,7 +1,7 @@
 # backend/food/admin.py
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import FoodCategory, FoodItem, FoodReview, Recommendation, ConsultationHistory, AIChatSession, AIChatMessage
+from .models import FoodCategory, FoodItem, FoodReview, Recommendation, ConsultationHistory, AIChatSession, AIChatMessage, AIConsultationJob
 
 # Простейшая админка для категорий кормов
 class FoodCategoryAdmin(admin.ModelAdmin):
@@ -91,6 +91,12 @@ class AIChatMessageAdmin(admin.ModelAdmin):
     list_filter = ['role', 'created_at']
     search_fields = ['content']
 
+# Простая админка для очереди консультаций ИИ
+class AIConsultationJobAdmin(admin.ModelAdmin):
+    list_display = ['user', 'status', 'attempts', 'next_attempt_at', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__username', 'error']
+
 # Регистрация всех моделей с простыми админками
 admin.site.register(FoodCategory, FoodCategoryAdmin)
 admin.site.register(FoodItem, FoodItemAdmin)
@@ -98,4 +104,5 @@ admin.site.register(FoodReview, FoodReviewAdmin)
 admin.site.register(Recommendation, RecommendationAdmin)
 admin.site.register(ConsultationHistory, ConsultationHistoryAdmin)
 admin.site.register(AIChatSession, AIChatSessionAdmin)
-admin.site.register(AIChatMessage, AIChatMessageAdmin)
\ No newline at end of file
+admin.site.register(AIChatMessage, AIChatMessageAdmin)
+admin.site.register(AIConsultationJob, AIConsultationJobAdmin)
\ No newline at end of file
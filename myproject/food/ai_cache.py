@@ -0,0 +1,264 @@
+# food/ai_cache.py - кэш ответов ИИ для рекомендаций по кормлению
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# Возрастные группы с похожими потребностями в кормлении: (минимальный возраст, метка)
+AGE_BANDS = [
+    (0, 'foal'),      # до 2 лет - жеребята и молодняк
+    (3, 'young'),     # 3-4 года
+    (5, 'adult'),     # 5-14 лет
+    (15, 'senior'),   # 15-19 лет
+    (20, 'geriatric'),
+]
+
+WEIGHT_BUCKET_KG = 50
+BUDGET_BUCKET_RUB = 1000
+
+
+def _age_band(age):
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return 'unknown'
+    band = AGE_BANDS[0][1]
+    for min_age, label in AGE_BANDS:
+        if age >= min_age:
+            band = label
+    return band
+
+
+def _weight_bucket(weight):
+    try:
+        weight = int(float(weight))
+    except (TypeError, ValueError):
+        return 'unknown'
+    return str(weight // WEIGHT_BUCKET_KG * WEIGHT_BUCKET_KG)
+
+
+def _budget_bucket(budget):
+    """Бюджет приходит либо кодом из BUDGET_CHOICES, либо суммой в рублях"""
+    try:
+        return str(int(float(budget)) // BUDGET_BUCKET_RUB * BUDGET_BUCKET_RUB)
+    except (TypeError, ValueError):
+        return str(budget or '').strip().lower()
+
+
+def normalize_horse_params(breed, age, weight, purpose, budget, activity_level='medium'):
+    """Нормализованный кортеж параметров лошади: вес по корзинам, возраст по группам"""
+    return (
+        str(breed or 'other').strip().lower(),
+        _age_band(age),
+        _weight_bucket(weight),
+        str(purpose or '').strip().lower(),
+        _budget_bucket(budget),
+        str(activity_level or 'medium').strip().lower(),
+    )
+
+
+def make_cache_key(params):
+    return 'ai-recommendation:v1:' + '|'.join(params)
+
+
+class MemoryBackend:
+    """Кэш внутри процесса с TTL и вытеснением давно неиспользуемых записей (LRU)"""
+
+    def __init__(self, max_entries=500, **options):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (time.time() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheBackend:
+    """Хранение в одном из кэшей Django (CACHES); вытеснение выполняет сам бэкенд кэша"""
+
+    def __init__(self, cache_alias='default', **options):
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+
+    def clear(self):
+        # Не трогаем чужие ключи общего кэша - записи истекут по TTL
+        pass
+
+
+class FileBackend:
+    """Файловый кэш: один JSON на запись, LRU по времени последнего обращения (mtime)"""
+
+    def __init__(self, path=None, max_entries=500, **options):
+        self.path = str(path or os.path.join(settings.BASE_DIR, 'ai_cache'))
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key):
+        filename = self._file(key)
+        try:
+            with open(filename, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('expires_at', 0) < time.time():
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+        return entry.get('value')
+
+    def set(self, key, value, timeout):
+        os.makedirs(self.path, exist_ok=True)
+        filename = self._file(key)
+        tmp_name = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_name, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'expires_at': time.time() + timeout, 'value': value}, f, ensure_ascii=False)
+        os.replace(tmp_name, filename)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            try:
+                files = [
+                    os.path.join(self.path, name)
+                    for name in os.listdir(self.path)
+                    if name.endswith('.json')
+                ]
+            except OSError:
+                return
+            if len(files) <= self.max_entries:
+                return
+            files.sort(key=lambda name: os.path.getmtime(name) if os.path.exists(name) else 0)
+            for name in files[:len(files) - self.max_entries]:
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+
+    def clear(self):
+        try:
+            for name in os.listdir(self.path):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.path, name))
+        except OSError:
+            pass
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'django': DjangoCacheBackend,
+    'file': FileBackend,
+}
+
+
+class RecommendationCache:
+    """Кэш рекомендаций ИИ с ключом по нормализованным параметрам лошади и счётчиками попаданий"""
+
+    def __init__(self, backend, timeout=60 * 60 * 24):
+        self.backend = backend
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, **horse):
+        key = make_cache_key(normalize_horse_params(**horse))
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"⚠️ Ошибка чтения кэша рекомендаций: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, value, **horse):
+        key = make_cache_key(normalize_horse_params(**horse))
+        try:
+            self.backend.set(key, value, self.timeout)
+        except Exception as e:
+            print(f"⚠️ Ошибка записи в кэш рекомендаций: {e}")
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_recommendation_cache():
+    """Кэш рекомендаций процесса по настройке AI_RECOMMENDATION_CACHE; None, если выключен"""
+    global _cache
+    config = getattr(settings, 'AI_RECOMMENDATION_CACHE', {})
+    if not config.get('ENABLED', True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend_class = BACKENDS[config.get('BACKEND', 'memory')]
+                backend = backend_class(
+                    max_entries=config.get('MAX_ENTRIES', 500),
+                    cache_alias=config.get('CACHE_ALIAS', 'default'),
+                    path=config.get('PATH'),
+                )
+                _cache = RecommendationCache(backend, timeout=config.get('TIMEOUT', 60 * 60 * 24))
+    return _cache
@@ -0,0 +1,120 @@
+# food/ai_client.py - общий HTTP-клиент для IO Intelligence API
+import threading
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class AIClientBusy(requests.exceptions.Timeout):
+    """Все слоты для запросов к ИИ заняты дольше допустимого времени ожидания"""
+
+
+class AIHttpClient:
+    """Один пул keep-alive соединений на процесс и ограничение числа одновременных запросов.
+
+    Все вызовы (gunicorn gthread, management-команды) идут через общую requests.Session.
+    """
+
+    def __init__(self, pool_size=10, max_concurrent=8, timeout=60, connect_timeout=10, acquire_timeout=30):
+        self.pool_size = pool_size
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.acquire_timeout = acquire_timeout
+
+        self._session = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    @property
+    def session(self):
+        """Ленивая инициализация общей сессии"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=self.pool_size,
+                        # Повторяем только идемпотентные запросы, POST к модели не дублируем
+                        max_retries=Retry(
+                            total=2,
+                            backoff_factor=0.5,
+                            status_forcelist=[502, 503, 504],
+                            allowed_methods=['GET'],
+                        ),
+                    )
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """Синхронный запрос через общий пул"""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise AIClientBusy('Превышено число одновременных запросов к IO Intelligence')
+        try:
+            return self.session.request(
+                method,
+                url,
+                timeout=(self.connect_timeout, timeout or self.timeout),
+                **kwargs
+            )
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def stream(self, method, url, timeout=None, **kwargs):
+        """Потоковый запрос: слот и соединение заняты, пока читается тело ответа"""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise AIClientBusy('Превышено число одновременных запросов к IO Intelligence')
+        try:
+            response = self.session.request(
+                method,
+                url,
+                stream=True,
+                timeout=(self.connect_timeout, timeout or self.timeout),
+                **kwargs
+            )
+            try:
+                yield response
+            finally:
+                response.close()
+        finally:
+            self._slots.release()
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def close(self):
+        """Закрыть общую сессию"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ai_client():
+    """Общий для процесса клиент, настроенный из settings"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AIHttpClient(
+                    pool_size=getattr(settings, 'AI_HTTP_POOL_SIZE', 10),
+                    max_concurrent=getattr(settings, 'AI_MAX_CONCURRENT_REQUESTS', 8),
+                    timeout=getattr(settings, 'AI_REQUEST_TIMEOUT', 60),
+                    connect_timeout=getattr(settings, 'AI_CONNECT_TIMEOUT', 10),
+                    acquire_timeout=getattr(settings, 'AI_ACQUIRE_TIMEOUT', 30),
+                )
+    return _client
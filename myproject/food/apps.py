@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class FoodConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'food'
+
+    def ready(self):
+        # Импортируем сигналы
+        try:
+            import food.signals
+        except ImportError:
+            pass
@@ -0,0 +1,58 @@
+# food/cache.py - версионированный кэш каталога
+"""
+Все ключи каталога содержат номер поколения. Сигналы FoodItem, FoodCategory и FoodReview
+увеличивают поколение, после чего старые записи просто перестают читаться и истекают по TTL.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+GENERATION_KEY = 'catalog:generation'
+
+
+def _new_generation():
+    # Если счётчик вытеснен из кэша, новое значение не должно совпасть со старыми ключами
+    return int(time.time() * 1000)
+
+
+def get_catalog_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _new_generation(), None)
+        generation = cache.get(GENERATION_KEY) or 0
+    return generation
+
+
+def bump_catalog_generation():
+    """Сбросить кэш каталога; возвращает новое поколение"""
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        generation = _new_generation()
+        cache.set(GENERATION_KEY, generation, None)
+        return generation
+
+
+def catalog_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+
+
+def catalog_key(name, *parts):
+    """Ключ записи каталога для текущего поколения"""
+    suffix = ''
+    if parts:
+        suffix = ':' + hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'catalog:{get_catalog_generation()}:{name}{suffix}'
+
+
+def cached_catalog(name, builder, *parts):
+    """Значение из кэша каталога или builder(), сохранённое до следующего изменения каталога"""
+    key = catalog_key(name, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, catalog_timeout())
+    return value
@@ -0,0 +1,151 @@
+# food/chat_context.py - история чата для запроса к ИИ
+"""
+Контекст модели собирается под бюджет токенов: от нового вопроса назад
+добавляются последние сообщения, пока их оценка (estimate_tokens - локальное
+приближение токенизатора, без обращения к API) укладывается в
+AI_CHAT_CONTEXT_TOKENS. Сообщения читаются одним запросом с ORDER BY
+created_at DESC LIMIT n по индексу (session, -created_at), так что длинная
+сессия стоит столько же, сколько короткая.
+
+Сообщения, выпавшие из контекста, попадают в краткое содержание сессии
+(AIChatSession.summary): по первой фразе каждого, не длиннее
+AI_CHAT_SUMMARY_TOKENS. Оно дописывается только при выпадении новых сообщений
+и идёт в начало контекста системным сообщением.
+
+Вопрос пользователя и ответ ИИ сохраняются вместе одним bulk_create после ответа.
+"""
+import math
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AIChatMessage, AIChatSession
+
+
+# Слова и отдельные знаки; в BPE-токенизаторах латиница даёт ~4 символа на токен,
+# кириллица и прочие алфавиты - ~3
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+ASCII_CHARS_PER_TOKEN = 4
+OTHER_CHARS_PER_TOKEN = 3
+# Служебные токены роли и разделителей на каждое сообщение
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PREFIX = 'Краткое содержание предыдущей части диалога:\n'
+SUMMARY_LINE_CHARS = 160
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+ROLE_NAMES = dict(AIChatMessage.ROLE_CHOICES)
+
+
+def estimate_tokens(text):
+    """Детерминированная оценка числа токенов текста"""
+    tokens = 0
+    for piece in TOKEN_PATTERN.findall(text or ''):
+        chars_per_token = ASCII_CHARS_PER_TOKEN if piece.isascii() else OTHER_CHARS_PER_TOKEN
+        tokens += max(1, math.ceil(len(piece) / chars_per_token))
+    return tokens
+
+
+def message_tokens(message):
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message['content'])
+
+
+def recent_messages(session, limit):
+    """Последние limit сообщений сессии, новые первыми: [(role, content, created_at), ...]"""
+    return list(
+        AIChatMessage.objects.filter(session=session).order_by('-created_at').values_list(
+            'role', 'content', 'created_at'
+        )[:limit]
+    )
+
+
+def summary_line(role, content):
+    """Первая фраза сообщения без разметки, не длиннее SUMMARY_LINE_CHARS"""
+    text = ' '.join(re.sub(r'[*#_`>]+', ' ', content).split())
+    sentence = SENTENCE_END.split(text, maxsplit=1)[0]
+    if len(sentence) > SUMMARY_LINE_CHARS:
+        sentence = sentence[:SUMMARY_LINE_CHARS - 1].rstrip() + '…'
+    return f'{ROLE_NAMES.get(role, role)}: {sentence}'
+
+
+def refresh_summary(session, dropped):
+    """Дописать в краткое содержание сессии выпавшие сообщения (новые первыми), которых в нём ещё нет"""
+    fresh = [row for row in dropped if session.summary_until is None or row[2] > session.summary_until]
+    if not fresh:
+        return session.summary
+
+    lines = session.summary.splitlines() if session.summary else []
+    lines.extend(summary_line(role, content) for role, content, _ in reversed(fresh))
+
+    # Старые строки уходят первыми, пока содержание не уложится в свой бюджет
+    limit = getattr(settings, 'AI_CHAT_SUMMARY_TOKENS', 300)
+    while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > limit:
+        lines.pop(0)
+
+    session.summary = '\n'.join(lines)
+    session.summary_until = fresh[0][2]
+    AIChatSession.objects.filter(pk=session.pk).update(
+        summary=session.summary, summary_until=session.summary_until
+    )
+    return session.summary
+
+
+def build_chat_context(session, message, budget=None):
+    """Сообщения для модели под бюджет токенов, последним идёт новый вопрос (он ещё не сохранён)"""
+    budget = budget or getattr(settings, 'AI_CHAT_CONTEXT_TOKENS', 1500)
+    max_messages = getattr(settings, 'AI_CHAT_HISTORY_MESSAGES', 20)
+    use_summary = getattr(settings, 'AI_CHAT_SUMMARY_ENABLED', True)
+
+    current = {'role': 'user', 'content': message}
+    remaining = budget - message_tokens(current)
+    reserved = 0
+    if use_summary and session.summary:
+        # Место под уже накопленное содержание оставляем заранее
+        reserved = min(
+            message_tokens({'content': SUMMARY_PREFIX + session.summary}),
+            getattr(settings, 'AI_CHAT_SUMMARY_TOKENS', 300) + MESSAGE_OVERHEAD_TOKENS
+        )
+        remaining -= reserved
+
+    # На ход добавляется пара сообщений - читаем с запасом, чтобы каждое выпавшее
+    # из контекста сообщение хоть раз попало в выборку и в краткое содержание
+    window = recent_messages(session, max_messages + 2)
+    packed = []
+    for role, content, _ in window:
+        if len(packed) >= max_messages - 1:
+            break
+        cost = message_tokens({'content': content})
+        if cost > remaining:
+            break
+        packed.append({'role': role, 'content': content})
+        remaining -= cost
+
+    context = list(reversed(packed))
+    context.append(current)
+
+    if use_summary:
+        summary = refresh_summary(session, window[len(packed):])
+        # Содержание могло вырасти после резервирования - в контекст идут его последние строки,
+        # которые укладываются в резерв и остаток бюджета (в сессии оно хранится целиком)
+        lines = summary.splitlines() if summary else []
+        while lines and message_tokens({'content': SUMMARY_PREFIX + '\n'.join(lines)}) > reserved + remaining:
+            lines.pop(0)
+        if lines:
+            context.insert(0, {'role': 'system', 'content': SUMMARY_PREFIX + '\n'.join(lines)})
+    return context
+
+
+def save_chat_exchange(session, user_content, assistant_content=None):
+    """Сохранить вопрос и ответ одним INSERT и обновить время сессии одним UPDATE.
+
+    Без ответа (ошибка ИИ) сохраняется только вопрос. Возвращает созданные сообщения.
+    """
+    messages = [AIChatMessage(session=session, role='user', content=user_content)]
+    if assistant_content:
+        messages.append(AIChatMessage(session=session, role='assistant', content=assistant_content))
+
+    with transaction.atomic():
+        created = AIChatMessage.objects.bulk_create(messages)
+        AIChatSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+    return created
@@ -0,0 +1,210 @@
+# food/jobs.py - фоновая обработка консультаций ИИ
+import traceback
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (AIChatMessage, AIChatSession, AIConsultationJob,
+                     ConsultationHistory, FoodItem, Recommendation)
+from .services import get_ai_service
+
+
+def enqueue_consultation(user, breed, age, weight, purpose, budget, activity_level='medium'):
+    """Поставить консультацию в очередь; при AI_JOBS_INLINE выполнить сразу (локальная разработка)"""
+    job = AIConsultationJob.objects.create(
+        user=user,
+        payload={
+            'breed': breed,
+            'age': age,
+            'weight': weight,
+            'purpose': purpose,
+            'budget': budget,
+            'activity_level': activity_level,
+        }
+    )
+
+    if getattr(settings, 'AI_JOBS_INLINE', False):
+        claimed = claim_job(job.id)
+        if claimed:
+            run_consultation(claimed)
+            job.refresh_from_db()
+
+    return job
+
+
+def claim_job(job_id):
+    """Забрать задачу в работу; условный UPDATE не даёт двум воркерам взять одну задачу"""
+    claimed = AIConsultationJob.objects.filter(id=job_id, status='pending').update(
+        status='running',
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1
+    )
+    if not claimed:
+        return None
+    return AIConsultationJob.objects.select_related('user').get(id=job_id)
+
+
+def claim_next_job():
+    """Следующая задача, время попытки которой наступило (FIFO), или None"""
+    candidates = AIConsultationJob.objects.filter(
+        status='pending', next_attempt_at__lte=timezone.now()
+    ).order_by('next_attempt_at').values_list('id', flat=True)[:5]
+
+    for job_id in candidates:
+        job = claim_job(job_id)
+        if job:
+            return job
+    return None
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: база * 2^(попытка-1), не больше максимума"""
+    base = getattr(settings, 'AI_JOBS_RETRY_BASE_SECONDS', 30)
+    limit = getattr(settings, 'AI_JOBS_RETRY_MAX_SECONDS', 900)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), limit))
+
+
+def requeue_stale_jobs():
+    """Вернуть в очередь задачи, зависшие в работе (например, воркер был остановлен)"""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'AI_JOBS_STALE_SECONDS', 600))
+    max_attempts = getattr(settings, 'AI_JOBS_MAX_ATTEMPTS', 3)
+    stale = AIConsultationJob.objects.filter(status='running', started_at__lt=cutoff)
+
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status='failed',
+        error='Превышено время обработки',
+        finished_at=timezone.now()
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(status='pending', next_attempt_at=timezone.now())
+    return requeued, failed
+
+
+def run_consultation(job):
+    """Выполнить консультацию: запрос к ИИ, подбор товаров и сохранение результатов"""
+    data = job.payload
+    breed = data['breed']
+    age = data['age']
+    weight = data['weight']
+    purpose = data['purpose']
+    budget = data['budget']
+    activity_level = data.get('activity_level', 'medium')
+
+    try:
+        ai_service = get_ai_service()
+
+        # Долгий запрос к ИИ выполняется вне транзакции
+        ai_response = ai_service.get_food_recommendation(
+            breed=breed,
+            age=age,
+            weight=weight,
+            purpose=purpose,
+            budget=budget,
+            activity_level=activity_level
+        )
+
+        if not ai_response:
+            raise ValueError('Не удалось получить ответ от ИИ')
+
+        # Находим рекомендованные товары
+        food_items = FoodItem.objects.filter(is_active=True)
+        recommended_products = ai_service.analyze_and_extract_products(ai_response, food_items)
+
+        # Конвертируем budget в Decimal
+        try:
+            budget_decimal = Decimal(str(budget))
+        except Exception:
+            budget_decimal = Decimal('0')
+
+        with transaction.atomic():
+            # Создаем сессию чата
+            session = AIChatSession.objects.create(
+                user=job.user,
+                title=f"Консультация {timezone.now().strftime('%d.%m.%Y')}",
+                horse_data=data
+            )
+
+            # Сохраняем сообщения
+            AIChatMessage.objects.create(
+                session=session,
+                role='user',
+                content=f"Рекомендация для лошади: порода {breed}, возраст {age} лет, вес {weight} кг, цель {purpose}, бюджет {budget} руб"
+            )
+
+            AIChatMessage.objects.create(
+                session=session,
+                role='assistant',
+                content=ai_response
+            )
+
+            # Создаем рекомендацию в базе данных
+            recommendation = Recommendation.objects.create(
+                breed=breed,
+                age=age,
+                weight=weight,
+                purpose=purpose,
+                budget=budget,
+                activity_level=activity_level,
+                food_type="Рекомендовано ИИ",
+                daily_norm=Decimal('0.0'),
+                feeding_frequency=3,
+                next_purchase_date=timezone.now().date() + timedelta(days=30),
+                next_vet_check=timezone.now().date() + timedelta(days=180),
+                recommended_products=[str(pid) for pid in recommended_products],
+                notes=ai_response,
+                total_monthly_cost=budget_decimal
+            )
+
+            # Сохраняем в историю
+            ConsultationHistory.objects.create(
+                user=job.user,
+                recommendation=recommendation,
+                horse_name="Лошадь из чата",
+                horse_breed=breed,
+                horse_age=age,
+                horse_weight=weight
+            )
+
+            job.status = 'done'
+            job.result = {
+                'response': ai_response,
+                'recommended_products': [str(pid) for pid in recommended_products],
+                'session_id': str(session.id),
+                'recommendation_id': str(recommendation.id)
+            }
+            job.error = ''
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+
+    except Exception as e:
+        print(f"Error in AI consultation job {job.id}: {str(e)}")
+        print(traceback.format_exc())
+
+        max_attempts = getattr(settings, 'AI_JOBS_MAX_ATTEMPTS', 3)
+        job.error = str(e)
+        if job.attempts < max_attempts:
+            # Не забирать сразу снова: при сбое API воркер иначе крутил бы задачу вхолостую
+            job.status = 'pending'
+            job.next_attempt_at = timezone.now() + retry_delay(job.attempts)
+            job.finished_at = None
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'next_attempt_at', 'finished_at'])
+
+    return job
+
+
+def process_jobs(max_jobs=None):
+    """Обработать задачи из очереди; возвращает число обработанных"""
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_consultation(job)
+        processed += 1
+    return processed
@@ -0,0 +1,20 @@
+# food/management/commands/reindex_food_search.py
+from django.core.management.base import BaseCommand
+
+from food.search import backend_vendor, reindex_all
+
+
+class Command(BaseCommand):
+    help = 'Полная перестройка поискового индекса каталога кормов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Размер пачки при записи индекса')
+
+    def handle(self, *args, **options):
+        vendor = backend_vendor()
+        if vendor is None:
+            self.stdout.write('⚠️ Полнотекстовый поиск недоступен для этой базы, поиск будет работать через icontains')
+
+        count = reindex_all(batch_size=options['batch_size'])
+        self.stdout.write(f'✅ Проиндексировано товаров: {count} (бэкенд: {vendor or "icontains"})')
@@ -0,0 +1,46 @@
+# food/management/commands/run_ai_worker.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from food.jobs import process_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди консультаций ИИ: выполняет задачи вне веб-процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать текущую очередь и выйти')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Пауза между опросами пустой очереди (секунды)')
+        parser.add_argument('--max-jobs', type=int, default=None,
+                            help='Завершиться после обработки указанного числа задач')
+
+    def handle(self, *args, **options):
+        self.stdout.write('🤖 Воркер консультаций ИИ запущен')
+        total = 0
+
+        try:
+            while True:
+                requeued, failed = requeue_stale_jobs()
+                if requeued or failed:
+                    self.stdout.write(f'⚠️ Зависшие задачи: возвращено {requeued}, отклонено {failed}')
+
+                limit = None
+                if options['max_jobs'] is not None:
+                    limit = options['max_jobs'] - total
+
+                processed = process_jobs(max_jobs=limit)
+                total += processed
+                if processed:
+                    self.stdout.write(f'✅ Обработано задач: {processed} (всего {total})')
+
+                if options['once']:
+                    break
+                if options['max_jobs'] is not None and total >= options['max_jobs']:
+                    break
+                if not processed:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Воркер остановлен')
@@ -0,0 +1,211 @@
+# food/matcher.py - поиск товаров каталога в тексте ответа ИИ
+import re
+import threading
+from collections import deque
+
+
+# Синонимы и словоформы для основных групп кормов: основа -> варианты в тексте
+SYNONYMS = {
+    'овес': ['овес', 'овса', 'овсом', 'овсян', 'плющен'],
+    'сено': ['сено', 'сена', 'сеном', 'сенаж'],
+    'гранул': ['гранул'],
+    'витамин': ['витамин'],
+    'премикс': ['премикс'],
+    'комбикорм': ['комбикорм'],
+    'добавк': ['добавк'],
+    'минерал': ['минерал', 'микроэлемент'],
+    'соль': ['соль', 'соли', 'лизун'],
+    'люцерн': ['люцерн'],
+    'отруб': ['отруб'],
+    'меласс': ['меласс', 'патока'],
+    'морков': ['морков'],
+    'яблок': ['яблок', 'яблоч'],
+    'ячмен': ['ячмен'],
+    'электролит': ['электролит'],
+    'пробиот': ['пробиот'],
+    'копыт': ['копыт'],
+}
+
+# Слова, которые есть почти в каждом названии и ничего не говорят о товаре
+STOPWORDS = {
+    'для', 'лошадей', 'лошади', 'лошадь', 'корм', 'корма', 'кормов', 'кормовая',
+    'кормовой', 'новый', 'товар', 'смесь', 'набор', 'упаковка', 'мешок',
+}
+
+# Веса совпадений по типу шаблона
+NAME_WEIGHT = 10
+NAME_WORD_WEIGHT = 3
+SYNONYM_WEIGHT = 2
+CATEGORY_WEIGHT = 1
+
+MAX_COUNTED_OCCURRENCES = 3
+
+_WORD_RE = re.compile(r'[a-zа-я0-9]+')
+
+
+def normalize_text(text):
+    return (text or '').lower().replace('ё', 'е')
+
+
+def _word_stem(word):
+    """Грубая основа слова: отбрасываем окончание, чтобы находить разные падежи"""
+    if len(word) <= 4:
+        return word
+    return word[:max(4, len(word) - 2)]
+
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик: все шаблоны находятся за один проход по тексту"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        # Собственные шаблоны узла и они же вместе с шаблонами по суффиксным ссылкам
+        self._own = [[]]
+        self._output = [[]]
+        self._built = False
+
+    def add(self, pattern, value):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+            node = next_node
+        self._own[node].append((len(pattern), value))
+        self._built = False
+
+    def build(self):
+        """Строим суффиксные ссылки обходом в ширину; выходы узлов собираются заново при каждой сборке"""
+        self._output = [list(own) for own in self._own]
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                self._output[child].extend(self._output[self._fail[child]])
+        self._built = True
+
+    def iter_matches(self, text):
+        """(позиция начала, значение) для каждого вхождения шаблона"""
+        if not self._built:
+            self.build()
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length, value in self._output[node]:
+                yield index - length + 1, value
+
+
+class ProductMatcher:
+    """Индекс каталога: названия, их слова, синонимы групп кормов и названия категорий"""
+
+    def __init__(self, items):
+        self.automaton = AhoCorasick()
+        self.items = {}
+        self._patterns = set()
+        self.generation = None
+
+        for item in items:
+            item_id = str(item.id)
+            self.items[item_id] = item
+            name = normalize_text(item.name)
+            text = ' '.join([name, normalize_text(item.short_description), normalize_text(item.description)])
+
+            self._add(name, item_id, NAME_WEIGHT)
+
+            for word in _WORD_RE.findall(name):
+                if len(word) >= 4 and word not in STOPWORDS:
+                    self._add(_word_stem(word), item_id, NAME_WORD_WEIGHT)
+
+            for stem, variants in SYNONYMS.items():
+                if stem in text:
+                    for variant in variants:
+                        self._add(variant, item_id, SYNONYM_WEIGHT)
+
+            if item.category_id and item.category:
+                category_name = normalize_text(item.category.name)
+                self._add(category_name, item_id, CATEGORY_WEIGHT)
+                for word in _WORD_RE.findall(category_name):
+                    if len(word) >= 4 and word not in STOPWORDS:
+                        self._add(_word_stem(word), item_id, CATEGORY_WEIGHT)
+
+        self.automaton.build()
+
+    def _add(self, pattern, item_id, weight):
+        pattern = pattern.strip()
+        if not pattern or (pattern, item_id) in self._patterns:
+            return
+        self._patterns.add((pattern, item_id))
+        self.automaton.add(pattern, (pattern, item_id, weight))
+
+    def rank(self, text, limit=7):
+        """Товары, упомянутые в тексте, по убыванию релевантности"""
+        text = normalize_text(text)
+        occurrences = {}
+
+        for start, (pattern, item_id, weight) in self.automaton.iter_matches(text):
+            # Совпадение должно начинаться с начала слова: "соль" не должна находиться в "фасоль"
+            if start > 0 and text[start - 1].isalnum():
+                continue
+            key = (pattern, item_id, weight)
+            occurrences[key] = occurrences.get(key, 0) + 1
+
+        scores = {}
+        for (pattern, item_id, weight), count in occurrences.items():
+            scores[item_id] = scores.get(item_id, 0) + weight * min(count, MAX_COUNTED_OCCURRENCES)
+
+        ranked = sorted(
+            scores,
+            key=lambda item_id: (
+                scores[item_id],
+                self.items[item_id].is_featured,
+                self.items[item_id].rating,
+            ),
+            reverse=True
+        )
+        return ranked[:limit]
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def get_product_matcher():
+    """Индекс строится один раз на процесс и перестраивается, когда меняется поколение каталога
+    (в том числе после изменений, сделанных другим воркером)"""
+    global _matcher
+    from .cache import get_catalog_generation
+
+    generation = get_catalog_generation()
+    matcher = _matcher
+    if matcher is None or matcher.generation != generation:
+        with _matcher_lock:
+            if _matcher is None or _matcher.generation != generation:
+                from .models import FoodItem
+                items = FoodItem.objects.filter(is_active=True).select_related('category').only(
+                    'id', 'name', 'description', 'short_description', 'is_featured', 'rating',
+                    'category__id', 'category__name'
+                )
+                _matcher = ProductMatcher(items)
+                _matcher.generation = generation
+            matcher = _matcher
+    return matcher
+
+
+def invalidate_product_matcher():
+    global _matcher
+    with _matcher_lock:
+        _matcher = None
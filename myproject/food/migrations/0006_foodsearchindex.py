@@ -0,0 +1,85 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:50
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_search_backend(apps, schema_editor):
+    """GIN-индекс на PostgreSQL или таблица FTS5 на SQLite, затем первичное заполнение"""
+    from food.search import FTS_TABLE, create_sqlite_fts_table, stem_text
+
+    FoodItem = apps.get_model('food', 'FoodItem')
+    FoodSearchIndex = apps.get_model('food', 'FoodSearchIndex')
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS food_search_vector_gin '
+            'ON food_foodsearchindex USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        create_sqlite_fts_table(schema_editor)
+
+    documents = []
+    for item in FoodItem.objects.select_related('category').iterator():
+        documents.append(FoodSearchIndex(
+            food_id=item.pk,
+            name=item.name or '',
+            category=item.category.name if item.category else '',
+            body=' '.join(filter(None, [item.short_description, item.description])),
+        ))
+    FoodSearchIndex.objects.bulk_create(documents, batch_size=500)
+
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchVector
+        FoodSearchIndex.objects.update(
+            search_vector=(
+                SearchVector('name', weight='A', config='russian')
+                + SearchVector('category', weight='B', config='russian')
+                + SearchVector('body', weight='C', config='russian')
+            )
+        )
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (food_id, name, category, body) VALUES (%s, %s, %s, %s)',
+                [(doc.food_id.hex, stem_text(doc.name), stem_text(doc.category), stem_text(doc.body))
+                 for doc in documents]
+            )
+
+
+def drop_search_backend(apps, schema_editor):
+    from food.search import drop_sqlite_fts_table
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS food_search_vector_gin')
+    elif vendor == 'sqlite':
+        drop_sqlite_fts_table(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0005_aiconsultationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodSearchIndex',
+            fields=[
+                ('food', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='food.fooditem', verbose_name='Товар')),
+                ('name', models.CharField(default='', max_length=200, verbose_name='Название')),
+                ('category', models.CharField(blank=True, default='', max_length=100, verbose_name='Категория')),
+                ('body', models.TextField(blank=True, default='', verbose_name='Описание')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Поисковый индекс товара',
+                'verbose_name_plural': 'Поисковый индекс товаров',
+            },
+        ),
+        migrations.RunPython(create_search_backend, drop_search_backend),
+    ]
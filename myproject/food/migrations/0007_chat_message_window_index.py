@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0006_foodsearchindex'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aichatmessage',
+            index=models.Index(fields=['session', '-created_at'], name='food_chatmsg_session_new_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0007_chat_message_window_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aichatsession',
+            name='summary',
+            field=models.TextField(blank=True, default='', verbose_name='Краткое содержание'),
+        ),
+        migrations.AddField(
+            model_name='aichatsession',
+            name='summary_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Содержание до сообщения от'),
+        ),
+    ]
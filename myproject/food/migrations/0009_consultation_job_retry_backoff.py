@@ -0,0 +1,27 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:51
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0008_chat_session_summary'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='aiconsultationjob',
+            name='food_aijob_status_idx',
+        ),
+        migrations.AddField(
+            model_name='aiconsultationjob',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка'),
+        ),
+        migrations.AddIndex(
+            model_name='aiconsultationjob',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='food_aijob_due_idx'),
+        ),
+    ]
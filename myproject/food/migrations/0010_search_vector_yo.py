@@ -0,0 +1,35 @@
+# Generated by Django 4.2.26 on 2026-10-18 12:40
+
+from django.db import migrations
+
+
+def rebuild_search_vectors(apps, schema_editor):
+    """Пересчитать tsvector с заменой ё на е (запросы нормализуются так же)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    from django.contrib.postgres.search import SearchVector
+    from django.db.models import F, Func, Value
+
+    def document(field):
+        return Func(F(field), Value('ёЁ'), Value('еЕ'), function='translate')
+
+    FoodSearchIndex = apps.get_model('food', 'FoodSearchIndex')
+    FoodSearchIndex.objects.update(
+        search_vector=(
+            SearchVector(document('name'), weight='A', config='russian')
+            + SearchVector(document('category'), weight='B', config='russian')
+            + SearchVector(document('body'), weight='C', config='russian')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0009_consultation_job_retry_backoff'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_vectors, migrations.RunPython.noop),
+    ]
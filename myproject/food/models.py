@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 import uuid
 from decimal import Decimal
 from django.utils import timezone
@@ -143,19 +144,6 @@ class FoodItem(models.Model):
     def __str__(self):
         return self.name
     
-    def get_price_for_user(self, user):
-        """Получить цену в зависимости от подписки пользователя"""
-        try:
-            profile = user.profile
-            if profile.subscription == 'pro' and profile.subscription_active:
-                return self.pro_price
-            elif profile.subscription == 'premium' and profile.subscription_active:
-                return self.premium_price
-            else:
-                return self.base_price
-        except:
-            return self.base_price
-    
     def get_display_price(self):
         """Отображаемая цена"""
         if self.pro_price < self.base_price:
@@ -178,17 +166,18 @@ class FoodItem(models.Model):
         return 0
     
     def get_price_for_user(self, user):
-        """Получить цену в зависимости от подписки"""
-        try:
-            profile = user.profile
-            if profile.subscription == 'pro' and profile.subscription_active:
-                return self.pro_price
-            elif profile.subscription == 'premium' and profile.subscription_active:
-                return self.premium_price
-            else:
-                return self.base_price
-        except:
-            return self.base_price
+        """Получить цену в зависимости от подписки (уровень берётся из контекста запроса)"""
+        from user_profile.pricing import pricing_tier
+        return self.get_price_for_tier(pricing_tier(user))
+    
+    def get_price_for_tier(self, tier):
+        """Цена для уровня активной подписки: 'pro', 'premium' или '' (без подписки)"""
+        if tier == 'pro':
+            return self.pro_price
+        if tier == 'premium':
+            return self.premium_price
+        return self.base_price
+    
     @property
     def is_in_stock(self):
         return self.stock > 0
@@ -219,47 +208,8 @@ class FoodReview(models.Model):
     
     def __str__(self):
         return f"Отзыв от {self.user.username} на {self.food.name}"
-class AIChatSession(models.Model):
-    """Сессия чата с ИИ"""
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, 
-                           related_name='ai_chat_sessions', verbose_name="Пользователь")
-    title = models.CharField(max_length=200, verbose_name="Название сессии", default="Консультация")
-    horse_data = models.JSONField(default=dict, verbose_name="Данные о лошади")
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
-    
-    class Meta:
-        verbose_name = 'Сессия чата с ИИ'
-        verbose_name_plural = 'Сессии чата с ИИ'
-        ordering = ['-updated_at']
-    
-    def __str__(self):
-        return f"Чат {self.user.username} - {self.created_at.strftime('%d.%m.%Y')}"
 
 
-class AIChatMessage(models.Model):
-    """Сообщение в чате с ИИ"""
-    ROLE_CHOICES = [
-        ('system', 'Система'),
-        ('user', 'Пользователь'),
-        ('assistant', 'ИИ'),
-    ]
-    
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    session = models.ForeignKey(AIChatSession, on_delete=models.CASCADE, 
-                              related_name='messages', verbose_name="Сессия")
-    role = models.CharField(max_length=20, choices=ROLE_CHOICES, verbose_name="Роль")
-    content = models.TextField(verbose_name="Содержание")
-    created_at = models.DateTimeField(auto_now_add=True)
-    
-    class Meta:
-        verbose_name = 'Сообщение чата'
-        verbose_name_plural = 'Сообщения чата'
-        ordering = ['created_at']
-    
-    def __str__(self):
-        return f"{self.get_role_display()} - {self.created_at.strftime('%H:%M')}"
 class Recommendation(models.Model):
     """Рекомендация ИИ-консультанта"""
     
@@ -402,6 +352,9 @@ class AIChatSession(models.Model):
                            related_name='ai_chat_sessions', verbose_name="Пользователь")
     title = models.CharField(max_length=200, verbose_name="Название сессии", default="Консультация")
     horse_data = models.JSONField(default=dict, verbose_name="Данные о лошади")
+    # Краткое содержание сообщений, не вошедших в контекст модели (food.chat_context)
+    summary = models.TextField(blank=True, default='', verbose_name="Краткое содержание")
+    summary_until = models.DateTimeField(null=True, blank=True, verbose_name="Содержание до сообщения от")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -433,6 +386,64 @@ class AIChatMessage(models.Model):
         verbose_name = 'Сообщение чата'
         verbose_name_plural = 'Сообщения чата'
         ordering = ['created_at']
+        indexes = [
+            # Последние сообщения сессии (food.chat_context.recent_messages)
+            models.Index(fields=['session', '-created_at'], name='food_chatmsg_session_new_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.get_role_display()} - {self.created_at.strftime('%H:%M')}"
\ No newline at end of file
+        return f"{self.get_role_display()} - {self.created_at.strftime('%H:%M')}"
+
+class AIConsultationJob(models.Model):
+    """Фоновая задача консультации ИИ (очередь в базе данных)"""
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                           related_name='ai_consultation_jobs', verbose_name="Пользователь")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    payload = models.JSONField(default=dict, verbose_name="Параметры консультации")
+    result = models.JSONField(default=dict, blank=True, verbose_name="Результат")
+    error = models.TextField(blank=True, default="", verbose_name="Ошибка")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    # Раньше этого времени задачу не забирают: повтор после ошибки идёт с экспоненциальной задержкой
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Следующая попытка")
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало обработки")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Окончание обработки")
+    
+    class Meta:
+        verbose_name = 'Задача консультации ИИ'
+        verbose_name_plural = 'Задачи консультаций ИИ'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='food_aijob_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Задача {self.id.hex[:8]} - {self.get_status_display()}"
+
+
+class FoodSearchIndex(models.Model):
+    """Поисковый документ товара (обновляется сигналами и командой reindex_food_search)"""
+    food = models.OneToOneField(FoodItem, on_delete=models.CASCADE, primary_key=True,
+                                related_name='search_index', verbose_name='Товар')
+    name = models.CharField(max_length=200, default='', verbose_name='Название')
+    category = models.CharField(max_length=100, blank=True, default='', verbose_name='Категория')
+    body = models.TextField(blank=True, default='', verbose_name='Описание')
+    # Заполняется только на PostgreSQL, GIN-индекс создаётся миграцией
+    search_vector = SearchVectorField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Поисковый индекс товара'
+        verbose_name_plural = 'Поисковый индекс товаров'
+    
+    def __str__(self):
+        return self.name
@@ -0,0 +1,128 @@
+# food/pagination.py - постраничный вывод по курсору (keyset pagination)
+"""
+Вместо OFFSET следующая страница выбирается условием "после последней строки"
+по полям сортировки: (rating, review_count, id) < (4.5, 12, '...'). Курсор - base64 от JSON
+со значениями этих полей, поэтому страницы стабильны при вставках и стоят одинаково
+независимо от того, насколько далеко листает пользователь.
+"""
+import base64
+import datetime
+import hashlib
+import json
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class CursorError(ValueError):
+    """Курсор повреждён или выдан для другой сортировки"""
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        # isoformat сохраняет микросекунды - иначе строки с одинаковой секундой потеряются
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def parse_page_size(value, default=None, maximum=None):
+    """Размер страницы из запроса с ограничением сверху"""
+    default = default or getattr(settings, 'FOOD_PAGE_SIZE', 24)
+    maximum = maximum or getattr(settings, 'FOOD_PAGE_SIZE_MAX', 100)
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+class KeysetPaginator:
+    """Пагинатор по списку полей в формате order_by: ('-rating', '-review_count', '-id').
+
+    Последнее поле должно быть уникальным (обычно id), иначе порядок не строгий.
+    """
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+        self.signature = hashlib.md5(','.join(self.ordering).encode('utf-8')).hexdigest()[:8]
+
+    def encode_cursor(self, obj):
+        """Курсор после строки - объекта модели или словаря из values()"""
+        if isinstance(obj, dict):
+            values = [_encode_value(obj[name]) for name, _ in self.fields]
+        else:
+            values = [_encode_value(getattr(obj, name)) for name, _ in self.fields]
+        raw = json.dumps({'o': self.signature, 'v': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor, queryset):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+            values = data['v']
+        except (ValueError, KeyError, TypeError, UnicodeError):
+            raise CursorError('Неверный курсор')
+
+        if data.get('o') != self.signature or len(values) != len(self.fields):
+            raise CursorError('Курсор относится к другой сортировке')
+
+        try:
+            return [
+                self._output_field(queryset, name).to_python(value)
+                for (name, _), value in zip(self.fields, values)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise CursorError('Неверный курсор')
+
+    @staticmethod
+    def _output_field(queryset, name):
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def _after(self, values):
+        """(a, b, c) после (x, y, z): a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)"""
+        condition = Q()
+        for index, (name, descending) in enumerate(self.fields):
+            step = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[index]})
+            for previous, (previous_name, _) in enumerate(self.fields[:index]):
+                step &= Q(**{previous_name: values[previous]})
+            condition |= step
+        return condition
+
+    def paginate(self, queryset, cursor=None, page_size=None):
+        """Страница после курсора; на одну строку больше нужного - чтобы узнать, есть ли следующая"""
+        page_size = page_size or getattr(settings, 'FOOD_PAGE_SIZE', 24)
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor, queryset)))
+
+        items = list(queryset[:page_size + 1])
+        next_cursor = None
+        if len(items) > page_size:
+            items = items[:page_size]
+            next_cursor = self.encode_cursor(items[-1])
+        return KeysetPage(items, next_cursor)
@@ -0,0 +1,122 @@
+# food/queries.py - готовые запросы каталога без N+1
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, Q, Value, When
+from django.db.models.functions import Cast, Floor
+
+from .models import FoodCategory, FoodItem
+from .pagination import KeysetPaginator
+
+
+# Поля, которые нужны карточке товара в шаблонах и JSON API
+CARD_FIELDS = (
+    'id', 'name', 'description', 'short_description',
+    'base_price', 'premium_price', 'pro_price',
+    'unit', 'weight', 'protein', 'image', 'stock',
+    'rating', 'review_count', 'is_featured', 'is_best_seller', 'is_new',
+    'is_active', 'created_at',
+    'category__id', 'category__name', 'category__icon',
+)
+
+DEFAULT_IMAGE_URL = '/static/images/food_default.jpg'
+
+# Сортировки каталога; последнее поле (id) делает порядок строгим для курсоров
+CATALOG_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'price_asc': ('user_price', 'id'),
+    'price_desc': ('-user_price', '-id'),
+    'rating': ('-rating', '-review_count', '-id'),
+    'popular': ('-review_count', '-rating', '-id'),
+    'relevance': ('-search_rank', '-created_at', '-id'),
+}
+
+
+# Колонка цены для уровня активной подписки (см. FoodItem.get_price_for_tier)
+TIER_PRICE_FIELDS = {
+    'pro': 'pro_price',
+    'premium': 'premium_price',
+}
+
+
+def with_tier_prices(queryset, tier=''):
+    """Цена пользователя (user_price) и его скидка в процентах (user_discount) для всего списка в SQL.
+
+    Уровень известен до запроса, поэтому цена - просто нужная колонка, а не CASE по строкам;
+    по user_price можно фильтровать и сортировать в базе.
+    """
+    price = F(TIER_PRICE_FIELDS.get(tier, 'base_price'))
+    return queryset.annotate(
+        user_price=ExpressionWrapper(price, output_field=DecimalField(max_digits=10, decimal_places=2)),
+        user_discount=Case(
+            When(base_price__gt=0, then=Cast(
+                Floor((F('base_price') - price) * Value(100) / F('base_price')), IntegerField()
+            )),
+            default=Value(0),
+            output_field=IntegerField()
+        )
+    )
+
+
+def catalog_items(queryset=None, tier=''):
+    """Активные товары с категорией в одном запросе, только полями карточки и ценами для уровня tier"""
+    if queryset is None:
+        queryset = FoodItem.objects.filter(is_active=True)
+    return with_tier_prices(queryset.select_related('category').only(*CARD_FIELDS), tier)
+
+
+def catalog_paginator(sort_by):
+    """Пагинатор для сортировки каталога (неизвестная сортировка - новые сверху)"""
+    return KeysetPaginator(CATALOG_ORDERINGS.get(sort_by, CATALOG_ORDERINGS['newest']))
+
+
+def showcase_items(limit=4, **flags):
+    """Подборки витрины: showcase_items(is_best_seller=True); общие для всех, цены без подписки"""
+    return catalog_items().filter(**flags)[:limit]
+
+
+def similar_items(food, limit=4, tier=''):
+    if not food.category_id:
+        return FoodItem.objects.none()
+    return catalog_items(tier=tier).filter(category_id=food.category_id).exclude(id=food.id)[:limit]
+
+
+def food_detail_item(food_id):
+    """Товар для детальной страницы вместе с категорией"""
+    return FoodItem.objects.select_related('category').get(id=food_id, is_active=True)
+
+
+def categories_with_counts():
+    """Активные категории с числом активных товаров (active_items_count) одним запросом"""
+    return FoodCategory.objects.filter(is_active=True).annotate(
+        active_items_count=Count('items', filter=Q(items__is_active=True))
+    ).order_by('order')
+
+
+def serialize_card(item, user, detailed=False):
+    """Словарь товара для JSON API; item должен быть получен через catalog_items с уровнем пользователя"""
+    price = getattr(item, 'user_price', None)
+    if price is None:
+        price = item.get_price_for_user(user)
+    data = {
+        'id': str(item.id),
+        'name': item.name,
+        'price': float(price),
+        'image_url': item.image.url if item.image else DEFAULT_IMAGE_URL,
+        'category': item.category.name if item.category else 'Корма',
+    }
+    if not detailed:
+        data['unit'] = item.get_unit_display()
+        return data
+
+    data.update({
+        'description': item.short_description or item.description[:100],
+        'original_price': float(item.base_price),
+        'unit': f"{item.weight} {item.get_unit_display()}",
+        'rating': float(item.rating),
+        'review_count': item.review_count,
+        'is_best_seller': item.is_best_seller,
+        'is_new': item.is_new,
+        'discount_percentage': item.get_discount_percentage(),
+        'user_discount': getattr(item, 'user_discount', 0),
+        'is_in_stock': item.is_in_stock,
+        'stock': item.stock,
+    })
+    return data
@@ -0,0 +1,257 @@
+# food/search.py - полнотекстовый поиск по каталогу кормов
+"""
+PostgreSQL: tsvector в FoodSearchIndex.search_vector с GIN-индексом и конфигурацией 'russian'
+(ё в документе и запросе заменяется на е).
+SQLite: виртуальная таблица FTS5 food_search_fts, в которую пишутся основы слов
+(стемминг по алгоритму Snowball для русского языка выполняется здесь же).
+На остальных базах поиск откатывается к icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+
+
+FTS_TABLE = 'food_search_fts'
+
+# Наличие таблицы FTS5 по базам (ключ - NAME из настроек соединения)
+_fts5_tables = {}
+
+_WORD_RE = re.compile(r'[0-9a-zа-яё]+', re.IGNORECASE)
+
+# Стеммер Портера (Snowball) для русского языка
+_VOWELS_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN = re.compile(r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DER_SUFFIX = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def stem_word(word):
+    """Основа русского слова; латиница и числа возвращаются как есть"""
+    word = word.lower().replace('ё', 'е')
+    match = _VOWELS_RV.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+
+    temp = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        temp = _ADJECTIVE.sub('', rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE.sub('', temp, 1)
+        else:
+            temp = _VERB.sub('', rv, 1)
+            rv = _NOUN.sub('', rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+
+    rv = re.sub(r'и$', '', rv, 1)
+    if _DERIVATIONAL.match(rv):
+        rv = _DER_SUFFIX.sub('', rv, 1)
+
+    temp = re.sub(r'ь$', '', rv, 1)
+    if temp == rv:
+        rv = _SUPERLATIVE.sub('', rv, 1)
+        rv = re.sub(r'нн$', 'н', rv, 1)
+    else:
+        rv = temp
+    return prefix + rv
+
+
+def stem_text(text):
+    return ' '.join(stem_word(word) for word in _WORD_RE.findall(text or ''))
+
+
+def query_terms(query):
+    """Слова запроса без спецсимволов (их нельзя передавать в MATCH / to_tsquery)"""
+    return [word.lower().replace('ё', 'е') for word in _WORD_RE.findall(query or '')]
+
+
+def build_document(item):
+    """Поля поискового документа товара"""
+    category = item.category.name if item.category_id and item.category else ''
+    body = ' '.join(filter(None, [item.short_description, item.description]))
+    return {'name': item.name or '', 'category': category, 'body': body}
+
+
+def backend_vendor():
+    """'postgresql', 'sqlite' (если доступен FTS5) или None"""
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite' and fts5_table_exists():
+        return 'sqlite'
+    return None
+
+
+def _database_key(conn):
+    return str(conn.settings_dict['NAME'])
+
+
+def fts5_table_exists():
+    """Есть ли таблица FTS5; проверяется один раз на файл базы за процесс"""
+    key = _database_key(connection)
+    if key not in _fts5_tables:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _fts5_tables[key] = cursor.fetchone() is not None
+    return _fts5_tables[key]
+
+
+def create_sqlite_fts_table(schema_editor):
+    """Создать таблицу FTS5 (вызывается из миграции)"""
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+        "USING fts5(food_id UNINDEXED, name, category, body, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    _fts5_tables.pop(_database_key(schema_editor.connection), None)
+
+
+def drop_sqlite_fts_table(schema_editor):
+    """Удалить таблицу FTS5 (откат миграции)"""
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    _fts5_tables.pop(_database_key(schema_editor.connection), None)
+
+
+def index_food_item(item):
+    """Обновить поисковый документ одного товара"""
+    from .models import FoodSearchIndex
+
+    document = build_document(item)
+    FoodSearchIndex.objects.update_or_create(food_id=item.pk, defaults=document)
+
+    vendor = backend_vendor()
+    if vendor == 'postgresql':
+        _update_search_vectors(FoodSearchIndex.objects.filter(food_id=item.pk))
+    elif vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE food_id = %s", [item.pk.hex])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (food_id, name, category, body) VALUES (%s, %s, %s, %s)",
+                [item.pk.hex, stem_text(document['name']), stem_text(document['category']),
+                 stem_text(document['body'])]
+            )
+
+
+def remove_food_item(food_id):
+    """Удалить товар из индекса FTS5 (строка FoodSearchIndex удаляется каскадом)"""
+    if backend_vendor() == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE food_id = %s", [food_id.hex])
+
+
+def _search_document(field):
+    """Поле документа с ё, заменённой на е: в конфигурации 'russian' нет такой нормализации"""
+    return Func(F(field), Value('ёЁ'), Value('еЕ'), function='translate')
+
+
+def _update_search_vectors(queryset):
+    from django.contrib.postgres.search import SearchVector
+
+    queryset.update(
+        search_vector=(
+            SearchVector(_search_document('name'), weight='A', config='russian')
+            + SearchVector(_search_document('category'), weight='B', config='russian')
+            + SearchVector(_search_document('body'), weight='C', config='russian')
+        )
+    )
+
+
+def reindex_all(batch_size=500):
+    """Полная перестройка индекса; возвращает число проиндексированных товаров"""
+    from .models import FoodItem, FoodSearchIndex
+
+    vendor = backend_vendor()
+    FoodSearchIndex.objects.all().delete()
+    if vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    count = 0
+    batch = []
+    items = FoodItem.objects.select_related('category').only(
+        'id', 'name', 'short_description', 'description', 'category__name'
+    )
+    for item in items.iterator(chunk_size=batch_size):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            count += _index_batch(batch, vendor)
+            batch = []
+    if batch:
+        count += _index_batch(batch, vendor)
+
+    if vendor == 'postgresql':
+        _update_search_vectors(FoodSearchIndex.objects.all())
+    return count
+
+
+def _index_batch(items, vendor):
+    from .models import FoodSearchIndex
+
+    documents = [(item, build_document(item)) for item in items]
+    FoodSearchIndex.objects.bulk_create([
+        FoodSearchIndex(food_id=item.pk, **document) for item, document in documents
+    ])
+    if vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (food_id, name, category, body) VALUES (%s, %s, %s, %s)",
+                [
+                    (item.pk.hex, stem_text(document['name']), stem_text(document['category']),
+                     stem_text(document['body']))
+                    for item, document in documents
+                ]
+            )
+    return len(documents)
+
+
+def search_food_items(queryset, query):
+    """Отфильтровать товары по запросу и добавить аннотацию search_rank.
+
+    Совпадения и релевантность считаются в том же SQL-запросе, что и страница,
+    поэтому пагинация и число найденных товаров не ограничены сверху.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    vendor = backend_vendor()
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        # Префиксный поиск по каждому слову: подходит для ввода по буквам
+        search_query = SearchQuery(' & '.join(f'{term}:*' for term in terms),
+                                   search_type='raw', config='russian')
+        return queryset.filter(search_index__search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_index__search_vector'), search_query)
+        )
+
+    if vendor == 'sqlite':
+        match = ' AND '.join(f'"{stem_word(term)}"*' for term in terms)
+        food_id = f'{connection.ops.quote_name(queryset.model._meta.db_table)}.{connection.ops.quote_name("id")}'
+        # bm25 отрицательный: чем меньше, тем релевантнее; название весит больше описания
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT food_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT -bm25({FTS_TABLE}, 0.0, 10.0, 3.0, 1.0) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND food_id = {food_id}",
+                [match], output_field=FloatField()
+            )
+        )
+
+    return queryset.filter(
+        Q(name__icontains=query) |
+        Q(description__icontains=query) |
+        Q(short_description__icontains=query)
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
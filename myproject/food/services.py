@@ -2,17 +2,28 @@
 import requests
 import json
 import os
+import threading
 from django.conf import settings
 from decimal import Decimal
 from django.utils import timezone
 from datetime import timedelta
+from .ai_cache import get_recommendation_cache
+from .ai_client import AIClientBusy, get_ai_client
+from .matcher import get_product_matcher
+
+class AIChatError(Exception):
+    """ИИ не ответил на вопрос чата; текст исключения - сообщение для пользователя"""
+
 
 class IOIntelligenceService:
     """Сервис для работы с IO Intelligence API"""
     
-    def __init__(self):
+    def __init__(self, client=None):
         self.base_url = "https://api.intelligence.io.solutions/api/v1/"
         
+        # Общий пул соединений процесса вместо нового TLS-соединения на каждый запрос
+        self.client = client or get_ai_client()
+        
         # Получаем API ключ из переменных окружения или настроек
         self.api_key = self._get_api_key()
         
@@ -48,18 +59,10 @@ class IOIntelligenceService:
         
         return ""
     
-    def get_food_recommendation(self, breed, age, weight, purpose, budget, activity_level='medium'):
-        """Получить рекомендацию от IO Intelligence API"""
-        
-        print(f"📨 Запрос к IO Intelligence: {breed}, {age} лет, {weight} кг")
-        
-        if not self.api_key:
-            print("❌ Нет API ключа для IO Intelligence")
-            return self._get_fallback_response(breed, age, weight, purpose, budget, activity_level)
-        
-        try:
-            # Системный промпт для лошадей
-            system_prompt = """Ты - эксперт по кормлению лошадей с 20-летним опытом.
+    def _build_recommendation_payload(self, breed, age, weight, purpose, budget, activity_level):
+        """Тело запроса к chat/completions для рекомендации по кормлению"""
+        # Системный промпт для лошадей
+        system_prompt = """Ты - эксперт по кормлению лошадей с 20-летним опытом.
             
             ФОРМАТ ОТВЕТА:
             🐎 **Анализ параметров**
@@ -70,8 +73,8 @@ class IOIntelligenceService:
             💡 **Полезные советы**
             
             Используй эмодзи и будь конкретным. Давай точные цифры в кг."""
-            
-            user_prompt = f"""Составь рекомендацию по кормлению для лошади:
+        
+        user_prompt = f"""Составь рекомендацию по кормлению для лошади:
             
             ПАРАМЕТРЫ:
             - Порода: {breed}
@@ -83,49 +86,89 @@ class IOIntelligenceService:
             
             Дай конкретный рацион с цифрами в кг/день.
             Также предложи конкретные продукты."""
+        
+        # Используем модель Llama от IO Intelligence
+        return {
+            "model": "meta-llama/Llama-3.3-70B-Instruct",
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 2000,
+            "stream": False
+        }
+    
+    def _parse_recommendation_response(self, response, horse):
+        """Разобрать ответ API: (текст рекомендации, получен ли он от модели)"""
+        print(f"📊 Статус IO Intelligence: {response.status_code}")
+        
+        if response.status_code == 200:
+            data = response.json()
+            print(f"✅ Получен ответ от IO Intelligence")
             
-            # Используем модель Llama от IO Intelligence
-            response = requests.post(
+            # Извлекаем контент из ответа IO Intelligence
+            if 'choices' in data and len(data['choices']) > 0:
+                result = data['choices'][0]['message']['content']
+                print(f"   Длина ответа: {len(result)} символов")
+                return result, True
+            else:
+                print(f"⚠️ Неверный формат ответа от IO Intelligence")
+                return self._get_fallback_response(**horse), False
+                
+        elif response.status_code == 401:
+            print("❌ Ошибка аутентификации. Проверьте API ключ.")
+            return self._get_auth_error_response(), False
+        elif response.status_code == 429:
+            print("⚠️ Превышен лимит запросов к IO Intelligence")
+            return self._get_rate_limit_response(), False
+        else:
+            error_text = response.text[:500] if hasattr(response, 'text') else str(response)
+            print(f"❌ Ошибка IO Intelligence {response.status_code}: {error_text}")
+            return self._get_fallback_response(**horse), False
+    
+    def _get_cached_recommendation(self, horse):
+        """Ответ из кэша для похожей лошади (вес по корзинам, возраст по группам)"""
+        cache = get_recommendation_cache()
+        if cache is None:
+            return None
+        result = cache.get(**horse)
+        if result is not None:
+            stats = cache.stats()
+            print(f"⚡ Рекомендация из кэша (попаданий: {stats['hits']}, промахов: {stats['misses']})")
+        return result
+    
+    def _cache_recommendation(self, result, horse):
+        """Кэшируем только настоящие ответы модели, не резервные"""
+        cache = get_recommendation_cache()
+        if cache is not None:
+            cache.set(result, **horse)
+    
+    def get_food_recommendation(self, breed, age, weight, purpose, budget, activity_level='medium'):
+        """Получить рекомендацию от IO Intelligence API"""
+        
+        print(f"📨 Запрос к IO Intelligence: {breed}, {age} лет, {weight} кг")
+        horse = dict(breed=breed, age=age, weight=weight, purpose=purpose,
+                     budget=budget, activity_level=activity_level)
+        
+        if not self.api_key:
+            print("❌ Нет API ключа для IO Intelligence")
+            return self._get_fallback_response(**horse)
+        
+        cached = self._get_cached_recommendation(horse)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = self.client.post(
                 f"{self.base_url}chat/completions",
                 headers=self.headers,
-                json={
-                    "model": "meta-llama/Llama-3.3-70B-Instruct",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    "temperature": 0.7,
-                    "max_tokens": 2000,
-                    "stream": False
-                },
-                timeout=60  # Увеличил таймаут для IO Intelligence
+                json=self._build_recommendation_payload(**horse),
             )
-            
-            print(f"📊 Статус IO Intelligence: {response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                print(f"✅ Получен ответ от IO Intelligence")
-                
-                # Извлекаем контент из ответа IO Intelligence
-                if 'choices' in data and len(data['choices']) > 0:
-                    result = data['choices'][0]['message']['content']
-                    print(f"   Длина ответа: {len(result)} символов")
-                    return result
-                else:
-                    print(f"⚠️ Неверный формат ответа от IO Intelligence")
-                    return self._get_fallback_response(breed, age, weight, purpose, budget, activity_level)
-                    
-            elif response.status_code == 401:
-                print("❌ Ошибка аутентификации. Проверьте API ключ.")
-                return self._get_auth_error_response()
-            elif response.status_code == 429:
-                print("⚠️ Превышен лимит запросов к IO Intelligence")
-                return self._get_rate_limit_response()
-            else:
-                error_text = response.text[:500] if hasattr(response, 'text') else str(response)
-                print(f"❌ Ошибка IO Intelligence {response.status_code}: {error_text}")
-                return self._get_fallback_response(breed, age, weight, purpose, budget, activity_level)
+            result, from_model = self._parse_recommendation_response(response, horse)
+            if from_model:
+                self._cache_recommendation(result, horse)
+            return result
                 
         except requests.exceptions.ConnectionError:
             print("❌ Не удалось подключиться к IO Intelligence API")
@@ -138,13 +181,125 @@ class IOIntelligenceService:
             
         except Exception as e:
             print(f"❌ Ошибка: {str(e)}")
-            return self._get_fallback_response(breed, age, weight, purpose, budget, activity_level)
+            return self._get_fallback_response(**horse)
+    
+    def _build_chat_payload(self, history, horse_data, stream=True):
+        """Тело запроса для продолжения диалога о кормлении"""
+        system_prompt = f"""Ты - эксперт по кормлению лошадей с 20-летним опытом.
+            Продолжай диалог с владельцем лошади, отвечай по существу и конкретно.
+            
+            ДАННЫЕ О ЛОШАДИ:
+            - Порода: {horse_data.get('breed', 'other')}
+            - Возраст: {horse_data.get('age', 5)} лет
+            - Вес: {horse_data.get('weight', 400)} кг
+            - Цель: {horse_data.get('purpose', 'walk')}
+            - Бюджет: {horse_data.get('budget', '10000')} руб/месяц
+            - Активность: {horse_data.get('activity_level', 'medium')}"""
+        
+        return {
+            "model": "meta-llama/Llama-3.3-70B-Instruct",
+            "messages": [{"role": "system", "content": system_prompt}] + list(history),
+            "temperature": 0.7,
+            "max_tokens": 2000,
+            "stream": stream
+        }
+    
+    def _check_chat_response(self, response):
+        """AIChatError, если API не ответило (ошибка авторизации, лимит, сбой)"""
+        if response.status_code == 401:
+            raise AIChatError(self._get_auth_error_response())
+        if response.status_code == 429:
+            raise AIChatError(self._get_rate_limit_response())
+        if response.status_code != 200:
+            print(f"❌ Ошибка IO Intelligence {response.status_code}")
+            raise AIChatError(self._get_unavailable_response())
+    
+    def _chat_request_error(self, error):
+        """AIChatError для исключения requests при запросе к API"""
+        if isinstance(error, requests.exceptions.ConnectionError):
+            print("❌ Не удалось подключиться к IO Intelligence API")
+            return AIChatError(self._get_connection_error_response())
+        if isinstance(error, requests.exceptions.Timeout):
+            print("❌ Таймаут при подключении к IO Intelligence")
+            return AIChatError(self._get_timeout_response())
+        print(f"❌ Ошибка запроса к IO Intelligence: {error}")
+        return AIChatError(self._get_unavailable_response())
+    
+    def chat_reply(self, history, horse_data):
+        """Ответ ИИ в диалоге одним куском (без кэша рекомендаций: у каждого вопроса свой ответ).
+        
+        history - сообщения диалога в формате API, последним идёт вопрос пользователя.
+        Если ответа от модели нет, выбрасывает AIChatError: резервный текст не должен
+        попасть в историю как ответ ИИ.
+        """
+        if not self.api_key:
+            print("❌ Нет API ключа для IO Intelligence")
+            raise AIChatError(self._get_unavailable_response())
+        
+        try:
+            response = self.client.post(
+                f"{self.base_url}chat/completions",
+                headers=self.headers,
+                json=self._build_chat_payload(history, horse_data, stream=False),
+            )
+        except requests.exceptions.RequestException as e:
+            raise self._chat_request_error(e)
+        
+        print(f"📊 Статус IO Intelligence: {response.status_code}")
+        self._check_chat_response(response)
+        try:
+            return response.json()['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError, TypeError):
+            print("⚠️ Неверный формат ответа от IO Intelligence")
+            raise AIChatError(self._get_unavailable_response())
+    
+    def stream_chat_reply(self, history, horse_data):
+        """Генератор фрагментов ответа ИИ по мере их получения (SSE от chat/completions).
+        
+        history - сообщения диалога в формате API, последним идёт вопрос пользователя.
+        Ошибка API или соединения (в том числе посреди ответа) - AIChatError.
+        """
+        if not self.api_key:
+            print("❌ Нет API ключа для IO Intelligence")
+            raise AIChatError(self._get_unavailable_response())
+        
+        try:
+            with self.client.stream(
+                'POST',
+                f"{self.base_url}chat/completions",
+                headers=self.headers,
+                json=self._build_chat_payload(history, horse_data),
+            ) as response:
+                print(f"📊 Статус IO Intelligence (stream): {response.status_code}")
+                self._check_chat_response(response)
+                
+                # Читаем байты и декодируем сами: у text/event-stream часто нет charset
+                for raw_line in response.iter_lines():
+                    line = raw_line.decode('utf-8', errors='replace').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        continue
+                    choices = chunk.get('choices') if isinstance(chunk, dict) else None
+                    if not choices:
+                        continue
+                    token = (choices[0].get('delta') or {}).get('content')
+                    if token:
+                        yield token
+        
+        except requests.exceptions.RequestException as e:
+            raise self._chat_request_error(e)
     
     def test_connection(self):
         """Проверить соединение с IO Intelligence API"""
         try:
             # Запрос списка доступных моделей
-            response = requests.get(
+            response = self.client.get(
                 f"{self.base_url}models",
                 headers=self.headers,
                 timeout=10
@@ -167,7 +322,7 @@ class IOIntelligenceService:
     def get_available_models(self):
         """Получить список доступных моделей"""
         try:
-            response = requests.get(
+            response = self.client.get(
                 f"{self.base_url}models",
                 headers=self.headers,
                 timeout=10
@@ -202,45 +357,30 @@ class IOIntelligenceService:
         if not ai_response:
             return recommended
         
-        # Приводим ответ к нижнему регистру для поиска
-        response_lower = ai_response.lower()
-        
-        # Ключевые слова для поиска товаров
-        keywords = [
-            'гранул', 'овёс', 'сено', 'витамин', 'премикс',
-            'комбикорм', 'добавк', 'минерал', 'соль', 'корм',
-            'премиум', 'люцерн', 'отруб', 'меласс'
-        ]
-        
-        # Поиск по названию товара
-        for item in food_items:
-            item_name = item.name.lower()
-            item_desc = (item.description or "").lower()
-            
-            # Проверяем ключевые слова
-            if any(kw in item_name for kw in keywords):
-                recommended.append(str(item.id))
-                continue
-            
-            # Проверяем описание
-            if any(kw in item_desc for kw in keywords):
-                recommended.append(str(item.id))
-                continue
-            
-            # Проверяем категорию
-            if item.category and item.category.name.lower() in response_lower:
-                recommended.append(str(item.id))
-        
-        # Убираем дубликаты
-        recommended = list(set(recommended))
+        # Один проход автомата по тексту ответа вместо перебора всех товаров каталога
+        recommended = get_product_matcher().rank(ai_response, limit=7)
         
         # Если ничего не нашли, берем популярные товары
         if not recommended:
-            popular_items = food_items.filter(is_featured=True)[:5]
-            recommended = [str(item.id) for item in popular_items]
+            popular_items = food_items.filter(is_featured=True).values_list('id', flat=True)[:5]
+            recommended = [str(item_id) for item_id in popular_items]
         
-        # Ограничиваем количество
-        return recommended[:7]
+        return recommended
+    
+    def _get_auth_error_response(self):
+        return "⚠️ Не удалось авторизоваться в IO Intelligence. Проверьте API ключ в настройках."
+    
+    def _get_rate_limit_response(self):
+        return "⚠️ Слишком много запросов к ИИ-консультанту. Попробуйте повторить через минуту."
+    
+    def _get_connection_error_response(self):
+        return "⚠️ Не удалось подключиться к ИИ-консультанту. Проверьте подключение к интернету и попробуйте позже."
+    
+    def _get_timeout_response(self):
+        return "⚠️ ИИ-консультант отвечает слишком долго. Попробуйте повторить запрос позже."
+    
+    def _get_unavailable_response(self):
+        return "⚠️ ИИ-консультант временно недоступен. Попробуйте повторить запрос позже."
     
     def _get_fallback_response(self, breed, age, weight, purpose, budget, activity_level):
         """Резервный ответ если IO Intelligence не работает"""
@@ -295,4 +435,18 @@ class IOIntelligenceService:
 
 ⚠️ **ДЛЯ ИНТЕЛЛЕКТУАЛЬНЫХ РЕКОМЕНДАЦИЙ:**
 Установите API ключ IO Intelligence в настройках!"""
-    
\ No newline at end of file
+    
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_ai_service():
+    """Общий для процесса экземпляр IOIntelligenceService"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = IOIntelligenceService()
+    return _service
@@ -0,0 +1,115 @@
+# food/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .matcher import invalidate_product_matcher
+from .cache import bump_catalog_generation
+from .models import FoodCategory, FoodItem, FoodReview
+from .search import index_food_item, remove_food_item
+from . import suggest
+
+
+@receiver(post_save, sender=FoodItem)
+@receiver(post_delete, sender=FoodItem)
+@receiver(post_save, sender=FoodCategory)
+@receiver(post_delete, sender=FoodCategory)
+def invalidate_catalog_indexes(sender, **kwargs):
+    """
+    Сброс индексов каталога в памяти при изменении товаров и категорий
+    """
+    invalidate_product_matcher()
+
+
+def _bump_generation():
+    suggest.follow_generation(bump_catalog_generation())
+
+
+@receiver(post_save, sender=FoodItem)
+@receiver(post_delete, sender=FoodItem)
+@receiver(post_save, sender=FoodCategory)
+@receiver(post_delete, sender=FoodCategory)
+@receiver(post_save, sender=FoodReview)
+@receiver(post_delete, sender=FoodReview)
+def bump_catalog_cache(sender, **kwargs):
+    """
+    Новое поколение кэша каталога; после коммита, чтобы другие воркеры не закэшировали старые данные
+    """
+    transaction.on_commit(_bump_generation)
+
+
+@receiver(post_save, sender=FoodItem)
+def update_food_search_index(sender, instance, **kwargs):
+    """
+    Обновление поискового документа товара
+    """
+    index_food_item(instance)
+
+
+@receiver(post_delete, sender=FoodItem)
+def delete_food_search_index(sender, instance, **kwargs):
+    remove_food_item(instance.pk)
+
+
+@receiver(post_save, sender=FoodCategory)
+def update_category_search_index(sender, instance, created, **kwargs):
+    """
+    Название категории входит в документ каждого её товара
+    """
+    if created:
+        return
+    for item in instance.items.select_related('category'):
+        index_food_item(item)
+
+
+@receiver(post_delete, sender=FoodCategory)
+def delete_category_search_index(sender, instance, **kwargs):
+    # Товары удалённой категории остались без неё (SET_NULL) - убираем её название из документов
+    items = FoodItem.objects.filter(category__isnull=True, search_index__category=instance.name)
+    for item in items:
+        index_food_item(item)
+
+
+@receiver(pre_save, sender=FoodItem)
+def remember_food_item_category(sender, instance, **kwargs):
+    # Популярность прежней категории тоже нужно пересчитать, если товар перенесли
+    instance._previous_category_id = None
+    if suggest.is_loaded() and not instance._state.adding:
+        instance._previous_category_id = FoodItem.objects.filter(pk=instance.pk).values_list(
+            'category_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=FoodItem)
+def update_food_suggestions(sender, instance, **kwargs):
+    """
+    Инкрементальное обновление дерева подсказок
+    """
+    suggest.refresh_food_item(instance)
+    previous = getattr(instance, '_previous_category_id', None)
+    if previous and previous != instance.category_id:
+        suggest.refresh_category(previous)
+
+
+@receiver(post_delete, sender=FoodItem)
+def delete_food_suggestions(sender, instance, **kwargs):
+    suggest.remove_food_item(instance.pk, instance.category_id)
+
+
+@receiver(pre_save, sender=FoodCategory)
+def remember_category_manufacturer(sender, instance, **kwargs):
+    instance._previous_manufacturer = None
+    if suggest.is_loaded() and not instance._state.adding:
+        instance._previous_manufacturer = FoodCategory.objects.filter(pk=instance.pk).values_list(
+            'manufacturer', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=FoodCategory)
+def update_category_suggestions(sender, instance, **kwargs):
+    suggest.refresh_category(instance.pk, getattr(instance, '_previous_manufacturer', None))
+
+
+@receiver(post_delete, sender=FoodCategory)
+def delete_category_suggestions(sender, instance, **kwargs):
+    suggest.remove_category(instance.pk, instance.manufacturer)
@@ -0,0 +1,321 @@
+# food/suggest.py - подсказки при вводе поискового запроса
+import heapq
+import re
+import threading
+
+from django.db.models import Count, Q
+from django.urls import reverse
+from django.utils.http import urlencode
+
+
+# Префиксы длиннее этого не храним в дереве: результаты дофильтровываются по полному тексту
+MAX_PREFIX_LENGTH = 24
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+_WORD_START_RE = re.compile(r'(?<![0-9a-zа-я])[0-9a-zа-я]')
+
+
+def normalize_text(text):
+    return ' '.join((text or '').lower().replace('ё', 'е').split())
+
+
+def _word_starts(text):
+    """Позиции начала слов: "сено луговое" находится и по "сен", и по "луг\""""
+    return [match.start() for match in _WORD_START_RE.finditer(text)]
+
+
+class _Node:
+    __slots__ = ('children', 'keys', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.keys = set()
+        self.top = None
+
+
+class SuggestionTrie:
+    """Префиксное дерево: в каждом узле - ключи записей поддерева и закэшированный top-k.
+
+    Запрос проходит len(prefix) узлов и берёт готовый список; при вставке
+    или удалении записи сбрасывается только кэш узлов на её путях.
+    """
+
+    def __init__(self, top_k=MAX_LIMIT):
+        self.top_k = top_k
+        self.root = _Node()
+        self.entries = {}
+        self.generation = None
+        self._lock = threading.Lock()
+
+    def _prefixes(self, text):
+        for start in _word_starts(text):
+            yield text[start:start + MAX_PREFIX_LENGTH]
+
+    def _insert(self, key, entry):
+        self.entries[key] = entry
+        for suffix in self._prefixes(entry['search_text']):
+            node = self.root
+            for char in suffix:
+                node = node.children.setdefault(char, _Node())
+                node.keys.add(key)
+                node.top = None
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for suffix in self._prefixes(entry['search_text']):
+            node = self.root
+            path = []
+            for char in suffix:
+                child = node.children.get(char)
+                if child is None:
+                    break
+                path.append((node, char, child))
+                child.keys.discard(key)
+                child.top = None
+                node = child
+            # Убираем опустевшие ветки
+            for parent, char, child in reversed(path):
+                if child.keys or child.children:
+                    break
+                del parent.children[char]
+
+    def upsert(self, key, text, score, data):
+        """Добавить или обновить запись"""
+        entry = {'search_text': normalize_text(text), 'score': score, 'data': data}
+        with self._lock:
+            self._remove(key)
+            if entry['search_text']:
+                self._insert(key, entry)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _top(self, node):
+        if node.top is None:
+            entries = self.entries
+            node.top = heapq.nsmallest(
+                self.top_k,
+                node.keys,
+                key=lambda key: (-entries[key]['score'], entries[key]['search_text'])
+            )
+        return node.top
+
+    def search(self, prefix, limit=DEFAULT_LIMIT):
+        """Записи, у которых одно из слов начинается с prefix, по убыванию популярности"""
+        prefix = normalize_text(prefix)
+        if not prefix:
+            return []
+        limit = min(limit, self.top_k)
+
+        with self._lock:
+            node = self.root
+            for char in prefix[:MAX_PREFIX_LENGTH]:
+                node = node.children.get(char)
+                if node is None:
+                    return []
+
+            if len(prefix) <= MAX_PREFIX_LENGTH:
+                return [self.entries[key]['data'] for key in self._top(node)[:limit]]
+
+            # Длинный запрос: узел дерева даёт кандидатов, дальше сверяем полный текст
+            candidates = sorted(
+                (self.entries[key] for key in node.keys),
+                key=lambda entry: (-entry['score'], entry['search_text'])
+            )
+            results = []
+            for entry in candidates:
+                text = entry['search_text']
+                if any(text.startswith(prefix, start) for start in _word_starts(text)):
+                    results.append(entry['data'])
+                    if len(results) >= limit:
+                        break
+            return results
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def food_item_score(item):
+    """Популярность товара: отзывы, рейтинг и отметки витрины"""
+    score = float(item.review_count or 0) + float(item.rating or 0) * 10
+    if item.is_best_seller:
+        score += 50
+    if item.is_featured:
+        score += 25
+    return score
+
+
+def add_food_item(trie, item):
+    key = ('food', str(item.id))
+    if not item.is_active:
+        trie.remove(key)
+        return
+    trie.upsert(key, item.name, food_item_score(item), {
+        'type': 'food',
+        'id': str(item.id),
+        'text': item.name,
+        'url': reverse('food_detail', args=[item.id]),
+    })
+
+
+def add_category(trie, category, items_count):
+    key = ('category', str(category.id))
+    if not category.is_active:
+        trie.remove(key)
+        return
+    trie.upsert(key, category.name, float(items_count), {
+        'type': 'category',
+        'id': str(category.id),
+        'text': category.name,
+        'url': f"{reverse('food_list')}?category={category.id}",
+    })
+
+
+def add_manufacturer(trie, name, items_count):
+    key = ('manufacturer', normalize_text(name))
+    if not items_count:
+        trie.remove(key)
+        return
+    trie.upsert(key, name, float(items_count), {
+        'type': 'manufacturer',
+        'id': name,
+        'text': name,
+        'url': f"{reverse('food_list')}?{urlencode({'manufacturer': name})}",
+    })
+
+
+def _categories_with_counts():
+    from .models import FoodCategory
+
+    return FoodCategory.objects.annotate(
+        active_items=Count('items', filter=Q(items__is_active=True))
+    ).only('id', 'name', 'manufacturer', 'is_active')
+
+
+def _manufacturer_counts(names=None):
+    """{производитель: число активных товаров} по активным категориям"""
+    from .models import FoodCategory
+
+    queryset = FoodCategory.objects.filter(is_active=True)
+    if names is not None:
+        queryset = queryset.filter(manufacturer__in=names)
+    counts = {}
+    rows = queryset.values('manufacturer').annotate(
+        active_items=Count('items', filter=Q(items__is_active=True))
+    )
+    for row in rows:
+        name = (row['manufacturer'] or '').strip()
+        if name:
+            counts[name] = counts.get(name, 0) + row['active_items']
+    return counts
+
+
+def build_suggestion_trie():
+    """Полная сборка дерева: три запроса к базе"""
+    from .models import FoodItem
+
+    trie = SuggestionTrie()
+    items = FoodItem.objects.filter(is_active=True).only(
+        'id', 'name', 'rating', 'review_count', 'is_best_seller', 'is_featured', 'is_active'
+    )
+    for item in items.iterator():
+        add_food_item(trie, item)
+    for category in _categories_with_counts():
+        add_category(trie, category, category.active_items)
+    for name, count in _manufacturer_counts().items():
+        add_manufacturer(trie, name, count)
+    return trie
+
+
+_trie = None
+_trie_lock = threading.Lock()
+
+
+def get_suggestion_trie():
+    """Дерево строится один раз на процесс, дальше обновляется сигналами каталога.
+    Если каталог изменил другой воркер (поколение ушло вперёд), дерево собирается заново."""
+    global _trie
+    from .cache import get_catalog_generation
+
+    generation = get_catalog_generation()
+    trie = _trie
+    if trie is None or trie.generation != generation:
+        with _trie_lock:
+            if _trie is None or _trie.generation != generation:
+                _trie = build_suggestion_trie()
+                _trie.generation = generation
+            trie = _trie
+    return trie
+
+
+def follow_generation(generation):
+    """Поколение увеличено изменением, которое дерево этого процесса уже применило"""
+    trie = _trie
+    if trie is not None and trie.generation == generation - 1:
+        trie.generation = generation
+
+
+def is_loaded():
+    """Дерево уже построено в этом процессе (иначе обновлять нечего)"""
+    return _trie is not None
+
+
+def refresh_food_item(item):
+    """Обновить товар и популярность его категории и производителя"""
+    trie = _trie
+    if trie is None:
+        return
+    add_food_item(trie, item)
+    if item.category_id:
+        refresh_category(item.category_id)
+
+
+def remove_food_item(food_id, category_id=None):
+    trie = _trie
+    if trie is None:
+        return
+    trie.remove(('food', str(food_id)))
+    if category_id:
+        refresh_category(category_id)
+
+
+def refresh_category(category_id, old_manufacturer=None):
+    trie = _trie
+    if trie is None:
+        return
+    category = _categories_with_counts().filter(id=category_id).first()
+    if category is None:
+        trie.remove(('category', str(category_id)))
+    else:
+        add_category(trie, category, category.active_items)
+    refresh_manufacturers([name for name in (
+        category.manufacturer if category else None, old_manufacturer
+    ) if name])
+
+
+def remove_category(category_id, manufacturer=None):
+    trie = _trie
+    if trie is None:
+        return
+    trie.remove(('category', str(category_id)))
+    if manufacturer:
+        refresh_manufacturers([manufacturer])
+
+
+def refresh_manufacturers(names):
+    trie = _trie
+    if trie is None or not names:
+        return
+    counts = _manufacturer_counts(names)
+    for name in names:
+        add_manufacturer(trie, name.strip(), counts.get(name.strip(), 0))
+
+
+def invalidate_suggestion_trie():
+    global _trie
+    with _trie_lock:
+        _trie = None
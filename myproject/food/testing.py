@@ -0,0 +1,50 @@
+# food/testing.py - проверка числа SQL-запросов на эндпоинт
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+# Допустимое число запросов для эндпоинтов каталога (не зависит от числа товаров).
+# Для авторизованного пользователя добавляются запросы сессии и профиля.
+CATALOG_QUERY_BUDGETS = {
+    'food_list': 8,
+    'food_detail': 6,
+    'food_categories': 4,
+    'search_food': 7,
+    'filter_food': 6,
+    'suggest_food': 4,
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Эндпоинт выполнил больше запросов, чем разрешено"""
+
+
+@contextmanager
+def assert_max_queries(max_queries, using=DEFAULT_DB_ALIAS, label=''):
+    """with assert_max_queries(5): ... - падает со списком SQL, если запросов больше"""
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+
+    executed = len(context.captured_queries)
+    if executed > max_queries:
+        queries = '\n'.join(
+            f"{number}. {query['sql']}"
+            for number, query in enumerate(context.captured_queries, start=1)
+        )
+        raise QueryBudgetExceeded(
+            f"{label or 'Блок'}: выполнено {executed} запросов при лимите {max_queries}\n{queries}"
+        )
+
+
+def assert_endpoint_queries(client, url, max_queries=None, method='get', url_name=None, **kwargs):
+    """Запросить url тестовым клиентом и проверить лимит запросов; возвращает ответ.
+
+    Лимит можно не указывать, если передано имя маршрута из CATALOG_QUERY_BUDGETS.
+    """
+    if max_queries is None:
+        max_queries = CATALOG_QUERY_BUDGETS[url_name]
+    with assert_max_queries(max_queries, label=f"{method.upper()} {url}"):
+        response = getattr(client, method)(url, **kwargs)
+    return response
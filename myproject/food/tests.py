@@ -1,3 +1,963 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import ai_cache, suggest
+from .ai_cache import (DjangoCacheBackend, FileBackend, MemoryBackend, RecommendationCache,
+                       get_recommendation_cache, normalize_horse_params)
+from .cache import bump_catalog_generation, cached_catalog, get_catalog_generation
+from .chat_context import (SUMMARY_PREFIX, build_chat_context, estimate_tokens, message_tokens,
+                           save_chat_exchange)
+from .jobs import claim_job, claim_next_job, process_jobs, requeue_stale_jobs
+from .matcher import MAX_COUNTED_OCCURRENCES, AhoCorasick, ProductMatcher
+from .models import AIChatMessage, AIChatSession, AIConsultationJob, FoodCategory, FoodItem, FoodReview
+from .pagination import CursorError, KeysetPaginator
+from .queries import catalog_items, serialize_card
+from .search import backend_vendor
+from .services import AIChatError, IOIntelligenceService
+from .suggest import DEFAULT_LIMIT, MAX_PREFIX_LENGTH, SuggestionTrie, get_suggestion_trie
+from .testing import CATALOG_QUERY_BUDGETS, assert_endpoint_queries
+
+
+def add_chat_messages(session, contents):
+    """Сообщения сессии по порядку (чередуются вопрос и ответ), с гарантированно разным временем"""
+    start = timezone.now() - timedelta(minutes=len(contents))
+    messages = []
+    for index, content in enumerate(contents):
+        message = AIChatMessage.objects.create(
+            session=session, role='user' if index % 2 == 0 else 'assistant', content=content
+        )
+        AIChatMessage.objects.filter(pk=message.pk).update(created_at=start + timedelta(minutes=index))
+        messages.append(message)
+    return messages
+
+
+class ChatContextTests(TestCase):
+    """Контекст чата под бюджет токенов и краткое содержание сессии"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('rider', password='pass')
+        self.session = AIChatSession.objects.create(user=self.user, horse_data={'breed': 'orlov'})
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(''), 0)
+        self.assertEqual(estimate_tokens('hay'), 1)
+        self.assertEqual(estimate_tokens('oats'), 1)
+        # Кириллица - примерно три символа на токен, знаки препинания отдельно
+        self.assertEqual(estimate_tokens('сено'), 2)
+        self.assertEqual(estimate_tokens('сено, овёс!'), 6)
+        self.assertEqual(message_tokens({'content': 'hay'}), 5)
+
+    @override_settings(AI_CHAT_SUMMARY_ENABLED=False, AI_CHAT_HISTORY_MESSAGES=20)
+    def test_context_fits_budget_and_keeps_newest(self):
+        contents = [f'сообщение номер {index} ' + 'слово ' * 10 for index in range(10)]
+        add_chat_messages(self.session, contents)
+
+        budget = 100
+        context = build_chat_context(self.session, 'новый вопрос', budget=budget)
+
+        self.assertLessEqual(sum(message_tokens(message) for message in context), budget)
+        self.assertEqual(context[-1], {'role': 'user', 'content': 'новый вопрос'})
+        history = [message['content'] for message in context[:-1]]
+        self.assertTrue(history)
+        # В контекст попадает хвост диалога в хронологическом порядке
+        self.assertEqual(history, contents[-len(history):])
+
+    @override_settings(AI_CHAT_SUMMARY_ENABLED=False, AI_CHAT_HISTORY_MESSAGES=4)
+    def test_context_limited_by_message_count(self):
+        add_chat_messages(self.session, [f'вопрос {index}' for index in range(8)])
+
+        context = build_chat_context(self.session, 'новый вопрос', budget=10000)
+
+        self.assertEqual(len(context), 4)
+        self.assertEqual([message['content'] for message in context[:-1]],
+                         ['вопрос 5', 'вопрос 6', 'вопрос 7'])
+
+    @override_settings(AI_CHAT_SUMMARY_ENABLED=True, AI_CHAT_HISTORY_MESSAGES=3, AI_CHAT_SUMMARY_TOKENS=300)
+    def test_dropped_messages_go_to_summary(self):
+        add_chat_messages(self.session, ['Чем кормить? Подробно.', 'Сеном и овсом.', 'А сколько?', 'Восемь кг.'])
+
+        context = build_chat_context(self.session, 'А витамины?', budget=1000)
+
+        self.assertEqual(context[0]['role'], 'system')
+        self.assertTrue(context[0]['content'].startswith(SUMMARY_PREFIX))
+        self.assertIn('Пользователь: Чем кормить?', context[0]['content'])
+        self.assertIn('ИИ: Сеном и овсом.', context[0]['content'])
+        self.assertNotIn('Подробно', context[0]['content'])
+        self.assertEqual([message['content'] for message in context[1:]], ['А сколько?', 'Восемь кг.', 'А витамины?'])
+
+        self.session.refresh_from_db()
+        summary = self.session.summary
+        self.assertEqual(summary.count('\n'), 1)
+
+        # Повторная сборка не дописывает уже учтённые сообщения
+        build_chat_context(self.session, 'А витамины?', budget=1000)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary, summary)
+
+    @override_settings(AI_CHAT_SUMMARY_ENABLED=True, AI_CHAT_HISTORY_MESSAGES=20, AI_CHAT_SUMMARY_TOKENS=300)
+    def test_summary_is_counted_in_budget(self):
+        self.session.summary = 'Пользователь: ' + 'слово ' * 30
+        self.session.summary_until = timezone.now() - timedelta(days=1)
+        add_chat_messages(self.session, ['слово ' * 10 for _ in range(6)])
+
+        budget = 150
+        context = build_chat_context(self.session, 'вопрос', budget=budget)
+
+        self.assertEqual(context[0]['role'], 'system')
+        self.assertLessEqual(sum(message_tokens(message) for message in context), budget)
+
+    def test_save_chat_exchange(self):
+        user_message, ai_message = save_chat_exchange(self.session, 'вопрос', 'ответ')
+        self.assertEqual((user_message.role, ai_message.role), ('user', 'assistant'))
+
+        # Без ответа сохраняется только вопрос
+        self.assertEqual(len(save_chat_exchange(self.session, 'вопрос без ответа', '')), 1)
+        self.assertEqual(AIChatMessage.objects.filter(session=self.session).count(), 3)
+
+
+@override_settings(AI_CHAT_SUMMARY_ENABLED=True, AI_CHAT_HISTORY_MESSAGES=3)
+class ChatMessageViewTests(TestCase):
+    """Сообщение в чат: модели уходит собранный контекст в обоих режимах"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('rider', password='pass')
+        self.client.force_login(self.user)
+        self.session = AIChatSession.objects.create(user=self.user, horse_data={'breed': 'orlov'})
+        add_chat_messages(self.session, ['Чем кормить?', 'Сеном и овсом.', 'А сколько?', 'Восемь кг.'])
+        self.ai_service = mock.Mock()
+        patcher = mock.patch('food.views.get_ai_service', return_value=self.ai_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_message(self, **extra):
+        return self.client.post(
+            reverse('ai_chat_message'),
+            data=json.dumps({'message': 'А витамины?', 'session_id': str(self.session.id), **extra}),
+            content_type='application/json',
+        )
+
+    def assert_context_sent(self, history):
+        self.assertEqual(history[0]['role'], 'system')
+        self.assertIn('Чем кормить?', history[0]['content'])
+        self.assertEqual(history[-1], {'role': 'user', 'content': 'А витамины?'})
+
+    def test_non_stream_sends_context_without_recommendation_cache(self):
+        self.ai_service.chat_reply.return_value = 'Добавьте минеральную подкормку.'
+
+        response = self.post_message()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['response'], 'Добавьте минеральную подкормку.')
+        self.ai_service.get_food_recommendation.assert_not_called()
+        history, horse_data = self.ai_service.chat_reply.call_args.args
+        self.assert_context_sent(history)
+        self.assertEqual(horse_data, {'breed': 'orlov'})
+        self.assertTrue(AIChatMessage.objects.filter(
+            session=self.session, role='assistant', content='Добавьте минеральную подкормку.'
+        ).exists())
+
+    def test_stream_sends_context(self):
+        self.ai_service.stream_chat_reply.return_value = iter(['Добавьте ', 'подкормку.'])
+
+        response = self.post_message(stream=True)
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertIn('event: done', body)
+        history, _ = self.ai_service.stream_chat_reply.call_args.args
+        self.assert_context_sent(history)
+        self.assertTrue(AIChatMessage.objects.filter(
+            session=self.session, role='assistant', content='Добавьте подкормку.'
+        ).exists())
+
+    def assert_nothing_saved(self):
+        self.assertEqual(AIChatMessage.objects.filter(session=self.session).count(), 4)
+
+    def stream_events(self, response):
+        body = b''.join(response.streaming_content).decode()
+        events = []
+        for chunk in filter(None, body.split('\n\n')):
+            lines = dict(line.split(': ', 1) for line in chunk.split('\n'))
+            events.append((lines.get('event', 'message'), json.loads(lines['data'])))
+        return events
+
+    def test_stream_error_saves_nothing(self):
+        def broken_stream(history, horse_data):
+            yield 'Добавьте '
+            raise RuntimeError('обрыв соединения')
+        self.ai_service.stream_chat_reply.side_effect = broken_stream
+
+        response = self.post_message(stream=True)
+        with self.assertLogs('food.views', level='ERROR'):
+            events = self.stream_events(response)
+
+        self.assertEqual([name for name, _ in events], ['message', 'error', 'done'])
+        self.assertEqual(events[-1][1], {'success': False, 'message_id': None})
+        self.assert_nothing_saved()
+
+    def test_stream_api_error_is_error_event(self):
+        def failing_stream(history, horse_data):
+            raise AIChatError('ИИ-консультант временно недоступен')
+            yield
+        self.ai_service.stream_chat_reply.side_effect = failing_stream
+
+        response = self.post_message(stream=True)
+        with self.assertLogs('food.views', level='WARNING'):
+            events = self.stream_events(response)
+
+        self.assertEqual(events, [
+            ('error', {'success': False, 'message': 'ИИ-консультант временно недоступен'}),
+            ('done', {'success': False, 'message_id': None}),
+        ])
+        self.assert_nothing_saved()
+
+    def test_non_stream_api_error_saves_nothing(self):
+        self.ai_service.chat_reply.side_effect = AIChatError('ИИ-консультант временно недоступен')
+
+        response = self.post_message()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {'success': False, 'message': 'ИИ-консультант временно недоступен'})
+        self.assert_nothing_saved()
+
+
+class ChatServiceErrorTests(SimpleTestCase):
+    """Ошибки IO Intelligence в чате - AIChatError, а не текст ответа"""
+
+    def setUp(self):
+        self.client = mock.Mock()
+        self.service = IOIntelligenceService(client=self.client)
+        self.service.api_key = 'key'
+        self.history = [{'role': 'user', 'content': 'Чем кормить?'}]
+
+    def response(self, status_code=200, json_data=None, lines=()):
+        response = mock.Mock(status_code=status_code)
+        response.json.return_value = json_data
+        if isinstance(json_data, Exception):
+            response.json.side_effect = json_data
+        response.iter_lines.return_value = [line.encode() for line in lines]
+        return response
+
+    def stream(self, response):
+        self.client.stream.return_value.__enter__ = mock.Mock(return_value=response)
+        self.client.stream.return_value.__exit__ = mock.Mock(return_value=False)
+        return list(self.service.stream_chat_reply(self.history, {}))
+
+    def test_chat_reply(self):
+        self.client.post.return_value = self.response(json_data={'choices': [{'message': {'content': 'Сено.'}}]})
+        self.assertEqual(self.service.chat_reply(self.history, {}), 'Сено.')
+
+    def test_chat_reply_errors(self):
+        failures = {
+            'status': self.response(status_code=500),
+            'rate limit': self.response(status_code=429),
+            'malformed json': self.response(json_data=ValueError('Expecting value')),
+            'missing choices': self.response(json_data={'error': 'overloaded'}),
+            'empty choices': self.response(json_data={'choices': []}),
+            'connection': requests.exceptions.ConnectionError('refused'),
+            'timeout': requests.exceptions.ReadTimeout('slow'),
+            'other request error': requests.exceptions.TooManyRedirects('loop'),
+        }
+        for name, outcome in failures.items():
+            with self.subTest(name):
+                if isinstance(outcome, Exception):
+                    self.client.post.side_effect = outcome
+                else:
+                    self.client.post.side_effect = None
+                    self.client.post.return_value = outcome
+                with self.assertRaises(AIChatError):
+                    self.service.chat_reply(self.history, {})
+
+    def test_stream_chat_reply(self):
+        tokens = self.stream(self.response(lines=[
+            'data: {"choices": [{"delta": {"content": "Сено "}}]}',
+            ': keep-alive',
+            'data: {"choices": [{"delta": {"content": "и овёс."}}]}',
+            'data: [DONE]',
+        ]))
+        self.assertEqual(tokens, ['Сено ', 'и овёс.'])
+
+    def test_stream_chat_reply_errors(self):
+        with self.assertRaises(AIChatError):
+            self.stream(self.response(status_code=502))
+
+        broken = self.response(lines=['data: {"choices": [{"delta": {"content": "Сено "}}]}'])
+        broken.iter_lines.side_effect = requests.exceptions.ChunkedEncodingError('обрыв')
+        with self.assertRaises(AIChatError):
+            self.stream(broken)
+
+        self.client.stream.side_effect = requests.exceptions.ConnectionError('refused')
+        with self.assertRaises(AIChatError):
+            list(self.service.stream_chat_reply(self.history, {}))
+
+
+
+HORSE = dict(breed='Orlov', age=7, weight=520, purpose='Sport', budget='15000', activity_level='high')
+
+
+class RecommendationCacheTests(SimpleTestCase):
+    """Кэш рекомендаций ИИ: нормализация ключа, выбор бэкенда, счётчики попаданий"""
+
+    def setUp(self):
+        self.cache = RecommendationCache(MemoryBackend(max_entries=10), timeout=60)
+
+    def test_key_normalization(self):
+        self.assertEqual(
+            normalize_horse_params(**HORSE), ('orlov', 'adult', '500', 'sport', '15000', 'high')
+        )
+        # Возраст по группам, вес по корзинам в 50 кг, бюджет по 1000 руб., регистр и пробелы
+        similar = dict(breed=' ORLOV ', age='14', weight='549.9', purpose='sport', budget=15999,
+                       activity_level='High')
+        self.assertEqual(normalize_horse_params(**similar), normalize_horse_params(**HORSE))
+
+        self.assertEqual(normalize_horse_params(**{**HORSE, 'weight': 550})[2], '550')
+        self.assertEqual(normalize_horse_params(**{**HORSE, 'age': 15})[1], 'senior')
+        self.assertEqual(
+            [normalize_horse_params(**{**HORSE, 'age': age})[1] for age in (0, 2, 3, 4, 5, 19, 20, 'старый')],
+            ['foal', 'foal', 'young', 'young', 'adult', 'senior', 'geriatric', 'unknown'],
+        )
+        self.assertEqual(normalize_horse_params(None, None, None, None, 'low')[1:3], ('unknown', 'unknown'))
+
+    def test_hits_and_misses(self):
+        self.assertIsNone(self.cache.get(**HORSE))
+        self.cache.set('Сено и овёс', **HORSE)
+        self.assertEqual(self.cache.get(**{**HORSE, 'weight': 510}), 'Сено и овёс')
+        self.assertIsNone(self.cache.get(**{**HORSE, 'weight': 560}))
+
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 2, 'hit_rate': 0.333})
+        self.cache.clear()
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 0, 'hit_rate': 0.0})
+        self.assertIsNone(self.cache.get(**HORSE))
+
+    def test_memory_backend_expiry_and_lru(self):
+        backend = MemoryBackend(max_entries=2)
+        backend.set('a', 1, 60)
+        backend.set('b', 2, 60)
+        backend.get('a')
+        backend.set('c', 3, 60)
+        self.assertEqual((backend.get('a'), backend.get('b'), backend.get('c')), (1, None, 3))
+
+        backend.set('old', 4, -1)
+        self.assertIsNone(backend.get('old'))
+
+    def test_backend_errors_count_as_miss(self):
+        backend = mock.Mock()
+        backend.get.side_effect = ConnectionError('redis недоступен')
+        backend.set.side_effect = ConnectionError('redis недоступен')
+        cache = RecommendationCache(backend)
+
+        cache.set('Сено', **HORSE)
+        self.assertIsNone(cache.get(**HORSE))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_backend_selection(self):
+        configs = {
+            'memory': MemoryBackend,
+            'django': DjangoCacheBackend,
+            'file': FileBackend,
+        }
+        for name, backend_class in configs.items():
+            with self.subTest(name), mock.patch.object(ai_cache, '_cache', None), \
+                    self.settings(AI_RECOMMENDATION_CACHE={'BACKEND': name, 'TIMEOUT': 30, 'MAX_ENTRIES': 7}):
+                cache = get_recommendation_cache()
+                self.assertIsInstance(cache.backend, backend_class)
+                self.assertEqual(cache.timeout, 30)
+                self.assertIs(get_recommendation_cache(), cache)
+
+        with mock.patch.object(ai_cache, '_cache', None), \
+                self.settings(AI_RECOMMENDATION_CACHE={'ENABLED': False}):
+            self.assertIsNone(get_recommendation_cache())
+
+    def test_similar_horse_is_served_from_cache(self):
+        client = mock.Mock()
+        client.post.return_value = mock.Mock(
+            status_code=200, json=mock.Mock(return_value={'choices': [{'message': {'content': 'Сено.'}}]})
+        )
+        service = IOIntelligenceService(client=client)
+        service.api_key = 'key'
+
+        with mock.patch.object(ai_cache, '_cache', self.cache):
+            first = service.get_food_recommendation(**HORSE)
+            second = service.get_food_recommendation(**{**HORSE, 'age': 9, 'weight': 540})
+
+        self.assertEqual((first, second), ('Сено.', 'Сено.'))
+        self.assertEqual(client.post.call_count, 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+
+class TierPriceTests(TestCase):
+    """Цена по уровню подписки: FoodItem.get_price_for_user и аннотация user_price каталога"""
+
+    def setUp(self):
+        self.item = FoodItem.objects.create(
+            name='Овёс плющеный', base_price=Decimal('1000'), premium_price=Decimal('900'),
+            pro_price=Decimal('750'), stock=5,
+        )
+
+    def create_user(self, username, subscription='free', active=False):
+        user = User.objects.create_user(username, password='pass')
+        profile = user.profile
+        profile.subscription = subscription
+        profile.subscription_active = active
+        profile.save()
+        return User.objects.get(pk=user.pk)
+
+    def test_price_for_each_tier(self):
+        cases = {
+            'free': (self.create_user('free'), Decimal('1000')),
+            'premium': (self.create_user('premium', 'premium', True), Decimal('900')),
+            'pro': (self.create_user('pro', 'pro', True), Decimal('750')),
+            'expired pro': (self.create_user('expired', 'pro', False), Decimal('1000')),
+            'anonymous': (AnonymousUser(), Decimal('1000')),
+        }
+        for name, (user, expected) in cases.items():
+            with self.subTest(name):
+                self.assertEqual(self.item.get_price_for_user(user), expected)
+
+    def test_catalog_annotation_matches_model_price(self):
+        for tier, discount in (('', 0), ('premium', 10), ('pro', 25)):
+            with self.subTest(tier=tier or 'free'):
+                item = catalog_items(tier=tier).get(pk=self.item.pk)
+                self.assertEqual(item.user_price, self.item.get_price_for_tier(tier))
+                self.assertEqual(item.user_discount, discount)
+                with self.assertNumQueries(0):
+                    card = serialize_card(item, AnonymousUser(), detailed=True)
+                self.assertEqual((card['price'], card['user_discount']), (float(item.user_price), discount))
+
+class SearchBackendTests(TestCase):
+    def test_fts5_check_runs_once(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 используется только на SQLite')
+        vendor = backend_vendor()
+        with self.assertNumQueries(0):
+            self.assertEqual(backend_vendor(), vendor)
+
+
+class FoodSearchTests(TestCase):
+    """Полнотекстовый поиск search_food: ё в запросе и документе, пагинация без потолка"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('rider', password='pass')
+        self.client.force_login(self.user)
+        self.category = FoodCategory.objects.create(name='Зерновые')
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('search_food'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def found_names(self, query):
+        return {item['name'] for item in self.search(query)['items']}
+
+    def test_yo_matches_e_in_both_directions(self):
+        FoodItem.objects.create(name='Овёс плющеный', category=self.category, stock=1)
+        FoodItem.objects.create(name='Овес цельный', category=self.category, stock=1)
+        FoodItem.objects.create(name='Сено луговое', short_description='Ещё мягкое', category=self.category, stock=1)
+
+        expected = {'Овёс плющеный', 'Овес цельный'}
+        self.assertEqual(self.found_names('овёс'), expected)
+        self.assertEqual(self.found_names('ОВЕС'), expected)
+        self.assertEqual(self.found_names('еще мягкое'), {'Сено луговое'})
+
+    def test_name_match_ranks_above_description_match(self):
+        FoodItem.objects.create(name='Мюсли', short_description='Овёс и ячмень', category=self.category,
+                                stock=1)
+        FoodItem.objects.create(name='Овёс', category=self.category, stock=1)
+
+        names = [item['name'] for item in self.search('овёс')['items']]
+        self.assertEqual(names, ['Овёс', 'Мюсли'])
+
+    def test_pages_cover_all_matches(self):
+        for index in range(25):
+            FoodItem.objects.create(name=f'Овёс {index}', category=self.category, stock=1)
+        FoodItem.objects.create(name='Сено', category=self.category, stock=1)
+
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size': 10, **({'cursor': cursor} if cursor else {})}
+            data = self.search('овес', **params)
+            seen.extend(item['id'] for item in data['items'])
+            cursor = data['next_cursor']
+            if not data['has_next']:
+                break
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertIsNone(cursor)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+)
+class CatalogQueryBudgetTests(TestCase):
+    """Число запросов эндпоинтов каталога не превышает CATALOG_QUERY_BUDGETS и не растёт с числом товаров"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('rider', password='pass')
+        reviewer = User.objects.create_user('reviewer', password='pass')
+        cls.categories = [
+            FoodCategory.objects.create(name='Комбикорма', manufacturer='Конный двор'),
+            FoodCategory.objects.create(name='Витамины', manufacturer='Здоровая лошадь'),
+        ]
+        cls.items = []
+        for index in range(12):
+            item = FoodItem.objects.create(
+                name=f'Овёс плющеный {index}', short_description='Овёс для спортивных лошадей',
+                category=cls.categories[index % 2], stock=index, is_best_seller=index % 3 == 0,
+                is_featured=index % 4 == 0,
+            )
+            FoodReview.objects.create(food=item, user=reviewer, rating=4, comment='Хороший корм')
+            cls.items.append(item)
+
+    def setUp(self):
+        cache.clear()
+        # Публичные страницы каталога проверяются анонимно, поиск и фильтр требуют входа
+        self.user_client = self.client_class()
+        self.user_client.force_login(self.user)
+
+    def add_items(self, count):
+        for index in range(count):
+            FoodItem.objects.create(name=f'Сено луговое {index}', category=self.categories[0], stock=1)
+        cache.clear()
+
+    def request_endpoint(self, url_name):
+        """Запрос к эндпоинту каталога с холодным кэшем"""
+        cache.clear()
+        if url_name == 'food_list':
+            return assert_endpoint_queries(self.client, reverse('food_list'), url_name=url_name)
+        if url_name == 'food_detail':
+            url = reverse('food_detail', args=[self.items[0].id])
+            return assert_endpoint_queries(self.client, url, url_name=url_name)
+        if url_name == 'food_categories':
+            return assert_endpoint_queries(self.client, reverse('food_categories'), url_name=url_name)
+        if url_name == 'search_food':
+            return assert_endpoint_queries(
+                self.user_client, reverse('search_food'), url_name=url_name, data={'q': 'овёс'}
+            )
+        if url_name == 'filter_food':
+            return assert_endpoint_queries(
+                self.user_client, reverse('filter_food'), method='post', url_name=url_name,
+                data=json.dumps({'category_id': str(self.categories[0].id), 'in_stock': True}),
+                content_type='application/json',
+            )
+        return assert_endpoint_queries(
+            self.client, reverse('suggest_food'), url_name=url_name, data={'q': 'ов'}
+        )
+
+    def test_endpoints_within_budget(self):
+        for url_name in CATALOG_QUERY_BUDGETS:
+            with self.subTest(url_name=url_name):
+                response = self.request_endpoint(url_name)
+                self.assertEqual(response.status_code, 200)
+                if url_name in ('search_food', 'filter_food'):
+                    self.assertTrue(response.json()['items'])
+
+    def test_queries_do_not_grow_with_items(self):
+        counts = {}
+        for url_name in CATALOG_QUERY_BUDGETS:
+            with CaptureQueriesContext(connection) as context:
+                self.request_endpoint(url_name)
+            counts[url_name] = len(context.captured_queries)
+
+        self.add_items(10)
+        for url_name, expected in counts.items():
+            with self.subTest(url_name=url_name):
+                with CaptureQueriesContext(connection) as context:
+                    self.request_endpoint(url_name)
+                self.assertEqual(len(context.captured_queries), expected)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+)
+class CatalogCacheTests(TestCase):
+    """Кэш каталога по поколениям: изменение товара после коммита делает старые ключи нечитаемыми"""
+
+    def setUp(self):
+        cache.clear()
+        self.category = FoodCategory.objects.create(name='Зерновые')
+        self.item = FoodItem.objects.create(name='Овёс плющеный', category=self.category, stock=5)
+        self.url = reverse('food_list')
+
+    def test_warm_anonymous_catalog_runs_no_sql(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Овёс плющеный')
+
+    def test_cached_catalog_builds_once_per_generation(self):
+        builder = mock.Mock(return_value=['Овёс'])
+        self.assertEqual(cached_catalog('block', builder, 'a'), ['Овёс'])
+        self.assertEqual(cached_catalog('block', builder, 'a'), ['Овёс'])
+        cached_catalog('block', builder, 'b')
+        self.assertEqual(builder.call_count, 2)
+
+        bump_catalog_generation()
+        cached_catalog('block', builder, 'a')
+        self.assertEqual(builder.call_count, 3)
+
+    def test_save_bumps_generation_on_commit(self):
+        self.client.get(self.url)
+        generation = get_catalog_generation()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.item.name = 'Овёс отборный'
+            self.item.save()
+            # До коммита поколение прежнее: параллельный запрос не закэширует незакоммиченные данные
+            self.assertEqual(get_catalog_generation(), generation)
+        for callback in callbacks:
+            callback()
+
+        self.assertGreater(get_catalog_generation(), generation)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Овёс отборный')
+        self.assertNotContains(response, 'Овёс плющеный')
+
+    def test_review_and_delete_bump_generation(self):
+        reviewer = User.objects.create_user('reviewer', password='pass')
+        for change in (
+            lambda: FoodReview.objects.create(food=self.item, user=reviewer, rating=5, comment='Хорошо'),
+            self.item.delete,
+        ):
+            generation = get_catalog_generation()
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertGreater(get_catalog_generation(), generation)
+        self.assertNotContains(self.client.get(self.url), 'Овёс плющеный')
+
+
+class KeysetPaginatorTests(TestCase):
+    """Курсорная пагинация: полный обход без пропусков и проверка подписи сортировки"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Одинаковые рейтинги: порядок внутри них задаёт только id
+        for index in range(11):
+            FoodItem.objects.create(name=f'Корм {index}', rating=index % 3, review_count=index % 2)
+
+    def walk(self, paginator, queryset, page_size):
+        items, cursor = [], None
+        while True:
+            page = paginator.paginate(queryset, cursor=cursor, page_size=page_size)
+            items.extend(page)
+            if not page.has_next:
+                return items
+            cursor = page.next_cursor
+
+    def test_walk_matches_full_ordering(self):
+        ordering = ('-rating', 'review_count', '-id')
+        paginator = KeysetPaginator(ordering)
+        queryset = FoodItem.objects.all()
+
+        expected = list(queryset.order_by(*ordering).values_list('id', flat=True))
+        for page_size in (1, 4, 11, 20):
+            with self.subTest(page_size=page_size):
+                walked = [item.id for item in self.walk(paginator, queryset, page_size)]
+                self.assertEqual(walked, expected)
+
+    def test_values_rows_and_objects_give_same_cursor(self):
+        paginator = KeysetPaginator(('-created_at', '-id'))
+        item = FoodItem.objects.order_by('-created_at', '-id').first()
+        row = FoodItem.objects.filter(pk=item.pk).values('created_at', 'id').get()
+        self.assertEqual(paginator.encode_cursor(item), paginator.encode_cursor(row))
+
+    def test_cursor_from_other_ordering_is_rejected(self):
+        by_rating = KeysetPaginator(('-rating', '-id'))
+        by_date = KeysetPaginator(('-created_at', '-id'))
+        cursor = by_rating.paginate(FoodItem.objects.all(), page_size=2).next_cursor
+
+        with self.assertRaisesMessage(CursorError, 'другой сортировке'):
+            by_date.paginate(FoodItem.objects.all(), cursor=cursor)
+
+    def test_damaged_cursor_is_rejected(self):
+        paginator = KeysetPaginator(('-rating', '-id'))
+        cursor = paginator.paginate(FoodItem.objects.all(), page_size=2).next_cursor
+        bad_value = paginator.encode_cursor({'rating': 'не число', 'id': 'не uuid'})
+
+        for value in ('мусор', cursor[:-3], bad_value):
+            with self.subTest(cursor=value):
+                with self.assertRaises(CursorError):
+                    paginator.paginate(FoodItem.objects.all(), cursor=value)
+
+
+class ConsultationQueueTests(TestCase):
+    """Очередь консультаций: задачу забирает ровно один воркер"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('rider', password='pass')
+
+    def create_job(self, **fields):
+        return AIConsultationJob.objects.create(user=self.user, payload={'breed': 'orlov'}, **fields)
+
+    def test_job_is_claimed_once(self):
+        job = self.create_job()
+
+        # Оба воркера увидели задачу в очереди, но условный UPDATE пропускает только первого
+        first = claim_job(job.id)
+        second = claim_job(job.id)
+
+        self.assertIsNotNone(first)
+        self.assertIsNone(second)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('running', 1))
+        self.assertIsNotNone(job.started_at)
+
+    def test_claim_next_job_is_fifo_and_skips_taken(self):
+        jobs = [self.create_job() for _ in range(3)]
+        claim_job(jobs[0].id)
+
+        self.assertEqual(claim_next_job().id, jobs[1].id)
+        self.assertEqual(claim_next_job().id, jobs[2].id)
+        self.assertIsNone(claim_next_job())
+
+    @override_settings(AI_JOBS_STALE_SECONDS=60, AI_JOBS_MAX_ATTEMPTS=2)
+    def test_stale_jobs_are_requeued_or_failed(self):
+        started_at = timezone.now() - timedelta(minutes=5)
+        retry = self.create_job(status='running', attempts=1, started_at=started_at)
+        exhausted = self.create_job(status='running', attempts=2, started_at=started_at)
+        fresh = self.create_job(status='running', attempts=1, started_at=timezone.now())
+
+        self.assertEqual(requeue_stale_jobs(), (1, 1))
+
+        statuses = dict(AIConsultationJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[retry.id], 'pending')
+        self.assertEqual(statuses[exhausted.id], 'failed')
+        self.assertEqual(statuses[fresh.id], 'running')
+        # Возвращённую задачу снова можно забрать
+        self.assertEqual(claim_job(retry.id).attempts, 2)
+
+    @override_settings(AI_JOBS_MAX_ATTEMPTS=3, AI_JOBS_RETRY_BASE_SECONDS=30)
+    def test_failed_job_is_retried_with_backoff(self):
+        job = AIConsultationJob.objects.create(user=self.user, payload={
+            'breed': 'orlov', 'age': 8, 'weight': 500, 'purpose': 'walk', 'budget': '10000',
+        })
+        ai_service = mock.Mock()
+        ai_service.get_food_recommendation.side_effect = requests.exceptions.ConnectionError('refused')
+
+        with mock.patch('food.jobs.get_ai_service', return_value=ai_service), \
+                mock.patch('builtins.print'):
+            for attempt in (1, 2):
+                before = timezone.now()
+                self.assertEqual(process_jobs(), 1)
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.attempts, job.error), ('pending', attempt, 'refused'))
+                delay = timedelta(seconds=30 * 2 ** (attempt - 1))
+                self.assertTrue(before + delay <= job.next_attempt_at <= timezone.now() + delay)
+
+                # До срока задача не забирается - воркер не крутит её вхолостую
+                self.assertIsNone(claim_next_job())
+                AIConsultationJob.objects.filter(pk=job.pk).update(next_attempt_at=timezone.now())
+
+            self.assertEqual(process_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(ai_service.get_food_recommendation.call_count, 3)
+
+
+def catalog_entry(name, category=None, short_description='', description='', is_featured=False, rating=0):
+    """Товар для индекса без базы: ProductMatcher читает только эти атрибуты"""
+    return SimpleNamespace(
+        id=name, name=name, short_description=short_description, description=description,
+        category_id=category, category=SimpleNamespace(name=category) if category else None,
+        is_featured=is_featured, rating=rating,
+    )
+
+
+class AhoCorasickTests(SimpleTestCase):
+    def test_finds_all_overlapping_patterns(self):
+        automaton = AhoCorasick()
+        for pattern in ('he', 'she', 'his', 'hers'):
+            automaton.add(pattern, pattern)
+
+        matches = sorted(automaton.iter_matches('ushers'))
+
+        self.assertEqual(matches, [(1, 'she'), (2, 'he'), (2, 'hers')])
+
+    def test_matches_equal_naive_search(self):
+        patterns = ['овес', 'овса', 'сено', 'сенаж', 'ено', 'а', 'аж']
+        text = 'сенаж и сено, немного овса; овес ежедневно'
+        automaton = AhoCorasick()
+        for pattern in patterns:
+            automaton.add(pattern, pattern)
+
+        expected = sorted(
+            (start, pattern)
+            for pattern in patterns
+            for start in range(len(text))
+            if text.startswith(pattern, start)
+        )
+        self.assertEqual(sorted(automaton.iter_matches(text)), expected)
+
+    def test_patterns_added_after_build(self):
+        automaton = AhoCorasick()
+        automaton.add('соль', 1)
+        self.assertEqual(list(automaton.iter_matches('лизун соль')), [(6, 1)])
+
+        automaton.add('лизун', 2)
+        self.assertEqual(list(automaton.iter_matches('лизун соль')), [(0, 2), (6, 1)])
+
+    def test_rebuild_does_not_duplicate_outputs(self):
+        automaton = AhoCorasick()
+        automaton.add('she', 'she')
+        automaton.add('he', 'he')
+        self.assertEqual(list(automaton.iter_matches('she')), [(0, 'she'), (1, 'he')])
+
+        for pattern in ('hers', 'his'):
+            automaton.add(pattern, pattern)
+            self.assertEqual(list(automaton.iter_matches('she')), [(0, 'she'), (1, 'he')])
+
+
+class ProductMatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.matcher = ProductMatcher([
+            catalog_entry('Овёс плющеный', category='Зерновые', short_description='Овес для спорта'),
+            catalog_entry('Соль-лизун', category='Минералы'),
+            catalog_entry('Сено луговое', category='Грубые корма', is_featured=True),
+            catalog_entry('Сенаж люцерновый', category='Грубые корма'),
+        ])
+
+    def test_full_name_ranks_first(self):
+        ranked = self.matcher.rank('Рекомендую сенаж люцерновый и немного сена.')
+        self.assertEqual(ranked[0], 'Сенаж люцерновый')
+        self.assertIn('Сено луговое', ranked)
+
+    def test_yo_is_normalized(self):
+        self.assertEqual(self.matcher.rank('Давайте овёс плющеный')[0], 'Овёс плющеный')
+
+    def test_match_starts_at_word_boundary(self):
+        self.assertNotIn('Соль-лизун', self.matcher.rank('Добавьте фасоль в рацион'))
+        self.assertIn('Соль-лизун', self.matcher.rank('Добавьте соль в рацион'))
+
+    def test_repeated_mentions_are_capped(self):
+        matcher = ProductMatcher([catalog_entry('Жмых'), catalog_entry('Кукуруза')])
+        # Без ограничения десять упоминаний жмыха перевесили бы три упоминания кукурузы
+        text = ' '.join(['жмых'] * 10 + ['кукуруза'] * MAX_COUNTED_OCCURRENCES)
+        self.assertEqual(matcher.rank(text), ['Кукуруза', 'Жмых'])
+
+    def test_limit_and_unknown_text(self):
+        self.assertEqual(self.matcher.rank('Ничего подходящего здесь нет'), [])
+        self.assertEqual(len(self.matcher.rank('овес, сено, сенаж, соль', limit=2)), 2)
+
+
+def suggestion_texts(trie, prefix, limit=DEFAULT_LIMIT):
+    return [entry['text'] for entry in trie.search(prefix, limit=limit)]
+
+
+class SuggestionTrieTests(SimpleTestCase):
+    """Дерево подсказок: top-k в узлах, обновление и удаление записей"""
+
+    def setUp(self):
+        self.trie = SuggestionTrie(top_k=3)
+
+    def add(self, key, text, score):
+        self.trie.upsert(key, text, score, {'text': text})
+
+    def test_ranking_by_score_in_every_node(self):
+        self.add(1, 'Сено луговое', 10)
+        self.add(2, 'Сенаж', 30)
+        self.add(3, 'Овёс плющеный', 20)
+        self.add(4, 'Семена льна', 5)
+        self.add(5, 'Сено тимофеевки', 10)
+
+        self.assertEqual(suggestion_texts(self.trie, 'се'), ['Сенаж', 'Сено луговое', 'Сено тимофеевки'])
+        self.assertEqual(suggestion_texts(self.trie, 'сено'), ['Сено луговое', 'Сено тимофеевки'])
+        self.assertEqual(suggestion_texts(self.trie, 'се', limit=1), ['Сенаж'])
+        # Любое слово, регистр и ё не важны
+        self.assertEqual(suggestion_texts(self.trie, 'ПЛЮЩ'), ['Овёс плющеный'])
+        self.assertEqual(suggestion_texts(self.trie, 'овес'), ['Овёс плющеный'])
+        self.assertEqual(suggestion_texts(self.trie, 'енаж'), [])
+
+    def test_score_change_resets_cached_top(self):
+        self.add(1, 'Сено луговое', 10)
+        self.add(2, 'Сенаж', 30)
+        self.assertEqual(suggestion_texts(self.trie, 'сен'), ['Сенаж', 'Сено луговое'])
+
+        self.add(1, 'Сено луговое', 50)
+
+        self.assertEqual(suggestion_texts(self.trie, 'сен'), ['Сено луговое', 'Сенаж'])
+
+    def test_rename_and_remove_drop_old_prefixes(self):
+        self.add(1, 'Сено луговое', 10)
+        self.add(2, 'Сенаж', 5)
+
+        self.add(1, 'Люцерна', 10)
+        self.assertEqual(suggestion_texts(self.trie, 'сен'), ['Сенаж'])
+        self.assertEqual(suggestion_texts(self.trie, 'луг'), [])
+        self.assertNotIn('у', self.trie.root.children['л'].children)
+        self.assertEqual(suggestion_texts(self.trie, 'люц'), ['Люцерна'])
+
+        self.trie.remove(2)
+        self.assertEqual(suggestion_texts(self.trie, 'с'), [])
+        # Опустевшие ветки удалены
+        self.assertEqual(set(self.trie.root.children), {'л'})
+        self.assertEqual(len(self.trie), 1)
+
+    def test_prefix_longer_than_stored(self):
+        long_name = 'Комбикорм для спортивных лошадей'
+        self.add(1, long_name, 10)
+        self.add(2, 'Комбикорм для спортивных пони', 20)
+
+        query = 'комбикорм для спортивных л'
+        self.assertGreater(len(query), MAX_PREFIX_LENGTH)
+        self.assertEqual(suggestion_texts(self.trie, query), [long_name])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SuggestionSignalsTests(TestCase):
+    """Инкрементальные обновления дерева процесса сигналами и сверка с поколением каталога"""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(suggest, '_trie', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.category = FoodCategory.objects.create(name='Травяные корма', manufacturer='Конный двор')
+        self.item = FoodItem.objects.create(name='Сено луговое', category=self.category, stock=1)
+
+    def test_rename_delete_and_generation(self):
+        trie = get_suggestion_trie()
+        self.assertEqual(suggestion_texts(trie, 'сен'), ['Сено луговое'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.name = 'Люцерна гранулированная'
+            self.item.save()
+        # Своё изменение применено к дереву - после смены поколения оно не пересобирается
+        self.assertIs(get_suggestion_trie(), trie)
+        self.assertEqual(suggestion_texts(trie, 'сен'), [])
+        self.assertEqual(suggestion_texts(trie, 'гран'), ['Люцерна гранулированная'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.delete()
+        self.assertIs(get_suggestion_trie(), trie)
+        self.assertEqual(suggestion_texts(trie, 'люц'), [])
+        # Производитель без активных товаров пропадает из подсказок
+        self.assertEqual(trie.search('кон'), [])
+
+    def test_generation_bumped_elsewhere_rebuilds(self):
+        trie = get_suggestion_trie()
+        # Другой воркер изменил каталог - это дерево изменения не видело
+        FoodItem.objects.filter(pk=self.item.pk).update(name='Овёс')
+        bump_catalog_generation()
+
+        rebuilt = get_suggestion_trie()
+
+        self.assertIsNot(rebuilt, trie)
+        self.assertEqual(suggestion_texts(rebuilt, 'ов'), ['Овёс'])
+        self.assertEqual(suggestion_texts(rebuilt, 'сен'), [])
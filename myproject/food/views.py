@@ -1,5 +1,6 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.urls import reverse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Q, Avg
@@ -9,15 +10,28 @@ from django.views.decorators.http import require_GET
 from .models import FoodItem, Recommendation, ConsultationHistory
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
-from .services import IOIntelligenceService  # НОВЫЙ ИМПОРТ
-from .models import AIChatSession, AIChatMessage, FoodItem
+from .services import AIChatError, get_ai_service
+from .models import AIChatSession, AIChatMessage, AIConsultationJob, FoodItem
+from .jobs import enqueue_consultation
+from .chat_context import build_chat_context, save_chat_exchange
+from .search import search_food_items
+from .cache import cached_catalog
+from .pagination import CursorError, parse_page_size
+from .queries import (catalog_items, catalog_paginator, categories_with_counts, food_detail_item,
+                      serialize_card, showcase_items, similar_items as similar_catalog_items)
+from django.conf import settings
+from .suggest import DEFAULT_LIMIT, MAX_LIMIT, get_suggestion_trie
 from decimal import Decimal
 from datetime import timedelta
 import datetime
+import logging
 
 from django.utils import timezone
 
 
+logger = logging.getLogger(__name__)
+
+
 @csrf_exempt
 @login_required
 def delete_all_sessions(request):
@@ -132,6 +146,29 @@ def ai_chat(request):
     
     return render(request, 'food/ai_chat.html', context)
 
+@login_required
+def ai_job_status(request, job_id):
+    """Статус фоновой консультации ИИ (для опроса с клиента)"""
+    try:
+        job = AIConsultationJob.objects.get(id=job_id, user=request.user)
+    except AIConsultationJob.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'Задача не найдена'}, status=404)
+    
+    data = {
+        'success': True,
+        'job_id': str(job.id),
+        'status': job.status,
+        'status_display': job.get_status_display(),
+    }
+    
+    if job.status == 'done':
+        data.update(job.result)
+    elif job.status == 'failed':
+        data['success'] = False
+        data['message'] = job.error or 'Не удалось получить ответ от ИИ'
+    
+    return JsonResponse(data)
+
 @csrf_exempt
 @login_required
 def ai_get_recommendation(request):
@@ -196,98 +233,23 @@ def ai_get_recommendation(request):
                     'message': 'Вес должен быть положительным числом'
                 }, status=400)
             
-            # ЗАМЕНА: Используем IOIntelligenceService вместо GroqAIService
-            ai_service = IOIntelligenceService()
-            
-            # Получаем рекомендацию
-            ai_response = ai_service.get_food_recommendation(
-                breed=breed,
-                age=age,
-                weight=weight,
-                purpose=purpose,
-                budget=budget,
-                activity_level=activity_level
-            )
-            
-            if not ai_response:
-                return JsonResponse({
-                    'success': False,
-                    'message': 'Не удалось получить ответ от ИИ'
-                }, status=500)
-            
-            # Создаем сессию чата
-            from django.utils import timezone
-            session = AIChatSession.objects.create(
+            # Сам запрос к ИИ выполняет воркер (manage.py run_ai_worker), веб-процесс не ждёт
+            job = enqueue_consultation(
                 user=request.user,
-                title=f"Консультация {timezone.now().strftime('%d.%m.%Y')}",
-                horse_data={
-                    'breed': breed,
-                    'age': age,
-                    'weight': weight,
-                    'purpose': purpose,
-                    'budget': budget,
-                    'activity_level': activity_level
-                }
-            )
-            
-            # Сохраняем сообщения
-            AIChatMessage.objects.create(
-                session=session,
-                role='user',
-                content=f"Рекомендация для лошади: порода {breed}, возраст {age} лет, вес {weight} кг, цель {purpose}, бюджет {budget} руб"
-            )
-            
-            AIChatMessage.objects.create(
-                session=session,
-                role='assistant',
-                content=ai_response
-            )
-            
-            # Находим рекомендованные товары
-            food_items = FoodItem.objects.filter(is_active=True)
-            recommended_products = ai_service.analyze_and_extract_products(ai_response, food_items)
-            
-            # Конвертируем budget в Decimal
-            try:
-                budget_decimal = Decimal(str(budget))
-            except:
-                budget_decimal = Decimal('0')
-            
-            # Создаем рекомендацию в базе данных
-            recommendation = Recommendation.objects.create(
                 breed=breed,
                 age=age,
                 weight=weight,
                 purpose=purpose,
                 budget=budget,
-                activity_level=activity_level,
-                food_type="Рекомендовано ИИ",
-                daily_norm=Decimal('0.0'),
-                feeding_frequency=3,
-                next_purchase_date=timezone.now().date() + timedelta(days=30),
-                next_vet_check=timezone.now().date() + timedelta(days=180),
-                recommended_products=[str(pid) for pid in recommended_products],
-                notes=ai_response,
-                total_monthly_cost=budget_decimal
-            )
-            
-            # Сохраняем в историю
-            consultation = ConsultationHistory.objects.create(
-                user=request.user,
-                recommendation=recommendation,
-                horse_name="Лошадь из чата",
-                horse_breed=breed,
-                horse_age=age,
-                horse_weight=weight
+                activity_level=activity_level
             )
             
             return JsonResponse({
                 'success': True,
-                'response': ai_response,
-                'recommended_products': [str(pid) for pid in recommended_products],
-                'session_id': str(session.id),
-                'recommendation_id': str(recommendation.id)
-            })
+                'job_id': str(job.id),
+                'status': job.status,
+                'status_url': reverse('ai_job_status', args=[job.id])
+            }, status=202)
             
         except Exception as e:
             # Логируем полную ошибку
@@ -302,6 +264,45 @@ def ai_get_recommendation(request):
     
     return JsonResponse({'success': False, 'message': 'Недопустимый метод'}, status=405)
 
+def _sse_event(payload, event=None):
+    """Одно событие Server-Sent Events"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def _stream_chat_events(session, history, message):
+    """Отдаёт фрагменты ответа ИИ по мере генерации; вопрос и ответ сохраняются вместе в конце.
+
+    Если ИИ не ответил, клиенту уходит событие error, а в истории не остаётся ничего:
+    ни текст ошибки, ни оборванный ответ не попадают в контекст следующих вопросов.
+    """
+    ai_service = get_ai_service()
+    parts = []
+    completed = False
+    try:
+        for token in ai_service.stream_chat_reply(history, session.horse_data):
+            parts.append(token)
+            yield _sse_event({'token': token})
+        completed = True
+    except AIChatError as e:
+        logger.warning("ИИ не ответил в сессии %s: %s", session.id, e)
+        yield _sse_event({'success': False, 'message': str(e)}, event='error')
+    except Exception as e:
+        logger.exception("Ошибка потокового ответа ИИ в сессии %s", session.id)
+        yield _sse_event({'success': False, 'message': str(e)}, event='error')
+    
+    ai_message = None
+    if completed:
+        saved = save_chat_exchange(session, message, ''.join(parts))
+        ai_message = saved[1] if len(saved) > 1 else None
+    
+    yield _sse_event({
+        'success': completed,
+        'message_id': str(ai_message.id) if ai_message else None
+    }, event='done')
+
+def _wants_stream(request, data):
+    return bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
 @csrf_exempt
 @login_required
 def ai_chat_message(request):
@@ -322,53 +323,35 @@ def ai_chat_message(request):
             # Получаем сессию
             session = AIChatSession.objects.get(id=session_id, user=request.user)
             
-            # Сохраняем сообщение пользователя
-            user_message = AIChatMessage.objects.create(
-                session=session,
-                role='user',
-                content=message
-            )
+            # Последние сообщения под бюджет токенов (и краткое содержание более ранних) + новый вопрос;
+            # вопрос сохраняется вместе с ответом ИИ
+            messages_for_api = build_chat_context(session, message)
             
-            # Получаем историю чата
-            chat_history = list(session.messages.all().order_by('created_at'))
-            
-            # Конвертируем в формат для API
-            messages_for_api = []
-            for msg in chat_history[-10:]:  # Берем последние 10 сообщений
-                messages_for_api.append({
-                    'role': msg.role,
-                    'content': msg.content
-                })
-            
-            # ЗАМЕНА: Используем IOIntelligenceService для чата
-            ai_service = IOIntelligenceService()
-            
-            # Создаем промпт для чата
-            chat_prompt = f"""Продолжи диалог о кормлении лошадей. 
-            Предыдущие сообщения: {json.dumps(messages_for_api[-5:])}
-            Текущий вопрос пользователя: {message}
-            
-            Ответь как эксперт по кормлению лошадей."""
+            # Потоковый режим: токены уходят клиенту сразу, как приходят от модели
+            if _wants_stream(request, data):
+                response = StreamingHttpResponse(
+                    _stream_chat_events(session, messages_for_api, message),
+                    content_type='text/event-stream; charset=utf-8'
+                )
+                response['Cache-Control'] = 'no-cache'
+                response['X-Accel-Buffering'] = 'no'
+                return response
             
-            # Получаем ответ от ИИ
-            ai_response = ai_service.get_food_recommendation(
-                breed=session.horse_data.get('breed', 'other'),
-                age=session.horse_data.get('age', 5),
-                weight=session.horse_data.get('weight', 400),
-                purpose=session.horse_data.get('purpose', 'walk'),
-                budget=session.horse_data.get('budget', '10000'),
-                activity_level=session.horse_data.get('activity_level', 'medium')
-            )
+            # Общий сервис процесса для чата
+            ai_service = get_ai_service()
             
-            # Сохраняем ответ ИИ
-            ai_message = AIChatMessage.objects.create(
-                session=session,
-                role='assistant',
-                content=ai_response
-            )
+            # Получаем ответ от ИИ: тот же диалог, что и в потоковом режиме, без кэша рекомендаций
+            try:
+                ai_response = ai_service.chat_reply(messages_for_api, session.horse_data)
+            except AIChatError as e:
+                # Без ответа ИИ обмен не сохраняется
+                return JsonResponse({
+                    'success': False,
+                    'message': str(e)
+                }, status=503)
             
-            # Обновляем время сессии
-            session.save()
+            # Вопрос и ответ - один INSERT, время сессии - один UPDATE
+            user_message, ai_message = save_chat_exchange(session, message, ai_response)
             
             return JsonResponse({
                 'success': True,
@@ -422,7 +405,7 @@ def ai_chat_session(request, session_id):
 def food_detail_api(request, food_id):
     """API для получения деталей корма"""
     try:
-        food = FoodItem.objects.get(id=food_id)
+        food = FoodItem.objects.select_related('category').get(id=food_id)
         
         # Преобразуем food в словарь
         food_data = {
@@ -474,7 +457,7 @@ def food_detail_api(request, food_id):
 def food_detail_api(request, food_id):
     """API для получения деталей корма"""
     try:
-        food = FoodItem.objects.get(id=food_id)
+        food = FoodItem.objects.select_related('category').get(id=food_id)
         
         # Преобразуем food в словарь
         food_data = {
@@ -502,71 +485,78 @@ def food_detail_api(request, food_id):
         return JsonResponse({'error': 'Food item not found'}, status=404)
 def food_list(request):
     """Список всех кормов с фильтрацией"""
-    # Получаем все активные категории
-    categories = FoodCategory.objects.filter(is_active=True).order_by('order')
+    # Получаем все активные категории (из кэша каталога)
+    categories = cached_catalog('categories', lambda: list(categories_with_counts()))
     
     # Получаем параметры фильтрации
     category_id = request.GET.get('category')
+    manufacturer = request.GET.get('manufacturer', '').strip()
     search_query = request.GET.get('search', '').strip()
-    sort_by = request.GET.get('sort', 'newest')
+    sort_by = request.GET.get('sort', 'relevance' if search_query else 'newest')
+    if sort_by == 'relevance' and not search_query:
+        sort_by = 'newest'
+    cursor = request.GET.get('cursor', '')
+    page_size = parse_page_size(request.GET.get('page_size'))
     
-    # Базовый запрос
-    food_items = FoodItem.objects.filter(is_active=True)
+    # Базовый запрос: цены уровня пользователя считаются в SQL для всей страницы
+    tier = request.pricing.tier
+    food_items = catalog_items(tier=tier)
     
-    # Фильтрация по категории
+    # Фильтрация по категории (категорию берём из уже загруженного списка)
+    current_category = None
     if category_id:
-        try:
-            category = FoodCategory.objects.get(id=category_id, is_active=True)
-            food_items = food_items.filter(category=category)
-            current_category = category
-        except FoodCategory.DoesNotExist:
-            current_category = None
-    else:
-        current_category = None
-    
-    # Поиск
-    if search_query:
-        food_items = food_items.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(short_description__icontains=search_query)
-        )
+        current_category = next((cat for cat in categories if str(cat.id) == category_id), None)
+        if current_category:
+            food_items = food_items.filter(category=current_category)
+    
+    # Фильтрация по производителю (подсказки поиска ведут сюда)
+    if manufacturer:
+        food_items = food_items.filter(category__manufacturer=manufacturer)
     
-    # Сортировка
-    if sort_by == 'price_asc':
-        food_items = food_items.order_by('base_price')
-    elif sort_by == 'price_desc':
-        food_items = food_items.order_by('-base_price')
-    elif sort_by == 'rating':
-        food_items = food_items.order_by('-rating', '-review_count')
-    elif sort_by == 'popular':
-        food_items = food_items.order_by('-review_count', '-rating')
-    else:  # 'newest'
-        food_items = food_items.order_by('-created_at')
+    # Поиск по полнотекстовому индексу
+    if search_query:
+        food_items = search_food_items(food_items, search_query)
     
     # Получаем дополнительные списки для шаблона
-    best_sellers = FoodItem.objects.filter(
-        is_active=True, 
-        is_best_seller=True
-    )[:4]
+    best_sellers = cached_catalog('best_sellers', lambda: list(showcase_items(is_best_seller=True)))
+    new_items = cached_catalog('new_items', lambda: list(showcase_items(is_new=True)))
+    featured_items = cached_catalog('featured_items', lambda: list(showcase_items(is_featured=True)))
+    
+    # Параметры выборки: от них зависят число товаров и строки страницы
+    listing_params = (category_id if current_category else '', manufacturer, search_query, sort_by)
+    total_items = cached_catalog('total_items', food_items.count, *listing_params)
     
-    new_items = FoodItem.objects.filter(
-        is_active=True, 
-        is_new=True
-    )[:4]
+    # Строки страницы - тоже из кэша каталога (цены в них зависят от тарифа)
+    paginator = catalog_paginator(sort_by)
     
-    featured_items = FoodItem.objects.filter(
-        is_active=True, 
-        is_featured=True
-    )[:4]
+    def listing_page(cursor):
+        return cached_catalog(
+            'page', lambda: paginator.paginate(food_items, cursor=cursor, page_size=page_size),
+            *listing_params, cursor, page_size, tier
+        )
+    
+    # Испорченный курсор - просто первая страница
+    try:
+        page = listing_page(cursor)
+    except CursorError:
+        page = listing_page('')
+    
+    next_page_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_page_url = f"{request.path}?{params.urlencode()}"
     
     context = {
         'categories': categories,
-        'food_items': food_items,
+        'food_items': page,
+        'next_cursor': page.next_cursor,
+        'next_page_url': next_page_url,
         'current_category': current_category,
+        'manufacturer': manufacturer,
         'search_query': search_query,
         'sort_by': sort_by,
-        'total_items': food_items.count(),
+        'total_items': total_items,
         'best_sellers': best_sellers,  # Добавлено
         'new_items': new_items,        # Добавлено
         'featured_items': featured_items,  # Добавлено
@@ -574,39 +564,21 @@ def food_list(request):
     
     # Информация о пользователе для отображения цен
     if request.user.is_authenticated:
-        try:
-            profile = request.user.profile
-            context['user_profile'] = {
-                'subscription': profile.subscription,
-                'subscription_display': profile.get_subscription_display_name(),
-                'is_premium': profile.is_premium()
-            }
-        except:
-            pass
+        context['user_profile'] = request.pricing.as_dict()
     
     return render(request, 'food/food.html', context)
 def food_detail(request, food_id):
     """Детальная страница товара"""
     try:
-        food = get_object_or_404(FoodItem, id=food_id, is_active=True)
-    except:
+        food = food_detail_item(food_id)
+    except FoodItem.DoesNotExist:
         return render(request, 'food/404.html', {'message': 'Товар не найден'})
     
     # Получаем цену для пользователя
-    user_price = food.base_price
-    if request.user.is_authenticated:
-        try:
-            user_price = food.get_price_for_user(request.user)
-        except:
-            pass
+    user_price = food.get_price_for_tier(request.pricing.tier)
     
     # Похожие товары (из той же категории)
-    similar_items = []
-    if food.category:
-        similar_items = FoodItem.objects.filter(
-            category=food.category,
-            is_active=True
-        ).exclude(id=food.id)[:4]
+    similar_items = similar_catalog_items(food, tier=request.pricing.tier)
     
     # Контекст для шаблона
     context = {
@@ -617,20 +589,22 @@ def food_detail(request, food_id):
     
     # Используем новый современный шаблон
     return render(request, 'food/food_detail_modern.html', context)
-def get_categories(request):
-    """Получить список категорий для AJAX"""
-    categories = FoodCategory.objects.filter(is_active=True).order_by('order')
-    
-    categories_data = [
+def _categories_payload():
+    categories = categories_with_counts().only('id', 'name', 'icon', 'description', 'order')
+    return [
         {
             'id': str(cat.id),
             'name': cat.name,
             'icon': cat.icon,
             'description': cat.description,
-            'item_count': cat.items.filter(is_active=True).count()
+            'item_count': cat.active_items_count
         }
         for cat in categories
     ]
+
+def get_categories(request):
+    """Получить список категорий для AJAX"""
+    categories_data = cached_catalog('categories_payload', _categories_payload)
     
     return JsonResponse({
         'success': True,
@@ -646,33 +620,49 @@ def search_food(request):
         if len(query) < 2:
             return JsonResponse({'success': True, 'items': []})
         
-        items = FoodItem.objects.filter(
-            Q(is_active=True) &
-            (Q(name__icontains=query) |
-             Q(description__icontains=query) |
-             Q(short_description__icontains=query))
-        )[:10]
+        page_size = parse_page_size(
+            request.GET.get('page_size'), default=settings.FOOD_SEARCH_PAGE_SIZE, maximum=50
+        )
+        try:
+            page = catalog_paginator('relevance').paginate(
+                search_food_items(catalog_items(tier=request.pricing.tier), query),
+                cursor=request.GET.get('cursor'),
+                page_size=page_size
+            )
+        except CursorError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
         
-        items_data = []
-        for item in items:
-            price = item.get_price_for_user(request.user)
-            items_data.append({
-                'id': str(item.id),
-                'name': item.name,
-                'price': float(price),
-                'unit': item.get_unit_display(),
-                'image_url': item.image.url if item.image else '/static/images/food_default.jpg',
-                'category': item.category.name if item.category else 'Корма'
-            })
+        items_data = [serialize_card(item, request.user) for item in page]
         
         return JsonResponse({
             'success': True,
             'query': query,
-            'items': items_data
+            'items': items_data,
+            'next_cursor': page.next_cursor,
+            'has_next': page.has_next
         })
     
     return JsonResponse({'success': False, 'message': 'Неверный метод запроса'})
 
+@require_GET
+def suggest_food(request):
+    """Подсказки при вводе: товары, категории и производители из дерева префиксов"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    
+    suggestions = get_suggestion_trie().search(query, limit=limit) if query else []
+    
+    response = JsonResponse({
+        'success': True,
+        'query': query,
+        'suggestions': suggestions
+    })
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
 @login_required
 def filter_food(request):
     """Фильтрация товаров"""
@@ -685,62 +675,45 @@ def filter_food(request):
             max_price = data.get('max_price')
             in_stock = data.get('in_stock')
             sort_by = data.get('sort_by', 'newest')
+            if sort_by == 'relevance':  # без поискового запроса релевантности нет
+                sort_by = 'newest'
+            cursor = data.get('cursor')
+            page_size = parse_page_size(data.get('page_size'))
             
-            items = FoodItem.objects.filter(is_active=True)
+            items = catalog_items(tier=request.pricing.tier)
             
             # Фильтр по категории
             if category_id:
                 items = items.filter(category_id=category_id)
             
-            # Фильтр по цене
+            # Фильтр по цене, которую видит пользователь
             if min_price is not None:
-                items = items.filter(base_price__gte=min_price)
+                items = items.filter(user_price__gte=min_price)
             if max_price is not None:
-                items = items.filter(base_price__lte=max_price)
+                items = items.filter(user_price__lte=max_price)
             
             # Фильтр по наличию
             if in_stock:
                 items = items.filter(stock__gt=0)
             
-            # Сортировка
-            if sort_by == 'price_asc':
-                items = items.order_by('base_price')
-            elif sort_by == 'price_desc':
-                items = items.order_by('-base_price')
-            elif sort_by == 'rating':
-                items = items.order_by('-rating')
-            elif sort_by == 'popular':
-                items = items.order_by('-review_count')
-            else:  # 'newest'
-                items = items.order_by('-created_at')
-            
-            items_data = []
-            for item in items:
-                price = item.get_price_for_user(request.user)
-                items_data.append({
-                    'id': str(item.id),
-                    'name': item.name,
-                    'description': item.short_description or item.description[:100],
-                    'price': float(price),
-                    'original_price': float(item.base_price),
-                    'unit': f"{item.weight} {item.get_unit_display()}",
-                    'image_url': item.image.url if item.image else '/static/images/food_default.jpg',
-                    'category': item.category.name if item.category else 'Корма',
-                    'rating': float(item.rating),
-                    'review_count': item.review_count,
-                    'is_best_seller': item.is_best_seller,
-                    'is_new': item.is_new,
-                    'discount_percentage': item.get_discount_percentage(),
-                    'is_in_stock': item.is_in_stock,
-                    'stock': item.stock
-                })
+            # Общее число считаем только для первой страницы
+            total = None if cursor else items.count()
+            
+            # Сортировка и страница по курсору
+            page = catalog_paginator(sort_by).paginate(items, cursor=cursor, page_size=page_size)
+            
+            items_data = [serialize_card(item, request.user, detailed=True) for item in page]
             
             return JsonResponse({
                 'success': True,
                 'items': items_data,
-                'total': len(items_data)
+                'total': total,
+                'next_cursor': page.next_cursor,
+                'has_next': page.has_next
             })
             
+        except CursorError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
         except Exception as e:
             return JsonResponse({
                 'success': False,
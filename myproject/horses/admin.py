@@ -1,6 +1,6 @@
 # backend/horses/admin.py
 from django.contrib import admin
-from .models import Horse, HorseBooking
+from .models import BookingNotification, Horse, HorseBooking
 
 # Простейшая админка для лошадей
 class HorseAdmin(admin.ModelAdmin):
@@ -14,5 +14,12 @@ class HorseBookingAdmin(admin.ModelAdmin):
     list_display = ('horse', 'client_name', 'booking_date', 'status')
     list_filter = ('status', 'booking_date')
 
+# Очередь писем о бронях
+class BookingNotificationAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('recipient',)
+
 admin.site.register(Horse, HorseAdmin)
-admin.site.register(HorseBooking, HorseBookingAdmin)
\ No newline at end of file
+admin.site.register(HorseBooking, HorseBookingAdmin)
+admin.site.register(BookingNotification, BookingNotificationAdmin)
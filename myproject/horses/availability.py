@@ -0,0 +1,237 @@
+# horses/availability.py - занятость лошадей по часам
+"""
+Занятость одной лошади на день - битовая маска часов работы: бит i означает,
+что час OPENING_HOUR + i занят. Маски на диапазон дат строятся одним запросом
+к HorseBooking с учётом duration_hours и кэшируются; сигналы бронирований
+увеличивают версию лошади, после чего старые записи перестают читаться.
+"""
+import hashlib
+import time
+from datetime import date, datetime, timedelta
+
+from django.core.cache import cache
+
+from .models import HorseBooking
+
+
+# Часы работы: первое занятие в 09:00, последнее заканчивается в 20:00
+OPENING_HOUR = 9
+CLOSING_HOUR = 20
+SLOT_COUNT = CLOSING_HOUR - OPENING_HOUR
+FULL_DAY = (1 << SLOT_COUNT) - 1
+
+# Отменённые брони время не занимают (оплаченные переходят в 'completed', но занимают)
+FREE_STATUSES = ('cancelled',)
+
+BOOKING_DAYS_AHEAD = 30
+CALENDAR_DAYS = 30
+AVAILABILITY_CACHE_TIMEOUT = 300
+
+
+def slot_mask(start_hour, duration_hours=1):
+    """Маска часов [start_hour, start_hour + duration_hours), обрезанная часами работы"""
+    start = max(start_hour, OPENING_HOUR)
+    end = min(start_hour + duration_hours, CLOSING_HOUR)
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << (start - OPENING_HOUR)
+
+
+def booking_mask(booking_time, duration_hours):
+    """Занятые часы брони; начало не ровно в час занимает и следующий час целиком"""
+    hours = duration_hours + (1 if booking_time.minute or booking_time.second else 0)
+    return slot_mask(booking_time.hour, hours)
+
+
+def booked_hours(booking_time, duration_hours):
+    """Часы суток (0-23), которые бронь занимает целиком или частично"""
+    end = booking_time.hour + duration_hours + (1 if booking_time.minute or booking_time.second else 0)
+    return list(range(booking_time.hour, min(end, 24)))
+
+
+def is_free(day_mask, start_hour, duration_hours=1):
+    """Свободны ли все часы занятия и укладывается ли оно в часы работы"""
+    if start_hour < OPENING_HOUR or start_hour + duration_hours > CLOSING_HOUR:
+        return False
+    return not day_mask & slot_mask(start_hour, duration_hours)
+
+
+def free_hours(day_mask, duration_hours=1, not_before=None):
+    """Часы, с которых можно начать занятие длительностью duration_hours"""
+    first = OPENING_HOUR if not_before is None else max(OPENING_HOUR, not_before)
+    return [
+        hour for hour in range(first, CLOSING_HOUR)
+        if is_free(day_mask, hour, duration_hours)
+    ]
+
+
+def is_working_day(day):
+    return day.weekday() < 5  # Пн-Пт
+
+
+def occupancy_from_rows(rows):
+    """{date: маска} из строк (booking_date, booking_time, duration_hours)"""
+    masks = {}
+    for booking_date, booking_time, duration_hours in rows:
+        masks[booking_date] = masks.get(booking_date, 0) | booking_mask(booking_time, duration_hours)
+    return masks
+
+
+def load_occupancy(horse_id, start_date, end_date):
+    """Маски занятости лошади за [start_date, end_date] одним запросом, без кэша"""
+    rows = HorseBooking.objects.filter(
+        horse_id=horse_id,
+        booking_date__gte=start_date,
+        booking_date__lte=end_date,
+    ).exclude(status__in=FREE_STATUSES).order_by().values_list('booking_date', 'booking_time', 'duration_hours')
+    return occupancy_from_rows(rows)
+
+
+def load_occupancy_map(horse_ids, start_date, end_date):
+    """{horse_id: {date: маска}} для набора лошадей одним запросом, без кэша"""
+    occupancy = {horse_id: {} for horse_id in horse_ids}
+    rows = HorseBooking.objects.filter(
+        horse_id__in=horse_ids,
+        booking_date__gte=start_date,
+        booking_date__lte=end_date,
+    ).exclude(status__in=FREE_STATUSES).order_by().values_list(
+        'horse_id', 'booking_date', 'booking_time', 'duration_hours'
+    )
+    for horse_id, booking_date, booking_time, duration_hours in rows:
+        masks = occupancy.setdefault(horse_id, {})
+        masks[booking_date] = masks.get(booking_date, 0) | booking_mask(booking_time, duration_hours)
+    return occupancy
+
+
+# Версия занятости лошади - часть ключа кэша
+
+def _version_key(horse_id):
+    return f'horses:availability:{horse_id}:version'
+
+
+def get_availability_version(horse_id):
+    key = _version_key(horse_id)
+    version = cache.get(key)
+    if version is None:
+        # Если версия вытеснена из кэша, новое значение не совпадёт со старыми ключами
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key) or 0
+    return version
+
+
+def bump_availability_version(horse_id):
+    """Сбросить кэш занятости лошади"""
+    key = _version_key(horse_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, None)
+        return version
+
+
+def get_occupancy(horse_id, start_date, end_date):
+    """Маски занятости за диапазон дат из кэша (до следующего изменения броней лошади)"""
+    key = (
+        f'horses:availability:{horse_id}:{get_availability_version(horse_id)}:'
+        f'{start_date.isoformat()}:{end_date.isoformat()}'
+    )
+    masks = cache.get(key)
+    if masks is None:
+        masks = load_occupancy(horse_id, start_date, end_date)
+        cache.set(key, masks, AVAILABILITY_CACHE_TIMEOUT)
+    return masks
+
+
+def day_occupancy(horse_id, day):
+    return get_occupancy(horse_id, day, day).get(day, 0)
+
+
+def earliest_hour(day, now=None):
+    """Сегодня нельзя начать занятие в уже наступивший час"""
+    now = now or datetime.now()
+    if day == now.date():
+        return now.hour + 1
+    return None
+
+
+def available_times(horse_id, day, duration_hours=1, now=None):
+    """Свободные начала занятий на день: ['09:00', '10:00', ...]"""
+    now = now or datetime.now()
+    if day < now.date() or not is_working_day(day):
+        return []
+    hours = free_hours(day_occupancy(horse_id, day), duration_hours, earliest_hour(day, now))
+    return [f'{hour:02d}:00' for hour in hours]
+
+
+def available_dates(horse_id=None, start_date=None, days=BOOKING_DAYS_AHEAD, duration_hours=1, now=None):
+    """Рабочие дни, в которых у лошади (если указана) остался свободный час"""
+    now = now or datetime.now()
+    start_date = start_date or now.date()
+    end_date = start_date + timedelta(days=days)
+    masks = get_occupancy(horse_id, start_date, end_date) if horse_id else {}
+
+    dates = []
+    day = start_date
+    while day <= end_date:
+        if is_working_day(day) and free_hours(masks.get(day, 0), duration_hours, earliest_hour(day, now)):
+            dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+
+# Календарь нескольких лошадей
+
+def free_day_mask(day, busy_mask, now=None):
+    """Маска часов, с которых можно начать часовое занятие: рабочий день, не прошло, не занято"""
+    now = now or datetime.now()
+    if day < now.date() or not is_working_day(day):
+        return 0
+    mask = FULL_DAY & ~busy_mask
+    first = earliest_hour(day, now)
+    if first is not None:
+        mask &= ~slot_mask(OPENING_HOUR, first - OPENING_HOUR)
+    return mask
+
+
+def encode_masks(masks):
+    """Маски дней в строку: по 3 шестнадцатеричных знака на день (бит i - час OPENING_HOUR + i)"""
+    return ''.join(f'{mask:03x}' for mask in masks)
+
+
+def calendar_occupancy(horse_ids, start_date, days=CALENDAR_DAYS):
+    """{str(horse_id): [маска занятости по дням]} для лошадей на days дней вперёд.
+
+    Один запрос к HorseBooking на все лошади; результат кэшируется на день start_date
+    и версии всех лошадей, так что новая бронь любой из них даёт новый ключ.
+    """
+    horse_ids = sorted(horse_ids, key=str)
+    version_keys = {_version_key(horse_id): horse_id for horse_id in horse_ids}
+    versions = cache.get_many(list(version_keys))
+    parts = [start_date.isoformat(), str(days)]
+    for key, horse_id in version_keys.items():
+        version = versions.get(key)
+        if version is None:
+            version = get_availability_version(horse_id)
+        parts.append(f'{horse_id}:{version}')
+    key = 'horses:calendar:' + hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+
+    matrix = cache.get(key)
+    if matrix is None:
+        end_date = start_date + timedelta(days=days - 1)
+        occupancy = load_occupancy_map(horse_ids, start_date, end_date)
+        matrix = {
+            str(horse_id): [
+                occupancy.get(horse_id, {}).get(start_date + timedelta(days=offset), 0)
+                for offset in range(days)
+            ]
+            for horse_id in horse_ids
+        }
+        cache.set(key, matrix, AVAILABILITY_CACHE_TIMEOUT)
+    return key, matrix
+
+
+def parse_day(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
@@ -0,0 +1,57 @@
+# horses/constraints.py - запрет пересечения броней одной лошади на уровне базы
+"""
+На PostgreSQL брони одной лошади (кроме отменённых) не могут пересекаться по
+времени: exclusion constraint по (horse_id WITH =, tsrange(начало, конец) WITH &&)
+с GiST-индексом (нужно расширение btree_gist). На остальных базах того же
+добивается уникальность занятых часов HorseBookingSlot, поэтому там ограничение
+не создаётся и не проверяется.
+"""
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateTimeRangeField
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, Func
+
+
+class BookingPeriod(Func):
+    """Интервал брони: tsrange(booking_date + booking_time, ... + duration_hours часов)"""
+    output_field = DateTimeRangeField()
+
+    def __init__(self, booking_date=F('booking_date'), booking_time=F('booking_time'),
+                 duration_hours=F('duration_hours')):
+        super().__init__(booking_date, booking_time, duration_hours)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        (date_sql, date_params), (time_sql, time_params), (hours_sql, hours_params) = [
+            compiler.compile(expression) for expression in self.get_source_expressions()
+        ]
+        start = f'({date_sql})::date + ({time_sql})::time'
+        sql = f"tsrange({start}, {start} + ({hours_sql})::integer * interval '1 hour')"
+        return sql, (*date_params, *time_params, *date_params, *time_params, *hours_params)
+
+
+class PostgresExclusionConstraint(ExclusionConstraint):
+    """ExclusionConstraint, который на базах, кроме PostgreSQL, не создаётся и не проверяется"""
+
+    @staticmethod
+    def _supported(connection):
+        return connection.vendor == 'postgresql'
+
+    def constraint_sql(self, model, schema_editor):
+        if not self._supported(schema_editor.connection):
+            return None
+        return super().constraint_sql(model, schema_editor)
+
+    def create_sql(self, model, schema_editor):
+        if not self._supported(schema_editor.connection):
+            return None
+        return super().create_sql(model, schema_editor)
+
+    def remove_sql(self, model, schema_editor):
+        if not self._supported(schema_editor.connection):
+            return None
+        return super().remove_sql(model, schema_editor)
+
+    def validate(self, model, instance, exclude=None, using=DEFAULT_DB_ALIAS):
+        if not self._supported(connections[using]):
+            return
+        super().validate(model, instance, exclude=exclude, using=using)
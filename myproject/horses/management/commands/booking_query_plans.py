@@ -0,0 +1,136 @@
+# horses/management/commands/booking_query_plans.py
+import time
+import uuid
+from datetime import date, time as day_time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from horses.availability import FREE_STATUSES
+from horses.models import Horse, HorseBooking
+
+
+class Rollback(Exception):
+    """Откатить тестовые данные и удалённые индексы"""
+
+
+class Command(BaseCommand):
+    help = ('Планы и время запросов бронирований с индексами HorseBooking и без них '
+            '(тестовые данные и удаление индексов откатываются)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horses', type=int, default=20, help='Сколько лошадей создать')
+        parser.add_argument('--users', type=int, default=200, help='Сколько пользователей создать')
+        parser.add_argument('--bookings', type=int, default=20000, help='Сколько броней создать')
+        parser.add_argument('--repeat', type=int, default=50, help='Повторов каждого запроса для замера')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                horse, user, day = self.seed(options)
+                queries = self.hot_queries(horse, user, day)
+
+                self.stdout.write(self.style.MIGRATE_HEADING('После: с индексами'))
+                after = self.report(queries, options['repeat'])
+
+                self.drop_indexes()
+                self.stdout.write(self.style.MIGRATE_HEADING('До: без составных индексов'))
+                before = self.report(queries, options['repeat'])
+
+                self.stdout.write(self.style.MIGRATE_HEADING('Итог'))
+                for label in queries:
+                    speedup = before[label] / after[label] if after[label] else 0
+                    self.stdout.write(
+                        f'{label}: {before[label]:.3f} мс -> {after[label]:.3f} мс (x{speedup:.1f})'
+                    )
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def seed(self, options):
+        tag = uuid.uuid4().hex[:8]
+        horses = Horse.objects.bulk_create([
+            Horse(name=f'План {tag} {number}', breed='don', age=5, color='-', level='beginner')
+            for number in range(options['horses'])
+        ])
+        users = User.objects.bulk_create([
+            User(username=f'plans_{tag}_{number}', password='!')
+            for number in range(options['users'])
+        ])
+
+        # У каждой лошади брони идут подряд по часам работы, поровну в прошлом и будущем
+        days_span = options['bookings'] // len(horses) // 11 + 1
+        start = date.today() - timedelta(days=days_span // 2)
+        statuses = ['confirmed', 'completed', 'pending', 'cancelled']
+        bookings = []
+        for number in range(options['bookings']):
+            horse = horses[number % len(horses)]
+            slot = number // len(horses)
+            bookings.append(HorseBooking(
+                user=users[number % len(users)],
+                horse=horse,
+                booking_date=start + timedelta(days=slot // 11),
+                booking_time=day_time(9 + slot % 11),
+                duration_hours=1,
+                base_price_hour=Decimal('2000'),
+                user_price_hour=Decimal('2000'),
+                total_price=Decimal('2000'),
+                client_name='-',
+                client_phone='-',
+                status=statuses[number % len(statuses)],
+            ))
+        # bulk_create не отправляет сигналы - таблица занятых часов не заполняется
+        HorseBooking.objects.bulk_create(bookings, batch_size=1000)
+        connection.cursor().execute('ANALYZE')
+
+        self.stdout.write(
+            f'Создано: лошадей {len(horses)}, пользователей {len(users)}, броней {len(bookings)}'
+        )
+        return horses[0], users[0], date.today()
+
+    def hot_queries(self, horse, user, day):
+        # Те же запросы, что в horses.availability и списках броней
+        return {
+            'Занятость лошади на 30 дней': HorseBooking.objects.filter(
+                horse=horse, booking_date__gte=day, booking_date__lte=day + timedelta(days=30)
+            ).exclude(status__in=FREE_STATUSES).order_by().values_list(
+                'booking_date', 'booking_time', 'duration_hours'
+            ),
+            'Занятость лошади на день': HorseBooking.objects.filter(
+                horse=horse, booking_date=day
+            ).exclude(status__in=FREE_STATUSES).order_by().values_list(
+                'booking_date', 'booking_time', 'duration_hours'
+            ),
+            'Последние брони пользователя': HorseBooking.objects.filter(
+                user=user
+            ).order_by('-created_at')[:20],
+        }
+
+    def report(self, queries, repeat):
+        timings = {}
+        for label, queryset in queries.items():
+            self.stdout.write(self.style.SQL_KEYWORD(label))
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            timings[label] = (time.perf_counter() - started) * 1000 / repeat
+            self.stdout.write(f'    {timings[label]:.3f} мс на запрос')
+        return timings
+
+    def drop_indexes(self):
+        """Убрать составные индексы (внутри транзакции - вернутся при откате)"""
+        with connection.cursor() as cursor:
+            for index in HorseBooking._meta.indexes:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+        if connection.vendor == 'postgresql':
+            # Exclusion constraint тоже держит GiST-индекс по (horse_id, интервал)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'ALTER TABLE horses_horsebooking DROP CONSTRAINT IF EXISTS horses_booking_no_overlap'
+                )
+        connection.cursor().execute('ANALYZE')
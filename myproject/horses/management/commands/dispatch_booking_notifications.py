@@ -0,0 +1,40 @@
+# horses/management/commands/dispatch_booking_notifications.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from horses.notifications import dispatch_pending, requeue_stale_notifications
+
+
+class Command(BaseCommand):
+    help = 'Отправитель писем о бронях: пачками через одно соединение, с повторами и задержкой'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Отправить текущую очередь и выйти')
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help='Пауза между опросами пустой очереди (секунды)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Писем на одно соединение (по умолчанию BOOKING_NOTIFICATIONS_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        self.stdout.write('📧 Отправитель писем о бронях запущен')
+        total = 0
+
+        try:
+            while True:
+                requeued = requeue_stale_notifications()
+                if requeued:
+                    self.stdout.write(f'⚠️ Зависшие письма возвращены в очередь: {requeued}')
+
+                sent, failed = dispatch_pending(batch_size=options['batch_size'])
+                total += sent
+                if sent or failed:
+                    self.stdout.write(f'✅ Отправлено: {sent}, отложено: {failed} (всего отправлено {total})')
+
+                if options['once']:
+                    break
+                if not sent and not failed:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Отправитель остановлен')
@@ -0,0 +1,66 @@
+# horses/management/commands/resolve_booking_overlaps.py
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+
+from horses.models import HorseBooking, HorseBookingSlot
+from horses.notifications import enqueue_booking_cancellation
+from horses.overlaps import OVERLAP_FIELDS, describe_booking, find_overlaps, overlap_report
+from horses.signals import update_booking_slots
+
+
+class Command(BaseCommand):
+    help = ('Пересекающиеся брони, из-за которых не применяется миграция horses 0006: отчёт, '
+            'с --apply - отмена неоплаченных броней с письмом клиенту')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true',
+                            help='Отменить неоплаченные брони из отчёта (без флага ничего не меняется)')
+
+    def handle(self, *args, **options):
+        bookings = HorseBooking.objects.exclude(status='cancelled').values(*OVERLAP_FIELDS)
+        overlaps = find_overlaps(bookings, exact=connection.vendor == 'postgresql')
+        if not overlaps:
+            self.stdout.write('✅ Пересекающихся броней нет')
+            return
+
+        self.stdout.write(f'⚠️ Пересекающихся броней: {len(overlaps)}')
+        self.stdout.write(overlap_report(overlaps))
+
+        paid = [booking for booking, _ in overlaps if booking['is_paid']]
+        to_cancel = [booking['id'] for booking, _ in overlaps if not booking['is_paid']]
+        if paid:
+            self.stdout.write('Оплаченные брони автоматически не отменяются - оформите возврат '
+                              'и отмените их в админке:')
+            for booking in paid:
+                self.stdout.write(f'   бронь {describe_booking(booking)}')
+
+        if not options['apply']:
+            self.stdout.write(f'Будет отменено неоплаченных броней: {len(to_cancel)}. '
+                              'Запустите с --apply, чтобы отменить их и уведомить клиентов.')
+            return
+
+        cancelled = self.cancel(to_cancel)
+        self.stdout.write(self.style.SUCCESS(f'✅ Отменено броней: {cancelled}, письма клиентам в очереди'))
+
+    def cancel(self, booking_ids):
+        # До миграции 0006 таблицы занятых часов ещё нет - её заполнит сама миграция
+        slot_table_ready = HorseBookingSlot._meta.db_table in connection.introspection.table_names()
+        if not slot_table_ready:
+            post_save.disconnect(update_booking_slots, sender=HorseBooking)
+        try:
+            cancelled = 0
+            with transaction.atomic():
+                bookings = HorseBooking.objects.select_related('horse', 'user').filter(
+                    id__in=booking_ids, is_paid=False
+                ).exclude(status='cancelled')
+                for booking in bookings:
+                    # save() - чтобы сработали сигналы: статистика, кэш занятости
+                    booking.status = 'cancelled'
+                    booking.save()
+                    enqueue_booking_cancellation(booking)
+                    cancelled += 1
+            return cancelled
+        finally:
+            if not slot_table_ready:
+                post_save.connect(update_booking_slots, sender=HorseBooking)
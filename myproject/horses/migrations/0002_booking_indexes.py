@@ -0,0 +1,21 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horses', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='horsebooking',
+            index=models.Index(fields=['horse', 'booking_date', 'status'], name='horses_booking_horse_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='horsebooking',
+            index=models.Index(fields=['user', '-created_at'], name='horses_booking_user_new_idx'),
+        ),
+    ]
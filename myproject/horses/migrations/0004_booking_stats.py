@@ -0,0 +1,62 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+
+
+def backfill_booking_stats(apps, schema_editor):
+    """Сводки всех пользователей с бронями - один запрос с группировкой по пользователю"""
+    HorseBooking = apps.get_model('horses', 'HorseBooking')
+    BookingStats = apps.get_model('horses', 'BookingStats')
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    paid = Q(status__in=['confirmed', 'completed'])
+    savings = ExpressionWrapper(F('base_price_hour') * F('duration_hours') - F('total_price'), output_field=money)
+    rows = HorseBooking.objects.order_by().values('user_id').annotate(
+        total_bookings=Count('id'),
+        confirmed_bookings=Count('id', filter=Q(status='confirmed')),
+        paid_bookings=Count('id', filter=paid),
+        total_spent=Sum('total_price', filter=paid),
+        total_savings=Sum(savings, filter=paid),
+    )
+    BookingStats.objects.bulk_create([
+        BookingStats(
+            user_id=row['user_id'],
+            total_bookings=row['total_bookings'],
+            confirmed_bookings=row['confirmed_bookings'],
+            paid_bookings=row['paid_bookings'],
+            total_spent=row['total_spent'] or 0,
+            total_savings=row['total_savings'] or 0,
+        )
+        for row in rows.iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('horses', '0003_booking_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='booking_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('total_bookings', models.PositiveIntegerField(default=0, verbose_name='Всего броней')),
+                ('confirmed_bookings', models.PositiveIntegerField(default=0, verbose_name='Подтверждённых')),
+                ('paid_bookings', models.PositiveIntegerField(default=0, verbose_name='Подтверждённых и завершённых')),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Потрачено')),
+                ('total_savings', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сэкономлено')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Статистика бронирований',
+                'verbose_name_plural': 'Статистика бронирований',
+            },
+        ),
+        migrations.RunPython(backfill_booking_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horses', '0004_booking_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='horsebooking',
+            index=models.Index(fields=['user', '-booking_date', '-booking_time', '-id'], name='horses_booking_user_day_idx'),
+        ),
+    ]
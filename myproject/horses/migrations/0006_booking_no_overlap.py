@@ -0,0 +1,87 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:10
+
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.core.management.base import CommandError
+from django.db import migrations, models
+import django.db.models.deletion
+import horses.constraints
+
+
+class PostgresBtreeGistExtension(BtreeGistExtension):
+    """btree_gist только на PostgreSQL: в Django откат CreateExtension базу не проверяет"""
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def check_no_overlapping_bookings(apps, schema_editor):
+    """Не создавать запрет пересечений поверх пересекающихся броней: миграция останавливается
+    со списком пар, разбирает их оператор (manage.py resolve_booking_overlaps)"""
+    from horses.overlaps import OVERLAP_FIELDS, find_overlaps, overlap_report
+
+    HorseBooking = apps.get_model('horses', 'HorseBooking')
+    bookings = HorseBooking.objects.exclude(status='cancelled').values(*OVERLAP_FIELDS)
+    overlaps = find_overlaps(bookings, exact=schema_editor.connection.vendor == 'postgresql')
+    if overlaps:
+        raise CommandError(
+            f'Пересекающихся броней: {len(overlaps)}. Запрет пересечений не создан:\n'
+            f'{overlap_report(overlaps)}\n'
+            'Разберите их командой manage.py resolve_booking_overlaps и повторите migrate.'
+        )
+
+
+def fill_booking_slots(apps, schema_editor):
+    """Занятые часы существующих броней в HorseBookingSlot (базы без exclusion constraint)"""
+    from horses.availability import booked_hours
+
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+
+    HorseBooking = apps.get_model('horses', 'HorseBooking')
+    HorseBookingSlot = apps.get_model('horses', 'HorseBookingSlot')
+    slots = []
+    rows = HorseBooking.objects.exclude(status='cancelled').values_list(
+        'id', 'horse_id', 'booking_date', 'booking_time', 'duration_hours'
+    )
+    for booking_id, horse_id, booking_date, booking_time, duration_hours in rows.iterator():
+        for hour in booked_hours(booking_time, duration_hours):
+            slots.append(HorseBookingSlot(booking_id=booking_id, horse_id=horse_id, date=booking_date, hour=hour))
+    # Пересечений нет - это проверено в начале миграции
+    HorseBookingSlot.objects.bulk_create(slots, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horses', '0005_booking_history_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_no_overlapping_bookings, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='HorseBookingSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('hour', models.PositiveSmallIntegerField(verbose_name='Час')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='horses.horsebooking')),
+                ('horse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booked_slots', to='horses.horse')),
+            ],
+            options={
+                'verbose_name': 'Занятый час',
+                'verbose_name_plural': 'Занятые часы',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='horsebookingslot',
+            constraint=models.UniqueConstraint(fields=('horse', 'date', 'hour'), name='horses_slot_unique_hour'),
+        ),
+        PostgresBtreeGistExtension(),
+        migrations.AddConstraint(
+            model_name='horsebooking',
+            constraint=horses.constraints.PostgresExclusionConstraint(condition=models.Q(('status', 'cancelled'), _negated=True), expressions=[('horse', '='), (horses.constraints.BookingPeriod(), '&&')], name='horses_booking_no_overlap'),
+        ),
+        migrations.RunPython(fill_booking_slots, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,14 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.contrib.postgres.fields import RangeOperators
 from user_profile.models import UserProfile
 import uuid
 from decimal import Decimal
 from datetime import datetime, timedelta
 
+from .constraints import BookingPeriod, PostgresExclusionConstraint
+
 class Horse(models.Model):
     BREED_CHOICES = [
         ('arabian', 'Арабская скаковая'),
@@ -51,11 +55,12 @@ class Horse(models.Model):
         return f"{self.name} ({self.get_breed_display()})"
     
     def get_price_for_user(self, user):
-        if hasattr(user, 'profile'):
-            if user.profile.subscription == 'pro' and user.profile.subscription_active:
-                return self.pro_price_hour
-            elif user.profile.subscription == 'premium' and user.profile.subscription_active:
-                return self.premium_price_hour
+        from user_profile.pricing import pricing_tier
+        tier = pricing_tier(user)
+        if tier == 'pro':
+            return self.pro_price_hour
+        elif tier == 'premium':
+            return self.premium_price_hour
         return self.base_price_hour
 
 
@@ -74,6 +79,12 @@ class HorseBooking(models.Model):
         ('completed', 'Завершено'),
         ('cancelled', 'Отменено'),
     ]
+    STATUS_CLASSES = {
+        'pending': 'status-pending',
+        'confirmed': 'status-confirmed',
+        'completed': 'status-completed',
+        'cancelled': 'status-cancelled',
+    }
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='horse_bookings')
@@ -106,6 +117,24 @@ class HorseBooking(models.Model):
         verbose_name = 'Бронирование лошади'
         verbose_name_plural = 'Бронирования лошадей'
         ordering = ['-booking_date', 'booking_time']
+        indexes = [
+            # Занятость лошади по датам (availability, календарь)
+            models.Index(fields=['horse', 'booking_date', 'status'], name='horses_booking_horse_day_idx'),
+            # Брони пользователя, новые сверху (профиль, "Мои брони")
+            models.Index(fields=['user', '-created_at'], name='horses_booking_user_new_idx'),
+            # История броней пользователя по курсору (horses.queries.BOOKING_HISTORY_ORDERING)
+            models.Index(fields=['user', '-booking_date', '-booking_time', '-id'],
+                         name='horses_booking_user_day_idx'),
+        ]
+        constraints = [
+            # Брони одной лошади не пересекаются по времени, кроме отменённых (только PostgreSQL;
+            # на остальных базах - HorseBookingSlot)
+            PostgresExclusionConstraint(
+                name='horses_booking_no_overlap',
+                expressions=[('horse', RangeOperators.EQUAL), (BookingPeriod(), RangeOperators.OVERLAPS)],
+                condition=~models.Q(status='cancelled'),
+            ),
+        ]
     
     def __str__(self):
         return f"Бронь #{self.id.hex[:8]} - {self.horse.name} ({self.booking_date})"
@@ -116,13 +145,7 @@ class HorseBooking(models.Model):
     
     def get_status_class(self):
         """Получить CSS класс для статуса"""
-        status_classes = {
-            'pending': 'status-pending',
-            'confirmed': 'status-confirmed',
-            'completed': 'status-completed',
-            'cancelled': 'status-cancelled',
-        }
-        return status_classes.get(self.status, 'status-pending')
+        return self.STATUS_CLASSES.get(self.status, 'status-pending')
     
     def calculate_price(self, user):
         """Рассчитать цену с учетом подписки пользователя"""
@@ -142,4 +165,80 @@ class HorseBooking(models.Model):
             'user_price': user_price,
             'discount_percent': discount,
             'total': total
-        }
\ No newline at end of file
+        }
+
+
+class HorseBookingSlot(models.Model):
+    """Занятый час лошади. Уникальность (лошадь, дата, час) запрещает пересечение броней
+    на базах без exclusion constraint (SQLite); строки ведут сигналы HorseBooking."""
+    booking = models.ForeignKey(HorseBooking, on_delete=models.CASCADE, related_name='slots')
+    horse = models.ForeignKey(Horse, on_delete=models.CASCADE, related_name='booked_slots')
+    date = models.DateField(verbose_name='Дата')
+    hour = models.PositiveSmallIntegerField(verbose_name='Час')
+    
+    class Meta:
+        verbose_name = 'Занятый час'
+        verbose_name_plural = 'Занятые часы'
+        constraints = [
+            models.UniqueConstraint(fields=['horse', 'date', 'hour'], name='horses_slot_unique_hour'),
+        ]
+    
+    def __str__(self):
+        return f"{self.horse_id} {self.date} {self.hour:02d}:00"
+
+
+class BookingStats(models.Model):
+    """Сводка бронирований пользователя; ведётся сигналами HorseBooking (horses.stats)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='booking_stats', verbose_name='Пользователь')
+    total_bookings = models.PositiveIntegerField(default=0, verbose_name='Всего броней')
+    confirmed_bookings = models.PositiveIntegerField(default=0, verbose_name='Подтверждённых')
+    paid_bookings = models.PositiveIntegerField(default=0, verbose_name='Подтверждённых и завершённых')
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Потрачено')
+    total_savings = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Сэкономлено')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Статистика бронирований'
+        verbose_name_plural = 'Статистика бронирований'
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.total_bookings} броней"
+
+
+class BookingNotification(models.Model):
+    """Письмо о брони в очереди отправки (outbox): пишется в транзакции брони,
+    отправляет manage.py dispatch_booking_notifications"""
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('sending', 'Отправляется'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    ]
+    
+    booking = models.ForeignKey(HorseBooking, on_delete=models.CASCADE,
+                                related_name='notifications', verbose_name='Бронь')
+    recipient = models.EmailField(verbose_name='Получатель')
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, default='', verbose_name='Последняя ошибка')
+    # Метка пачки, которую забрал отправитель
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+    
+    class Meta:
+        verbose_name = 'Уведомление о брони'
+        verbose_name_plural = 'Уведомления о бронях'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='horses_notify_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.recipient} - {self.get_status_display()}"
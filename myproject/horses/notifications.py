@@ -0,0 +1,192 @@
+# horses/notifications.py - очередь писем о бронях (outbox)
+"""
+Письмо сохраняется в BookingNotification в той же транзакции, что и бронь:
+откат брони убирает и письмо, а ответ create_booking не ждёт SMTP.
+Отправитель забирает пачку готовых писем одним UPDATE, отправляет их через
+одно соединение с почтовым сервером и переносит неудачные на потом с
+экспоненциальной задержкой.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BookingNotification
+
+
+def build_confirmation(booking):
+    """Тема и текст письма о подтверждении брони"""
+    subject = f'Подтверждение бронирования лошади {booking.horse.name}'
+    created_at = booking.created_at or timezone.now()
+    body = '\n'.join([
+        f'Здравствуйте, {booking.client_name}!',
+        '',
+        'Ваше бронирование подтверждено:',
+        f'Лошадь: {booking.horse.name}',
+        f"Дата: {booking.booking_date.strftime('%d.%m.%Y')}",
+        f"Время: {booking.booking_time.strftime('%H:%M')}",
+        f'Длительность: {booking.duration_hours} час.',
+        f'Стоимость: {booking.total_price} руб.',
+        '',
+        f"Номер брони: BK{created_at.strftime('%Y%m%d')}{booking.id.hex[:8].upper()}",
+        '',
+        'С уважением,',
+        'Алексинский конный завод',
+    ])
+    return subject, body
+
+
+def build_cancellation(booking):
+    """Тема и текст письма об отмене брони"""
+    subject = f'Отмена бронирования лошади {booking.horse.name}'
+    body = '\n'.join([
+        f'Здравствуйте, {booking.client_name}!',
+        '',
+        'К сожалению, ваше бронирование отменено: это время уже занято другой бронью.',
+        f'Лошадь: {booking.horse.name}',
+        f"Дата: {booking.booking_date.strftime('%d.%m.%Y')}",
+        f"Время: {booking.booking_time.strftime('%H:%M')}",
+        '',
+        'Выберите, пожалуйста, другое время на сайте или свяжитесь с нами.',
+        '',
+        'С уважением,',
+        'Алексинский конный завод',
+    ])
+    return subject, body
+
+
+def _enqueue(booking, subject, body, using):
+    email = booking.user.email if booking.user_id else ''
+    if not email:
+        return None
+    return BookingNotification.objects.using(using).create(
+        booking=booking,
+        recipient=email,
+        subject=subject,
+        body=body,
+    )
+
+
+def enqueue_booking_confirmation(booking, using='default'):
+    """Поставить письмо о брони в очередь (в текущей транзакции)"""
+    return _enqueue(booking, *build_confirmation(booking), using)
+
+
+def enqueue_booking_cancellation(booking, using='default'):
+    """Поставить письмо об отмене брони в очередь (в текущей транзакции)"""
+    return _enqueue(booking, *build_cancellation(booking), using)
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: база * 2^(попытка-1), не больше максимума"""
+    base = getattr(settings, 'BOOKING_NOTIFICATIONS_RETRY_BASE_SECONDS', 60)
+    limit = getattr(settings, 'BOOKING_NOTIFICATIONS_RETRY_MAX_SECONDS', 3600)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), limit))
+
+
+def requeue_stale_notifications():
+    """Вернуть в очередь письма, зависшие в отправке (отправитель был остановлен)"""
+    cutoff = timezone.now() - timedelta(
+        seconds=getattr(settings, 'BOOKING_NOTIFICATIONS_STALE_SECONDS', 600)
+    )
+    return BookingNotification.objects.filter(
+        status='sending', next_attempt_at__lt=cutoff
+    ).update(status='pending', claim_token=None)
+
+
+def claim_batch(batch_size=None):
+    """Забрать пачку готовых к отправке писем; условный UPDATE не даёт двум отправителям взять одно письмо"""
+    batch_size = batch_size or getattr(settings, 'BOOKING_NOTIFICATIONS_BATCH_SIZE', 50)
+    now = timezone.now()
+    due = BookingNotification.objects.filter(
+        status='pending', next_attempt_at__lte=now
+    ).order_by('next_attempt_at').values_list('id', flat=True)[:batch_size]
+
+    token = uuid.uuid4()
+    # next_attempt_at = время захвата: по нему requeue_stale_notifications находит зависшие
+    claimed = BookingNotification.objects.filter(id__in=list(due), status='pending').update(
+        status='sending', claim_token=token, next_attempt_at=now
+    )
+    if not claimed:
+        return []
+    return list(BookingNotification.objects.filter(claim_token=token, status='sending'))
+
+
+def _mark_failed(notification, error):
+    max_attempts = getattr(settings, 'BOOKING_NOTIFICATIONS_MAX_ATTEMPTS', 5)
+    notification.attempts += 1
+    notification.last_error = error
+    notification.claim_token = None
+    if notification.attempts >= max_attempts:
+        notification.status = 'failed'
+    else:
+        notification.status = 'pending'
+        notification.next_attempt_at = timezone.now() + retry_delay(notification.attempts)
+    notification.save(update_fields=['attempts', 'last_error', 'claim_token', 'status', 'next_attempt_at'])
+
+
+def send_batch(notifications, connection=None):
+    """Отправить пачку через одно соединение; возвращает (отправлено, перенесено)"""
+    if not notifications:
+        return 0, 0
+
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        print(f"Ошибка подключения к почтовому серверу: {e}")
+        for notification in notifications:
+            _mark_failed(notification, f'Нет соединения: {e}')
+        return 0, len(notifications)
+
+    sent_ids = []
+    failed = 0
+    try:
+        for notification in notifications:
+            message = EmailMessage(
+                subject=notification.subject,
+                body=notification.body,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[notification.recipient],
+                connection=connection,
+            )
+            try:
+                # Соединение уже открыто - send_messages не переподключается для каждого письма
+                if connection.send_messages([message]):
+                    sent_ids.append(notification.id)
+                else:
+                    _mark_failed(notification, 'Письмо не принято сервером')
+                    failed += 1
+            except Exception as e:
+                print(f"Ошибка отправки email {notification.id}: {e}")
+                _mark_failed(notification, str(e))
+                failed += 1
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    if sent_ids:
+        BookingNotification.objects.filter(id__in=sent_ids).update(
+            status='sent', sent_at=timezone.now(), last_error='', claim_token=None,
+            attempts=F('attempts') + 1
+        )
+    return len(sent_ids), failed
+
+
+def dispatch_pending(batch_size=None, max_batches=None, connection=None):
+    """Отправить все готовые письма пачками; возвращает (отправлено, перенесено)"""
+    sent = failed = batches = 0
+    while max_batches is None or batches < max_batches:
+        notifications = claim_batch(batch_size)
+        if not notifications:
+            break
+        batch_sent, batch_failed = send_batch(notifications, connection)
+        sent += batch_sent
+        failed += batch_failed
+        batches += 1
+    return sent, failed
@@ -0,0 +1,76 @@
+# horses/overlaps.py - пересекающиеся брони, созданные до запрета пересечений
+"""
+Миграция 0006 не создаёт запрет пересечений, пока такие брони есть, и выводит
+их список; разбирает их оператор командой manage.py resolve_booking_overlaps.
+Брони читаются строками .values(*OVERLAP_FIELDS), поэтому функции работают и
+с историческими моделями миграции.
+"""
+from datetime import datetime, timedelta
+
+from .availability import booked_hours
+
+
+OVERLAP_FIELDS = ('id', 'horse_id', 'booking_date', 'booking_time', 'duration_hours',
+                  'status', 'is_paid', 'created_at')
+
+
+def booking_priority(booking):
+    """Какая из пересекающихся броней остаётся: оплаченная, затем подтверждённая, затем более ранняя"""
+    return not booking['is_paid'], booking['status'] == 'pending', booking['created_at']
+
+
+def find_overlaps(bookings, exact=False):
+    """Пары (бронь, бронь с более высоким приоритетом, с которой она пересекается).
+
+    exact - пересечение по точному интервалу (как exclusion constraint на PostgreSQL),
+    иначе по занятым часам (как HorseBookingSlot на остальных базах).
+    """
+    bookings = sorted(
+        (booking for booking in bookings if booking['status'] != 'cancelled'), key=booking_priority
+    )
+    # Точный интервал может начаться в один из предыдущих дней и перейти через полночь
+    longest = max((booking['duration_hours'] for booking in bookings), default=0)
+    days_back = longest // 24 + 1 if exact else 0
+
+    kept = {}  # (лошадь, дата начала) -> брони без пересечений
+    overlaps = []
+    for booking in bookings:
+        start = datetime.combine(booking['booking_date'], booking['booking_time'])
+        period = (start, start + timedelta(hours=booking['duration_hours']))
+        hours = set(booked_hours(booking['booking_time'], booking['duration_hours']))
+
+        conflict = None
+        for back in range(days_back + 1):
+            day = booking['booking_date'] - timedelta(days=back)
+            for other, other_period, other_hours in kept.get((booking['horse_id'], day), []):
+                if exact:
+                    overlapping = period[0] < other_period[1] and other_period[0] < period[1]
+                else:
+                    overlapping = bool(hours & other_hours)
+                if overlapping:
+                    conflict = other
+                    break
+            if conflict:
+                break
+
+        if conflict:
+            overlaps.append((booking, conflict))
+        else:
+            kept.setdefault((booking['horse_id'], booking['booking_date']), []).append((booking, period, hours))
+    return overlaps
+
+
+def describe_booking(booking):
+    return (
+        f"{booking['id']} (лошадь {booking['horse_id']}, "
+        f"{booking['booking_date']:%d.%m.%Y} {booking['booking_time']:%H:%M}, "
+        f"{booking['duration_hours']} ч., {booking['status']}"
+        f"{', оплачена' if booking['is_paid'] else ''})"
+    )
+
+
+def overlap_report(overlaps):
+    return '\n'.join(
+        f'   бронь {describe_booking(booking)} пересекается с бронью {describe_booking(conflict)}'
+        for booking, conflict in overlaps
+    )
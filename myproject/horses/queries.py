@@ -0,0 +1,67 @@
+# horses/queries.py - история бронирований пользователя без N+1
+import json
+
+from django.conf import settings
+
+from food.pagination import KeysetPaginator
+
+from .models import Horse, HorseBooking
+
+
+# Поля строки истории: бронь и лошадь одним запросом с JOIN, без объектов моделей
+BOOKING_HISTORY_FIELDS = (
+    'id', 'created_at', 'booking_date', 'booking_time', 'duration_hours',
+    'total_price', 'user_price_hour', 'base_price_hour', 'discount_percent',
+    'status', 'is_paid',
+    'horse__name', 'horse__breed', 'horse__image',
+)
+
+# Новые даты сверху; id делает порядок строгим для курсоров
+BOOKING_HISTORY_ORDERING = ('-booking_date', '-booking_time', '-id')
+
+DEFAULT_HORSE_IMAGE_URL = '/static/images/horse_default.jpg'
+
+BREED_NAMES = dict(Horse.BREED_CHOICES)
+STATUS_NAMES = dict(HorseBooking.STATUS_CHOICES)
+
+
+def booking_history(user):
+    """Брони пользователя в порядке истории, только полями строки"""
+    return HorseBooking.objects.filter(user=user).order_by(*BOOKING_HISTORY_ORDERING).values(
+        *BOOKING_HISTORY_FIELDS
+    )
+
+
+def booking_history_paginator():
+    return KeysetPaginator(BOOKING_HISTORY_ORDERING)
+
+
+def serialize_booking_row(row):
+    """Строка values() в формат API бронирований"""
+    image = row['horse__image']
+    return {
+        'id': str(row['id']),
+        'booking_number': f"BK{row['created_at'].strftime('%Y%m%d')}{row['id'].hex[:8].upper()}",
+        'horse_name': row['horse__name'],
+        'horse_breed': BREED_NAMES.get(row['horse__breed'], row['horse__breed']),
+        'horse_image': Horse._meta.get_field('image').storage.url(image) if image else DEFAULT_HORSE_IMAGE_URL,
+        'booking_date': row['booking_date'].strftime('%d.%m.%Y'),
+        'booking_time': row['booking_time'].strftime('%H:%M'),
+        'duration_hours': row['duration_hours'],
+        'total_price': float(row['total_price']),
+        'user_price_per_hour': float(row['user_price_hour']),
+        'base_price_per_hour': float(row['base_price_hour']),
+        'discount_percent': float(row['discount_percent']),
+        'status': row['status'],
+        'status_display': STATUS_NAMES.get(row['status'], row['status']),
+        'status_class': HorseBooking.STATUS_CLASSES.get(row['status'], 'status-pending'),
+        'is_paid': row['is_paid'],
+        'created_at': row['created_at'].strftime('%d.%m.%Y %H:%M'),
+    }
+
+
+def booking_history_ndjson(queryset, chunk_size=None):
+    """Строки NDJSON по одной брони; база читается частями по chunk_size строк"""
+    chunk_size = chunk_size or getattr(settings, 'BOOKINGS_EXPORT_CHUNK_SIZE', 500)
+    for row in queryset.iterator(chunk_size=chunk_size):
+        yield json.dumps(serialize_booking_row(row), ensure_ascii=False) + '\n'
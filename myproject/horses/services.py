@@ -0,0 +1,120 @@
+# horses/services.py - создание бронирования
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from . import availability
+from .models import Horse, HorseBooking, HorseBookingSlot
+
+
+class BookingError(Exception):
+    """Бронирование не может быть создано"""
+    status = 400
+
+
+class BookingConflict(BookingError):
+    """Время уже занято другой бронью"""
+    status = 409
+
+    def __init__(self, free_times):
+        self.free_times = free_times
+        super().__init__('Это время уже занято')
+
+
+def uses_slot_table(using='default'):
+    """На PostgreSQL пересечения запрещает exclusion constraint, на остальных базах - HorseBookingSlot"""
+    return connections[using].vendor != 'postgresql'
+
+
+def sync_booking_slots(booking, using='default'):
+    """Переписать занятые часы брони; пересечение с чужой бронью - IntegrityError"""
+    with transaction.atomic(using=using):
+        HorseBookingSlot.objects.using(using).filter(booking_id=booking.pk).delete()
+        if booking.status in availability.FREE_STATUSES:
+            return
+        HorseBookingSlot.objects.using(using).bulk_create([
+            HorseBookingSlot(booking_id=booking.pk, horse_id=booking.horse_id, date=booking.booking_date, hour=hour)
+            for hour in availability.booked_hours(booking.booking_time, booking.duration_hours)
+        ])
+
+
+def parse_booking_time(value):
+    try:
+        return datetime.strptime(value, '%H:%M').time()
+    except (TypeError, ValueError):
+        raise BookingError('Неверное время бронирования')
+
+
+def create_horse_booking(user, horse_id, data):
+    """Проверить занятость и создать бронь в одной транзакции или выбросить BookingError"""
+    try:
+        booking_date = availability.parse_day(data.get('booking_date'))
+    except (TypeError, ValueError):
+        raise BookingError('Неверная дата бронирования')
+    booking_time = parse_booking_time(data.get('booking_time'))
+    try:
+        duration_hours = int(data.get('duration_hours', 1))
+    except (TypeError, ValueError):
+        raise BookingError('Неверная длительность')
+
+    if duration_hours < 1:
+        raise BookingError('Неверная длительность')
+    if booking_time.minute or booking_time.second:
+        raise BookingError('Бронирование возможно только с начала часа')
+    if not availability.is_working_day(booking_date):
+        raise BookingError('В выходные дни бронирование недоступно')
+    if not availability.is_free(0, booking_time.hour, duration_hours):
+        raise BookingError(
+            f'Занятие должно пройти с {availability.OPENING_HOUR:02d}:00 до {availability.CLOSING_HOUR:02d}:00'
+        )
+    now = datetime.now()
+    if datetime.combine(booking_date, booking_time) <= now:
+        raise BookingError('Нельзя забронировать прошедшее время')
+
+    try:
+        with transaction.atomic():
+            # Первый запрос транзакции - запись в строку лошади: параллельные брони этой лошади
+            # выстраиваются в очередь (в SQLite блокируется сразу вся база), и проверка ниже
+            # видит все уже созданные брони.
+            if not Horse.objects.filter(id=horse_id, is_active=True).update(updated_at=timezone.now()):
+                raise BookingError('Лошадь не найдена')
+            horse = Horse.objects.get(id=horse_id)
+            if not horse.is_available:
+                raise BookingError('Лошадь в данный момент недоступна для бронирования')
+
+            # Занятость читаем из базы, а не из кэша
+            day_mask = availability.load_occupancy(horse.id, booking_date, booking_date).get(booking_date, 0)
+            if not availability.is_free(day_mask, booking_time.hour, duration_hours):
+                free_hours = availability.free_hours(
+                    day_mask, duration_hours, availability.earliest_hour(booking_date, now)
+                )
+                raise BookingConflict([f'{hour:02d}:00' for hour in free_hours])
+
+            # Рассчет цены с учетом подписки
+            base_price = horse.base_price_hour
+            user_price = horse.get_price_for_user(user)
+            if base_price > 0:
+                discount = ((float(base_price) - float(user_price)) / float(base_price)) * 100
+            else:
+                discount = 0
+
+            return HorseBooking.objects.create(
+                user=user,
+                horse=horse,
+                booking_date=booking_date,
+                booking_time=booking_time,
+                duration_hours=duration_hours,
+                client_name=data.get('client_name'),
+                client_phone=data.get('client_phone'),
+                client_comment=data.get('client_comment', ''),
+                base_price_hour=base_price,
+                user_price_hour=user_price,
+                discount_percent=discount,
+                total_price=user_price * Decimal(duration_hours),
+                status='confirmed'  # Сразу подтверждаем
+            )
+    except IntegrityError:
+        # Пересечение поймала сама база (exclusion constraint или уникальный занятый час)
+        raise BookingConflict([])
@@ -1,8 +1,11 @@
 # signals.py
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.conf import settings
+from .availability import bump_availability_version
+from .notifications import enqueue_booking_confirmation
+from .services import sync_booking_slots, uses_slot_table
+from .stats import STATS_FIELDS, booking_changed, stats_values
 from .models import HorseBooking
 
 @receiver(pre_save, sender=HorseBooking)
@@ -14,35 +17,54 @@ def update_booking_status(sender, instance, **kwargs):
         instance.status = 'completed'
 
 @receiver(post_save, sender=HorseBooking)
-def send_booking_notification(sender, instance, created, **kwargs):
+def send_booking_notification(sender, instance, created, raw=False, using='default', **kwargs):
     """
-    Отправка уведомлений при создании бронирования
+    Письмо о создании бронирования - в очередь BookingNotification в той же транзакции;
+    отправляет manage.py dispatch_booking_notifications
     """
-    if created and instance.user and instance.user.email:
-        try:
-            subject = f'Подтверждение бронирования лошади {instance.horse.name}'
-            message = f"""
-            Здравствуйте, {instance.client_name}!
-            
-            Ваше бронирование подтверждено:
-            Лошадь: {instance.horse.name}
-            Дата: {instance.booking_date.strftime('%d.%m.%Y')}
-            Время: {instance.booking_time.strftime('%H:%M')}
-            Длительность: {instance.duration_hours} час.
-            Стоимость: {instance.total_price} руб.
-            
-            Номер брони: BK{instance.created_at.strftime('%Y%m%d')}{str(instance.id).hex[:8].upper()}
-            
-            С уважением,
-            Алексинский конный завод
-            """
-            
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[instance.user.email],
-                fail_silently=True,
-            )
-        except Exception as e:
-            print(f"Ошибка отправки email: {e}")
\ No newline at end of file
+    if created and not raw:
+        enqueue_booking_confirmation(instance, using)
+
+@receiver(pre_save, sender=HorseBooking)
+def remember_booking_horse(sender, instance, raw=False, using='default', **kwargs):
+    """Запомнить прежнюю лошадь и поля статистики брони - одним запросом к старой строке"""
+    instance._previous_horse_id = None
+    instance._previous_stats = None
+    if instance._state.adding or raw:
+        return
+    previous = HorseBooking.objects.using(using).filter(pk=instance.pk).values('horse_id', *STATS_FIELDS).first()
+    if previous is not None:
+        # При переносе сбрасывается занятость обеих лошадей
+        instance._previous_horse_id = previous.pop('horse_id')
+        instance._previous_stats = previous
+
+def _bump_horses(*horse_ids):
+    # После коммита: иначе параллельный запрос успеет закэшировать старую занятость
+    for horse_id in {horse_id for horse_id in horse_ids if horse_id}:
+        transaction.on_commit(lambda horse_id=horse_id: bump_availability_version(horse_id))
+
+@receiver(post_save, sender=HorseBooking)
+def update_booking_slots(sender, instance, raw=False, using='default', **kwargs):
+    """Занятые часы брони в HorseBookingSlot (базы без exclusion constraint)"""
+    if not raw and uses_slot_table(using):
+        sync_booking_slots(instance, using)
+
+@receiver(post_save, sender=HorseBooking)
+def update_booking_availability(sender, instance, **kwargs):
+    """Сбросить кэш занятости лошади после создания, переноса или отмены брони"""
+    _bump_horses(instance.horse_id, getattr(instance, '_previous_horse_id', None))
+
+@receiver(post_delete, sender=HorseBooking)
+def delete_booking_availability(sender, instance, **kwargs):
+    _bump_horses(instance.horse_id)
+
+@receiver(post_save, sender=HorseBooking)
+def update_booking_stats(sender, instance, created, raw=False, using='default', **kwargs):
+    """Сводка BookingStats меняется на разницу между прежней и новой бронью"""
+    if raw:
+        return
+    booking_changed(getattr(instance, '_previous_stats', None), stats_values(instance), using)
+
+@receiver(post_delete, sender=HorseBooking)
+def delete_booking_stats(sender, instance, using='default', **kwargs):
+    booking_changed(stats_values(instance), None, using)
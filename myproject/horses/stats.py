@@ -0,0 +1,115 @@
+# horses/stats.py - статистика бронирований пользователя
+"""
+Счётчики и суммы броней пользователя хранятся в BookingStats и меняются на
+разницу между прежним и новым состоянием брони (сигналы HorseBooking), так что
+эндпоинт статистики читает одну строку. Полный пересчёт - один запрос с
+условной агрегацией (booking_aggregates).
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import BookingStats, HorseBooking
+
+
+# Брони, которые учитываются в потраченном и сэкономленном
+PAID_STATUSES = ('confirmed', 'completed')
+
+# Поля брони, от которых зависит статистика (прежние значения запоминает pre_save)
+STATS_FIELDS = ('user_id', 'status', 'total_price', 'base_price_hour', 'duration_hours')
+
+ZERO = Decimal('0')
+
+
+def booking_aggregates(queryset):
+    """Все показатели одним запросом с условной агрегацией"""
+    money = DecimalField(max_digits=12, decimal_places=2)
+    paid = Q(status__in=PAID_STATUSES)
+    savings = ExpressionWrapper(
+        F('base_price_hour') * F('duration_hours') - F('total_price'), output_field=money
+    )
+    return queryset.order_by().aggregate(
+        total_bookings=Count('id'),
+        confirmed_bookings=Count('id', filter=Q(status='confirmed')),
+        paid_bookings=Count('id', filter=paid),
+        total_spent=Coalesce(Sum('total_price', filter=paid), Value(ZERO), output_field=money),
+        total_savings=Coalesce(Sum(savings, filter=paid), Value(ZERO), output_field=money),
+    )
+
+
+def booking_contribution(values):
+    """Вклад одной брони в статистику; values - словарь полей STATS_FIELDS"""
+    is_paid = values['status'] in PAID_STATUSES
+    return {
+        'total_bookings': 1,
+        'confirmed_bookings': 1 if values['status'] == 'confirmed' else 0,
+        'paid_bookings': 1 if is_paid else 0,
+        'total_spent': values['total_price'] if is_paid else ZERO,
+        'total_savings': (
+            values['base_price_hour'] * values['duration_hours'] - values['total_price']
+            if is_paid else ZERO
+        ),
+    }
+
+
+def stats_values(booking):
+    return {field: getattr(booking, field) for field in STATS_FIELDS}
+
+
+def rebuild_booking_stats(user_id, using='default'):
+    """Пересчитать сводку пользователя по всем броням"""
+    totals = booking_aggregates(HorseBooking.objects.using(using).filter(user_id=user_id))
+    stats, _ = BookingStats.objects.using(using).update_or_create(user_id=user_id, defaults=totals)
+    return stats
+
+
+def adjust_booking_stats(user_id, delta, using='default', create=True):
+    """Добавить к сводке разницу одним UPDATE; сводки ещё нет - построить её по броням"""
+    if not any(delta.values()):
+        return
+    updated = BookingStats.objects.using(using).filter(user_id=user_id).update(
+        total_bookings=Greatest(F('total_bookings') + delta['total_bookings'], Value(0)),
+        confirmed_bookings=Greatest(F('confirmed_bookings') + delta['confirmed_bookings'], Value(0)),
+        paid_bookings=Greatest(F('paid_bookings') + delta['paid_bookings'], Value(0)),
+        total_spent=F('total_spent') + delta['total_spent'],
+        total_savings=F('total_savings') + delta['total_savings'],
+        updated_at=timezone.now(),
+    )
+    if updated or not create:
+        # Без сводки вычитать нечего: она будет построена при первом чтении
+        # (и не создаётся для пользователя, которого удаляют вместе с бронями)
+        return
+    try:
+        # Пересчёт уже видит текущее изменение брони - delta в нём учтена
+        with transaction.atomic(using=using):
+            rebuild_booking_stats(user_id, using)
+    except IntegrityError:
+        # Сводку параллельно создала другая транзакция - добавляем разницу к ней
+        adjust_booking_stats(user_id, delta, using)
+
+
+def booking_changed(previous, current, using='default'):
+    """Учесть создание (previous=None), изменение или удаление (current=None) брони"""
+    deltas = {}
+    if previous is not None:
+        user_delta = deltas.setdefault(previous['user_id'], {})
+        for key, value in booking_contribution(previous).items():
+            user_delta[key] = user_delta.get(key, 0) - value
+    if current is not None:
+        user_delta = deltas.setdefault(current['user_id'], {})
+        for key, value in booking_contribution(current).items():
+            user_delta[key] = user_delta.get(key, 0) + value
+    for user_id, delta in deltas.items():
+        owner = current is not None and current['user_id'] == user_id
+        adjust_booking_stats(user_id, delta, using, create=owner)
+
+
+def get_booking_stats(user):
+    """Сводка пользователя: одна строка BookingStats (строится при первом обращении)"""
+    try:
+        return BookingStats.objects.get(user=user)
+    except BookingStats.DoesNotExist:
+        return rebuild_booking_stats(user.id)
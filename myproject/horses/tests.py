@@ -1,3 +1,562 @@
-from django.test import TestCase
+import io
+import json
+import threading
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from importlib import import_module
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+
+from .availability import (CALENDAR_DAYS, FULL_DAY, OPENING_HOUR, SLOT_COUNT, booked_hours, booking_mask,
+                           calendar_occupancy, encode_masks, free_day_mask, free_hours, is_free,
+                           occupancy_from_rows, slot_mask)
+from .models import BookingNotification, BookingStats, Horse, HorseBooking
+from .notifications import claim_batch, dispatch_pending, retry_delay
+from .services import create_horse_booking
+from .stats import booking_aggregates, booking_contribution, get_booking_stats
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def next_weekday(weekday, weeks=1):
+    """Ближайший такой день недели не раньше чем через weeks недель"""
+    day = date.today() + timedelta(weeks=weeks)
+    return day + timedelta(days=(weekday - day.weekday()) % 7)
+
+
+def decode_masks(encoded):
+    """Обратное к encode_masks - так календарь читает ответ на клиенте"""
+    return [int(encoded[start:start + 3], 16) for start in range(0, len(encoded), 3)]
+
+
+def create_horse(name='Гром'):
+    return Horse.objects.create(
+        name=name, breed='orlov', age=8, color='гнедая', level='beginner',
+        base_price_hour=Decimal('2000'), premium_price_hour=Decimal('1800'), pro_price_hour=Decimal('1600'),
+    )
+
+
+def create_booking(user, horse, day, start, duration_hours=1, **fields):
+    price = horse.base_price_hour
+    values = dict(
+        user=user, horse=horse, booking_date=day, booking_time=start, duration_hours=duration_hours,
+        base_price_hour=price, user_price_hour=price, total_price=price * duration_hours,
+        client_name='Клиент', client_phone='+70000000000',
+    )
+    values.update(fields)
+    return HorseBooking.objects.create(**values)
+
+
+class AvailabilityMaskTests(SimpleTestCase):
+    """Битовые маски занятости: бит i - час OPENING_HOUR + i"""
+
+    def test_slot_mask(self):
+        self.assertEqual(slot_mask(OPENING_HOUR), 0b1)
+        self.assertEqual(slot_mask(OPENING_HOUR + 2, 3), 0b11100)
+        # Обрезается часами работы с обеих сторон
+        self.assertEqual(slot_mask(OPENING_HOUR - 2, 3), 0b1)
+        self.assertEqual(slot_mask(OPENING_HOUR + SLOT_COUNT - 1, 3), 1 << (SLOT_COUNT - 1))
+        self.assertEqual(slot_mask(OPENING_HOUR + SLOT_COUNT), 0)
+        self.assertEqual(slot_mask(OPENING_HOUR, SLOT_COUNT), FULL_DAY)
+
+    def test_booking_mask_rounds_partial_hour(self):
+        self.assertEqual(booking_mask(time(10, 0), 2), slot_mask(10, 2))
+        self.assertEqual(booking_mask(time(10, 30), 2), slot_mask(10, 3))
+        self.assertEqual(booked_hours(time(10, 30), 2), [10, 11, 12])
+        self.assertEqual(booked_hours(time(23, 0), 3), [23])
+
+    def test_is_free_checks_every_hour_and_working_hours(self):
+        busy = slot_mask(12, 2)  # 12:00-14:00
+        self.assertTrue(is_free(busy, 10, 2))
+        self.assertFalse(is_free(busy, 11, 2))
+        self.assertFalse(is_free(busy, 13))
+        self.assertTrue(is_free(busy, 14))
+        self.assertFalse(is_free(0, OPENING_HOUR - 1))
+        self.assertFalse(is_free(0, OPENING_HOUR + SLOT_COUNT - 1, 2))
+
+    def test_free_hours(self):
+        busy = slot_mask(12, 2)
+        self.assertEqual(free_hours(busy, 2), [9, 10, 14, 15, 16, 17, 18])
+        self.assertEqual(free_hours(busy, 2, not_before=15), [15, 16, 17, 18])
+        self.assertEqual(free_hours(FULL_DAY), [])
+
+    def test_occupancy_from_rows_merges_bookings(self):
+        day = date(2030, 1, 7)
+        masks = occupancy_from_rows([(day, time(9, 0), 1), (day, time(11, 0), 2), (day, time(10, 0), 1)])
+        self.assertEqual(masks, {day: slot_mask(9, 4)})
+
+    def test_free_day_mask(self):
+        now = datetime(2030, 1, 7, 12, 30)  # понедельник
+        today = now.date()
+        # Сегодня прошедшие часы и текущий закрыты
+        self.assertEqual(free_day_mask(today, 0, now), FULL_DAY & ~slot_mask(OPENING_HOUR, 13 - OPENING_HOUR))
+        self.assertEqual(free_day_mask(today + timedelta(days=1), slot_mask(9), now), FULL_DAY & ~1)
+        self.assertEqual(free_day_mask(today - timedelta(days=1), 0, now), 0)
+        self.assertEqual(free_day_mask(today + timedelta(days=5), 0, now), 0)  # суббота
+
+    def test_encode_masks(self):
+        self.assertEqual(encode_masks([0, FULL_DAY, 0b101]), '0007ff005')
+
+    def test_encode_masks_round_trip(self):
+        masks = [0, FULL_DAY, slot_mask(9), slot_mask(OPENING_HOUR + SLOT_COUNT - 1), slot_mask(12, 3) | 1]
+        masks += [(index * 0x2b5) & FULL_DAY for index in range(30)]
+
+        encoded = encode_masks(masks)
+
+        self.assertEqual(len(encoded), 3 * len(masks))
+        self.assertEqual(decode_masks(encoded), masks)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AvailabilityViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rider', password='pass')
+        self.horse = create_horse()
+        self.day = next_weekday(0)
+
+    def get_times(self, horse_id, **params):
+        url = reverse('get_available_times', args=[self.day.isoformat()])
+        return self.client.get(url, {'horse_id': horse_id, **params})
+
+    def test_times_follow_bookings(self):
+        self.assertEqual(len(self.get_times(str(self.horse.id)).json()['times']), SLOT_COUNT)
+
+        # Версия занятости лошади увеличивается после коммита - кэш дня сбрасывается
+        with self.captureOnCommitCallbacks(execute=True):
+            create_booking(self.user, self.horse, self.day, time(10, 0), 2)
+            create_booking(self.user, self.horse, self.day, time(15, 0), status='cancelled')
+
+        times = self.get_times(str(self.horse.id), duration=2).json()['times']
+        self.assertEqual(times, ['12:00', '13:00', '14:00', '15:00', '16:00', '17:00', '18:00'])
+
+    def test_invalid_horse_id_is_rejected(self):
+        for value in ('not-a-uuid', '1', f'{self.horse.id}x'):
+            with self.subTest(horse_id=value):
+                self.assertEqual(self.get_times(value).status_code, 400)
+                response = self.client.get(reverse('get_available_dates'), {'horse_id': value})
+                self.assertEqual(response.status_code, 400)
+                response = self.client.get(reverse('availability_calendar'), {'horse_id': value})
+                self.assertEqual(response.status_code, 400)
+
+    def test_horse_id_spellings_share_cache(self):
+        self.get_times(str(self.horse.id).upper())
+        with self.assertNumQueries(0):
+            response = self.get_times(self.horse.id.hex)
+        self.assertEqual(response.json()['horse_id'], str(self.horse.id))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AvailabilityCalendarTests(TestCase):
+    """Календарь занятости: одна выборка на все лошади, кэш по версиям лошадей, ETag"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('rider', password='pass')
+        self.horses = [create_horse('Буран'), create_horse('Гром')]
+        self.day = next_weekday(0)
+        self.offset = (self.day - date.today()).days
+        with self.captureOnCommitCallbacks(execute=True):
+            create_booking(self.user, self.horses[0], self.day, time(10, 0), 2)
+            create_booking(self.user, self.horses[0], self.day + timedelta(days=1), time(17, 0))
+            create_booking(self.user, self.horses[1], self.day, time(12, 0), status='cancelled')
+
+    def test_calendar_occupancy(self):
+        horse_ids = [horse.id for horse in self.horses]
+        start = date.today()
+        with self.assertNumQueries(1):
+            key, matrix = calendar_occupancy(horse_ids, start)
+        with self.assertNumQueries(0):
+            self.assertEqual(calendar_occupancy(list(reversed(horse_ids)), start), (key, matrix))
+
+        first, second = (matrix[str(horse_id)] for horse_id in horse_ids)
+        self.assertEqual(len(first), CALENDAR_DAYS)
+        self.assertEqual(first[self.offset], slot_mask(10, 2))
+        self.assertEqual(first[self.offset + 1], slot_mask(17))
+        self.assertEqual(sum(first), slot_mask(10, 2) + slot_mask(17))
+        # Отменённая бронь занятость не даёт
+        self.assertEqual(second, [0] * CALENDAR_DAYS)
+
+        # Бронь любой из лошадей - новый ключ
+        with self.captureOnCommitCallbacks(execute=True):
+            create_booking(self.user, self.horses[1], self.day, time(15, 0))
+        new_key, matrix = calendar_occupancy(horse_ids, start)
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(matrix[str(self.horses[1].id)][self.offset], slot_mask(15))
+
+    def test_calendar_view_round_trip(self):
+        url = reverse('availability_calendar')
+        response = self.client.get(url, {'horse_id': str(self.horses[0].id)})
+        data = response.json()
+
+        self.assertEqual(data['days'], CALENDAR_DAYS)
+        [horse] = data['horses']
+        free = decode_masks(horse['free'])
+        self.assertEqual(len(free), CALENDAR_DAYS)
+        self.assertEqual(free[self.offset], FULL_DAY & ~slot_mask(10, 2))
+        self.assertEqual(free[self.offset + 1], FULL_DAY & ~slot_mask(17))
+        self.assertEqual(free[self.offset + 2], FULL_DAY)
+
+        self.assertEqual(self.client.get(url, {'horse_id': str(self.horses[0].id)},
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class BookingStatsTests(TestCase):
+    """Сводка BookingStats после каждого изменения брони совпадает с полным пересчётом"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('rider', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        self.horse = create_horse()
+        self.day = next_weekday(1)
+
+    def assert_stats_consistent(self, *users):
+        for user in users or (self.user, self.other):
+            expected = booking_aggregates(HorseBooking.objects.filter(user=user))
+            stats = BookingStats.objects.filter(user=user).values(*expected).first()
+            if stats is None:
+                # Сводки ещё нет - строится при первом чтении
+                stats = {field: getattr(get_booking_stats(user), field) for field in expected}
+            self.assertEqual(stats, expected, user.username)
+
+    def test_booking_contribution(self):
+        values = {'user_id': 1, 'status': 'completed', 'total_price': Decimal('3000'),
+                  'base_price_hour': Decimal('2000'), 'duration_hours': 2}
+        self.assertEqual(booking_contribution(values), {
+            'total_bookings': 1, 'confirmed_bookings': 0, 'paid_bookings': 1,
+            'total_spent': Decimal('3000'), 'total_savings': Decimal('1000'),
+        })
+        values['status'] = 'pending'
+        contribution = booking_contribution(values)
+        self.assertEqual((contribution['paid_bookings'], contribution['total_spent']), (0, 0))
+
+    def test_stats_follow_booking_changes(self):
+        first = create_booking(self.user, self.horse, self.day, time(9, 0), 2,
+                               user_price_hour=Decimal('1500'), total_price=Decimal('3000'))
+        second = create_booking(self.user, self.horse, self.day, time(12, 0))
+        self.assert_stats_consistent()
+        self.assertTrue(BookingStats.objects.filter(user=self.user).exists())
+
+        first.status = 'confirmed'
+        first.save()
+        self.assert_stats_consistent()
+        self.assertEqual(get_booking_stats(self.user).total_savings, Decimal('1000'))
+
+        # Оплата переводит подтверждённую бронь в 'completed'
+        first.is_paid = True
+        first.save()
+        second.status = 'confirmed'
+        second.total_price = Decimal('1800')
+        second.save()
+        self.assert_stats_consistent()
+
+        # Перенос брони на другого пользователя меняет обе сводки
+        second.user = self.other
+        second.save()
+        self.assert_stats_consistent()
+
+        first.status = 'cancelled'
+        first.save()
+        second.delete()
+        self.assert_stats_consistent()
+        stats = get_booking_stats(self.user)
+        self.assertEqual((stats.total_bookings, stats.paid_bookings, stats.total_spent), (1, 0, 0))
+
+    def test_stats_read_is_one_query(self):
+        create_booking(self.user, self.horse, self.day, time(9, 0), status='confirmed')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_booking_stats(self.user).confirmed_bookings, 1)
+
+    def test_deleted_user_gets_no_stats(self):
+        create_booking(self.user, self.horse, self.day, time(9, 0))
+        user_id = self.user.id
+        self.user.delete()
+        self.assertFalse(BookingStats.objects.filter(user_id=user_id).exists())
+
+
+class BookingOverlapTests(TestCase):
+    """Брони, пересекающиеся со времён до запрета пересечений: миграция 0006 и resolve_booking_overlaps"""
+
+    def setUp(self):
+        user = User.objects.create_user('rider', email='rider@example.com', password='pass')
+        horse = create_horse()
+        day = next_weekday(2)
+        price = horse.base_price_hour
+        rows = {
+            'early': (horse, time(10, 0), 2, {}),
+            'paid': (horse, time(11, 0), 1, {'status': 'confirmed', 'is_paid': True}),
+            'paid_pending': (horse, time(11, 0), 1, {'is_paid': True}),
+            'confirmed': (horse, time(12, 0), 1, {'status': 'confirmed'}),
+            'partial': (horse, time(12, 30), 1, {}),
+            'free': (horse, time(14, 0), 1, {}),
+            'other_horse': (create_horse('Буря'), time(10, 0), 1, {}),
+        }
+        # Брони старой схемы: bulk_create не занимает часы в HorseBookingSlot
+        self.bookings = dict(zip(rows, HorseBooking.objects.bulk_create(
+            HorseBooking(
+                user=user, horse=booking_horse, booking_date=day, booking_time=start, duration_hours=duration,
+                base_price_hour=price, user_price_hour=price, total_price=price * duration,
+                client_name='Клиент', client_phone='+70000000000', **fields,
+            )
+            for booking_horse, start, duration, fields in rows.values()
+        )))
+
+    def statuses(self):
+        return {key: HorseBooking.objects.get(pk=booking.pk).status for key, booking in self.bookings.items()}
+
+    def test_migration_stops_with_report(self):
+        migration = import_module('horses.migrations.0006_booking_no_overlap')
+        with self.assertRaises(CommandError) as raised:
+            migration.check_no_overlapping_bookings(apps, SimpleNamespace(connection=connection))
+
+        message = str(raised.exception)
+        self.assertIn('Пересекающихся броней: 3', message)
+        for key in ('early', 'paid_pending', 'partial'):
+            self.assertIn(f'бронь {self.bookings[key].id}', message)
+        # Миграция ничего не меняет
+        self.assertNotIn('cancelled', self.statuses().values())
+
+    def test_command_reports_without_apply(self):
+        output = io.StringIO()
+        call_command('resolve_booking_overlaps', stdout=output)
+
+        self.assertIn('Будет отменено неоплаченных броней: 2', output.getvalue())
+        self.assertNotIn('cancelled', self.statuses().values())
+        self.assertFalse(BookingNotification.objects.exists())
+
+    def test_command_apply_cancels_unpaid_and_notifies(self):
+        call_command('resolve_booking_overlaps', '--apply', stdout=io.StringIO())
+
+        self.assertEqual(self.statuses(), {
+            'early': 'cancelled', 'paid': 'confirmed', 'paid_pending': 'pending', 'confirmed': 'confirmed',
+            'partial': 'cancelled', 'free': 'pending', 'other_horse': 'pending',
+        })
+        notified = set(BookingNotification.objects.values_list('booking_id', 'subject'))
+        self.assertEqual({booking_id for booking_id, _ in notified},
+                         {self.bookings['early'].id, self.bookings['partial'].id})
+        self.assertTrue(all(subject.startswith('Отмена') for _, subject in notified))
+
+        # Осталась только оплаченная пара - её разбирают вручную
+        output = io.StringIO()
+        call_command('resolve_booking_overlaps', stdout=output)
+        self.assertIn('Пересекающихся броней: 1', output.getvalue())
+        self.assertIn('Будет отменено неоплаченных броней: 0', output.getvalue())
+
+
+class RecordingEmailBackend(locmem.EmailBackend):
+    """locmem-бэкенд вместо SMTP: запоминает соединения и не принимает адреса с 'fail'"""
+    connections = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened = 0
+        self.sent = 0
+        RecordingEmailBackend.connections.append(self)
+
+    def open(self):
+        self.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        if any('fail' in address for message in messages for address in message.to):
+            raise ConnectionError('550 mailbox unavailable')
+        self.sent += len(messages)
+        return super().send_messages(messages)
+
+
+class Rollback(Exception):
+    pass
+
+
+@override_settings(CACHES=LOCMEM_CACHE, EMAIL_BACKEND='horses.tests.RecordingEmailBackend')
+class BookingNotificationTests(TestCase):
+    """Очередь писем о бронях (horses.notifications)"""
+
+    def setUp(self):
+        RecordingEmailBackend.connections = []
+        self.user = User.objects.create_user('rider', email='rider@example.com', password='pass')
+        self.horse = create_horse()
+        self.day = next_weekday(3)
+
+    def book(self, hour, user=None):
+        return create_booking(user or self.user, self.horse, self.day, time(hour, 0))
+
+    def test_outbox_row_is_part_of_booking_transaction(self):
+        data = {'booking_date': self.day.isoformat(), 'booking_time': '10:00', 'duration_hours': 1,
+                'client_name': 'Клиент', 'client_phone': '+70000000000'}
+        with self.assertRaises(Rollback):
+            with transaction.atomic():
+                booking = create_horse_booking(self.user, self.horse.id, data)
+                self.assertEqual(list(BookingNotification.objects.values_list('booking_id', flat=True)),
+                                 [booking.id])
+                raise Rollback
+        self.assertFalse(BookingNotification.objects.exists())
+
+        booking = create_horse_booking(self.user, self.horse.id, data)
+        notification = BookingNotification.objects.get()
+        self.assertEqual((notification.booking_id, notification.recipient, notification.status),
+                         (booking.id, 'rider@example.com', 'pending'))
+        # Письмо только в очереди - бронь не ждёт почтовый сервер
+        self.assertEqual(mail.outbox, [])
+
+    def test_claim_batch_does_not_double_claim(self):
+        for hour in range(9, 14):
+            self.book(hour)
+
+        batches = [claim_batch(3), claim_batch(3), claim_batch(3)]
+
+        self.assertEqual([len(batch) for batch in batches], [3, 2, 0])
+        claimed = [notification.id for batch in batches for notification in batch]
+        self.assertEqual(len(set(claimed)), 5)
+        self.assertEqual(len({batch[0].claim_token for batch in batches[:2]}), 2)
+        self.assertFalse(BookingNotification.objects.exclude(status='sending').exists())
+
+    def test_one_connection_per_batch(self):
+        for hour in range(9, 14):
+            self.book(hour)
+
+        self.assertEqual(dispatch_pending(batch_size=2), (5, 0))
+
+        connections = RecordingEmailBackend.connections
+        self.assertEqual([(backend.opened, backend.sent) for backend in connections], [(1, 2), (1, 2), (1, 1)])
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(set(BookingNotification.objects.values_list('status', 'attempts')), {('sent', 1)})
+
+    def test_failed_send_backs_off_exponentially(self):
+        self.book(9)
+        failing = self.book(10, User.objects.create_user('other', email='fail@example.com', password='pass'))
+
+        for attempt in (1, 2, 3):
+            before = timezone.now()
+            self.assertEqual(dispatch_pending(), (1 if attempt == 1 else 0, 1))
+            after = timezone.now()
+
+            notification = BookingNotification.objects.get(booking=failing)
+            self.assertEqual((notification.status, notification.attempts), ('pending', attempt))
+            self.assertIn('550', notification.last_error)
+            delay = timedelta(seconds=60 * 2 ** (attempt - 1))
+            self.assertTrue(before + delay <= notification.next_attempt_at <= after + delay)
+
+            # Раньше срока письмо не забирается
+            self.assertEqual(dispatch_pending(), (0, 0))
+            notification.next_attempt_at = timezone.now()
+            notification.save(update_fields=['next_attempt_at'])
+
+        self.assertEqual(retry_delay(20), timedelta(seconds=3600))
+
+    @override_settings(BOOKING_NOTIFICATIONS_MAX_ATTEMPTS=2)
+    def test_failed_after_max_attempts(self):
+        failing = self.book(10, User.objects.create_user('other', email='fail@example.com', password='pass'))
+        BookingNotification.objects.filter(booking=failing).update(attempts=1)
+
+        self.assertEqual(dispatch_pending(), (0, 1))
+        self.assertEqual(BookingNotification.objects.get(booking=failing).status, 'failed')
+        self.assertEqual(dispatch_pending(), (0, 0))
+
+
+class BookingHistoryTests(TestCase):
+    """История бронирований: курсоры по (-дата, -время, -id) и выгрузка NDJSON"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('rider', password='pass')
+        other = User.objects.create_user('other', password='pass')
+        horses = [create_horse(name) for name in ('Гром', 'Буран', 'Искра')]
+        later, earlier = next_weekday(1, weeks=2), next_weekday(1)
+        # Одинаковые дата и время у разных лошадей - порядок решает id
+        for day in (later, earlier):
+            for start in (time(15, 0), time(10, 0)):
+                for horse in horses:
+                    create_booking(self.user, horse, day, start)
+        create_booking(other, horses[0], earlier, time(12, 0))
+        self.client.force_login(self.user)
+        self.url = reverse('get_user_bookings_api')
+        rows = HorseBooking.objects.filter(user=self.user).values_list('booking_date', 'booking_time', 'id')
+        self.expected = [str(booking_id) for _, _, booking_id in sorted(rows, reverse=True)]
+
+    def test_cursor_round_trip_with_ties(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size': 4, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(self.url, params).json()
+            self.assertTrue(data['success'])
+            seen.extend(booking['id'] for booking in data['bookings'])
+            cursor = data['next_cursor']
+            if not data['has_next']:
+                break
+
+        self.assertEqual(len(self.expected), 12)
+        self.assertEqual(seen, self.expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'мусор'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+    @override_settings(BOOKINGS_EXPORT_CHUNK_SIZE=5)
+    def test_ndjson_export_streams_every_booking(self):
+        for params, headers in (({'format': 'ndjson'}, {}), ({}, {'HTTP_ACCEPT': 'application/x-ndjson'})):
+            with self.subTest(params=params, headers=headers):
+                response = self.client.get(self.url, params, **headers)
+
+                self.assertTrue(response.streaming)
+                self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+                self.assertIn('attachment', response['Content-Disposition'])
+                lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+                rows = [json.loads(line) for line in lines]
+                self.assertEqual([row['id'] for row in rows], self.expected)
+                self.assertEqual(rows[0]['horse_breed'], 'Орловский рысак')
+                self.assertEqual(rows[0]['booking_time'], '15:00')
+
+
+class ConcurrentClaimTests(TransactionTestCase):
+    """Параллельные отправители не забирают одно письмо дважды"""
+
+    workers = 4
+
+    def test_parallel_claims_are_disjoint(self):
+        user = User.objects.create_user('rider', email='rider@example.com', password='pass')
+        horse = create_horse()
+        for hour in range(9, 19):
+            create_booking(user, horse, next_weekday(3), time(hour, 0))
+
+        claimed = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.workers)
+
+        def claim():
+            try:
+                barrier.wait()
+                while True:
+                    batch = claim_batch(2)
+                    if not batch:
+                        break
+                    with lock:
+                        claimed.extend(notification.id for notification in batch)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=claim) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(claimed), sorted(BookingNotification.objects.values_list('id', flat=True)))
+        self.assertEqual(len(claimed), 10)
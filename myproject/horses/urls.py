@@ -11,6 +11,7 @@ urlpatterns = [
     path('my-bookings/', views.get_user_bookings, name='get_user_bookings'),
     path('cancel-booking/<uuid:booking_id>/', views.cancel_booking, name='cancel_booking'),
     path('check-availability/', views.check_booking_availability, name='check_booking_availability'),
+    path('api/calendar/', views.availability_calendar, name='availability_calendar'),
     path('booking-stats/', views.get_user_booking_stats, name='get_user_booking_stats'),
     path('api/user-bookings/', views.get_user_bookings_api, name='get_user_bookings_api'),  # НОВЫЙ URL
 ]
\ No newline at end of file
@@ -1,12 +1,19 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET
 from django.utils import timezone
 import json
+import uuid
 from datetime import datetime, timedelta
 from .models import Horse, HorseBooking
-from django.db.models import Sum  # Добавляем импорт Sum
+from . import availability
+from .services import BookingConflict, BookingError, create_horse_booking
+from .stats import get_booking_stats
+from .queries import booking_history, booking_history_ndjson, booking_history_paginator, serialize_booking_row
+from food.pagination import CursorError, parse_page_size
 from user_profile.models import UserProfile
 from decimal import Decimal
 
@@ -65,21 +72,38 @@ def get_horse_details(request, horse_id):
             'message': f'Ошибка получения данных лошади: {str(e)}'
         })
 
+def _duration_param(request):
+    try:
+        return max(1, int(request.GET.get('duration', 1)))
+    except (TypeError, ValueError):
+        return 1
+
+def _horse_id_param(request):
+    """?horse_id= как UUID (None, если не указан); неверное значение - ValueError"""
+    value = request.GET.get('horse_id')
+    return uuid.UUID(value) if value else None
+
+def _invalid_horse_id():
+    return JsonResponse({'success': False, 'message': 'Неверный идентификатор лошади'}, status=400)
+
 def get_available_dates(request):
-    """Получение доступных дат для бронирования"""
+    """Получение доступных дат для бронирования (?horse_id= - только дни со свободным временем)"""
+    try:
+        horse_id = _horse_id_param(request)
+    except ValueError:
+        return _invalid_horse_id()
     try:
         # Берем ближайшие 30 дней
         start_date = datetime.now().date()
-        end_date = start_date + timedelta(days=30)
+        end_date = start_date + timedelta(days=availability.BOOKING_DAYS_AHEAD)
         
-        available_dates = []
-        current_date = start_date
-        
-        while current_date <= end_date:
-            # Проверяем, не выходной ли (суббота/воскресенье)
-            if current_date.weekday() < 5:  # Пн-Пт
-                available_dates.append(current_date.strftime('%Y-%m-%d'))
-            current_date += timedelta(days=1)
+        # Рабочие дни; для лошади - по маскам занятости, загруженным одним запросом
+        available_dates = [
+            day.strftime('%Y-%m-%d')
+            for day in availability.available_dates(
+                horse_id, start_date, duration_hours=_duration_param(request)
+            )
+        ]
         
         return JsonResponse({
             'success': True,
@@ -95,28 +119,33 @@ def get_available_dates(request):
         })
 
 def get_available_times(request, date_str):
-    """Получение доступного времени на конкретную дату"""
+    """Получение свободного времени лошади (?horse_id=) на конкретную дату"""
+    try:
+        horse_id = _horse_id_param(request)
+    except ValueError:
+        return _invalid_horse_id()
     try:
         date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+        duration = _duration_param(request)
         
-        # Время работы: с 9:00 до 20:00
-        start_time = datetime.combine(date_obj, datetime.min.time().replace(hour=9))
-        end_time = datetime.combine(date_obj, datetime.min.time().replace(hour=20))
-        
-        available_times = []
-        current_time = start_time
-        
-        while current_time < end_time:
-            available_times.append(current_time.strftime('%H:%M'))
-            current_time += timedelta(hours=1)
+        if horse_id:
+            available_times = availability.available_times(horse_id, date_obj, duration)
+        else:
+            # Без лошади - просто часы работы
+            available_times = [
+                f'{hour:02d}:00'
+                for hour in availability.free_hours(0, duration, availability.earliest_hour(date_obj))
+            ]
         
         return JsonResponse({
             'success': True,
             'date': date_str,
+            'horse_id': str(horse_id) if horse_id else None,
+            'duration_hours': duration,
             'times': available_times,
             'opening_hours': {
-                'start': '09:00',
-                'end': '20:00'
+                'start': f'{availability.OPENING_HOUR:02d}:00',
+                'end': f'{availability.CLOSING_HOUR:02d}:00'
             }
         })
         
@@ -126,6 +155,78 @@ def get_available_times(request, date_str):
             'message': f'Ошибка получения времени: {str(e)}'
         })
 
+def _calendar_data(request):
+    """Лошади и маски занятости для календаря; считаются один раз за запрос (ETag и ответ)"""
+    if hasattr(request, '_calendar_data'):
+        return request._calendar_data
+    
+    horses = Horse.objects.filter(is_active=True).order_by('name')
+    # Неверный идентификатор - ValueError до обращения к базе и кэшу
+    horse_ids = [
+        uuid.UUID(value) for param in request.GET.getlist('horse_id') for value in param.split(',') if value
+    ]
+    if horse_ids:
+        horses = horses.filter(id__in=horse_ids)
+    try:
+        days = max(1, min(int(request.GET.get('days', availability.CALENDAR_DAYS)), availability.CALENDAR_DAYS))
+    except (TypeError, ValueError):
+        days = availability.CALENDAR_DAYS
+    
+    now = datetime.now()
+    horses = list(horses.values('id', 'name', 'is_available'))
+    cache_key, matrix = availability.calendar_occupancy(
+        [horse['id'] for horse in horses], now.date(), days
+    )
+    request._calendar_data = (horses, matrix, days, now, cache_key)
+    return request._calendar_data
+
+def _calendar_etag(request):
+    try:
+        horses, matrix, days, now, cache_key = _calendar_data(request)
+    except ValueError:
+        return None
+    # Сегодняшние часы закрываются по мере наступления - в ETag входит текущий час
+    return f'{cache_key}-{now.strftime("%Y%m%d%H")}'
+
+@require_GET
+@condition(etag_func=_calendar_etag)
+def availability_calendar(request):
+    """Свободные часы всех активных лошадей (или ?horse_id=...) на 30 дней вперёд одним ответом.
+
+    Для каждой лошади free - строка по 3 шестнадцатеричных знака на день, начиная с start;
+    бит i маски дня означает, что в opening_hour + i можно начать часовое занятие.
+    """
+    try:
+        horses, matrix, days, now, cache_key = _calendar_data(request)
+    except ValueError:
+        return _invalid_horse_id()
+    
+    start_date = now.date()
+    dates = [start_date + timedelta(days=offset) for offset in range(days)]
+    horses_data = []
+    for horse in horses:
+        busy = matrix.get(str(horse['id'])) or [0] * days
+        if horse['is_available']:
+            free = [availability.free_day_mask(day, mask, now) for day, mask in zip(dates, busy)]
+        else:
+            free = [0] * days
+        horses_data.append({
+            'id': str(horse['id']),
+            'name': horse['name'],
+            'free': availability.encode_masks(free),
+        })
+    
+    response = JsonResponse({
+        'success': True,
+        'start': start_date.strftime('%Y-%m-%d'),
+        'days': days,
+        'opening_hour': availability.OPENING_HOUR,
+        'closing_hour': availability.CLOSING_HOUR,
+        'horses': horses_data,
+    })
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
 @login_required
 @csrf_exempt
 def create_booking(request):
@@ -140,8 +241,6 @@ def create_booking(request):
             booking_time = data.get('booking_time')
             client_name = data.get('client_name')
             client_phone = data.get('client_phone')
-            client_comment = data.get('client_comment', '')
-            duration_hours = int(data.get('duration_hours', 1))
             
             # Валидация данных
             if not all([horse_id, booking_date, booking_time, client_name, client_phone]):
@@ -150,44 +249,24 @@ def create_booking(request):
                     'message': 'Заполните все обязательные поля'
                 })
             
-            # Проверка существования лошади
+            # Проверка занятости и создание брони - одна транзакция
             try:
-                horse = Horse.objects.get(id=horse_id)
-            except Horse.DoesNotExist:
+                booking = create_horse_booking(user, horse_id, data)
+            except BookingConflict as e:
                 return JsonResponse({
                     'success': False,
-                    'message': 'Лошадь не найдена'
-                })
-            
-            # Рассчет цены с учетом подписки ДО создания брони
-            user_profile = user.profile
-            base_price = horse.base_price_hour
-            user_price = horse.get_price_for_user(user)
-            
-            # ПРАВИЛЬНЫЙ расчет скидки
-            if base_price > 0:
-                discount = ((float(base_price) - float(user_price)) / float(base_price)) * 100
-            else:
-                discount = 0
-            
-            total_price = user_price * Decimal(duration_hours)
+                    'message': str(e),
+                    'available_times': e.free_times
+                }, status=e.status)
+            except BookingError as e:
+                return JsonResponse({'success': False, 'message': str(e)}, status=e.status)
             
-            # Создание бронирования
-            booking = HorseBooking.objects.create(
-                user=user,
-                horse=horse,
-                booking_date=booking_date,
-                booking_time=booking_time,
-                duration_hours=duration_hours,
-                client_name=client_name,
-                client_phone=client_phone,
-                client_comment=client_comment,
-                base_price_hour=base_price,
-                user_price_hour=user_price,
-                discount_percent=discount,
-                total_price=total_price,
-                status='confirmed'  # Сразу подтверждаем
-            )
+            horse = booking.horse
+            duration_hours = booking.duration_hours
+            total_price = booking.total_price
+            user_price = booking.user_price_hour
+            base_price = booking.base_price_hour
+            discount = booking.discount_percent
             
             # Генерация номера брони
             booking_number = f"BK{booking.created_at.strftime('%Y%m%d')}{str(booking.id).split('-')[0].upper()}"
@@ -328,15 +407,18 @@ def check_booking_availability(request):
                 'message': 'Лошадь в данный момент недоступна для бронирования'
             })
         
-        # Проверяем, не занято ли это время
-        existing_booking = HorseBooking.objects.filter(
-            horse=horse,
-            booking_date=booking_date,
-            booking_time=booking_time,
-            status__in=['pending', 'confirmed']
-        ).exists()
+        # Проверяем, не занято ли это время (с учётом длительности соседних броней)
+        try:
+            day = availability.parse_day(booking_date)
+            start_hour = datetime.strptime(booking_time, '%H:%M').hour
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'message': 'Неверная дата или время'
+            })
+        day_mask = availability.day_occupancy(horse.id, day)
         
-        if existing_booking:
+        if not availability.is_free(day_mask, start_hour, _duration_param(request)):
             return JsonResponse({
                 'success': True,
                 'available': False,
@@ -357,36 +439,20 @@ def check_booking_availability(request):
 
 @login_required
 def get_user_booking_stats(request):
-    """Получить статистику бронирований пользователя"""
-    user = request.user
-    
+    """Получить статистику бронирований пользователя (одна строка BookingStats)"""
     try:
-        total_bookings = HorseBooking.objects.filter(user=user).count()
-        confirmed_bookings = HorseBooking.objects.filter(user=user, status='confirmed').count()
-        total_spent = HorseBooking.objects.filter(user=user, status__in=['confirmed', 'completed']).aggregate(
-            total=Sum('total_price')
-        )['total'] or 0
-        
-        # Расчет сэкономленных средств
-        profile = user.profile
-        total_savings = 0
-        if profile.subscription_active:
-            bookings = HorseBooking.objects.filter(user=user, status__in=['confirmed', 'completed'])
-            for booking in bookings:
-                if profile.subscription == 'premium':
-                    savings = (booking.base_price_hour - booking.horse.premium_price_hour) * booking.duration_hours
-                elif profile.subscription == 'pro':
-                    savings = (booking.base_price_hour - booking.horse.pro_price_hour) * booking.duration_hours
-                total_savings += float(savings)
+        stats = get_booking_stats(request.user)
         
         return JsonResponse({
             'success': True,
             'stats': {
-                'total_bookings': total_bookings,
-                'confirmed_bookings': confirmed_bookings,
-                'total_spent': float(total_spent),
-                'total_savings': total_savings,
-                'average_booking_value': float(total_spent / total_bookings) if total_bookings > 0 else 0
+                'total_bookings': stats.total_bookings,
+                'confirmed_bookings': stats.confirmed_bookings,
+                'total_spent': float(stats.total_spent),
+                'total_savings': float(stats.total_savings),
+                'average_booking_value': (
+                    float(stats.total_spent / stats.total_bookings) if stats.total_bookings > 0 else 0
+                )
             }
         })
         
@@ -395,38 +461,43 @@ def get_user_booking_stats(request):
             'success': False,
             'message': f'Ошибка получения статистики: {str(e)}'
         })
+
+def _wants_ndjson(request):
+    return request.GET.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', '')
+
 @login_required
 def get_user_bookings_api(request):
-    """Получить бронирования пользователя для AJAX"""
-    user = request.user
-    bookings = HorseBooking.objects.filter(user=user).order_by('-booking_date', '-booking_time')
+    """Бронирования пользователя для AJAX: страница по курсору или выгрузка всей истории в NDJSON"""
+    bookings = booking_history(request.user)
     
-    bookings_data = []
-    for booking in bookings:
-        booking_number = f"BK{booking.created_at.strftime('%Y%m%d')}{str(booking.id).split('-')[0].upper()}"
-        
-        bookings_data.append({
-            'id': str(booking.id),
-            'booking_number': booking_number,
-            'horse_name': booking.horse.name,
-            'horse_breed': booking.horse.get_breed_display(),
-            'horse_image': booking.horse.image.url if booking.horse.image else '/static/images/horse_default.jpg',
-            'booking_date': booking.booking_date.strftime('%d.%m.%Y'),
-            'booking_time': booking.booking_time.strftime('%H:%M'),
-            'duration_hours': booking.duration_hours,
-            'total_price': float(booking.total_price),
-            'user_price_per_hour': float(booking.user_price_hour),
-            'base_price_per_hour': float(booking.base_price_hour),
-            'discount_percent': float(booking.discount_percent),
-            'status': booking.status,
-            'status_display': booking.get_display_status(),
-            'status_class': booking.get_status_class(),
-            'is_paid': booking.is_paid,
-            'created_at': booking.created_at.strftime('%d.%m.%Y %H:%M')
-        })
+    # Выгрузка: строки уходят клиенту по мере чтения из базы, история целиком в памяти не собирается
+    if _wants_ndjson(request):
+        response = StreamingHttpResponse(
+            booking_history_ndjson(bookings),
+            content_type='application/x-ndjson; charset=utf-8'
+        )
+        response['Content-Disposition'] = 'attachment; filename="bookings.ndjson"'
+        response['Cache-Control'] = 'no-cache'
+        return response
+    
+    page_size = parse_page_size(
+        request.GET.get('page_size'),
+        default=settings.BOOKINGS_PAGE_SIZE,
+        maximum=settings.BOOKINGS_PAGE_SIZE_MAX
+    )
+    try:
+        page = booking_history_paginator().paginate(
+            bookings, cursor=request.GET.get('cursor'), page_size=page_size
+        )
+    except CursorError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    
+    bookings_data = [serialize_booking_row(row) for row in page]
     
     return JsonResponse({
         'success': True,
         'bookings': bookings_data,
-        'count': len(bookings_data)
+        'count': len(bookings_data),
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next
     })
\ No newline at end of file
@@ -11,18 +11,16 @@ def index(request):
     """Главная страница"""
     context = {}
     if request.user.is_authenticated:
-        try:
-            profile = request.user.profile
-            context['user_profile'] = {
-                'username': request.user.username,
-                'first_name': request.user.first_name,
-                'last_name': request.user.last_name,
-                'subscription': profile.subscription,
-                'subscription_display': profile.get_subscription_display_name(),
-                'is_premium': profile.is_premium()
-            }
-        except:
-            pass
+        # Подписка из контекста цен запроса (профиль уже загружен вместе с пользователем)
+        pricing = request.pricing
+        context['user_profile'] = {
+            'username': request.user.username,
+            'first_name': request.user.first_name,
+            'last_name': request.user.last_name,
+            'subscription': pricing.subscription,
+            'subscription_display': pricing.subscription_display,
+            'is_premium': pricing.is_active
+        }
     return render(request, 'main/index.html', context)
 
 @csrf_exempt
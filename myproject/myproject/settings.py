@@ -29,6 +29,68 @@ AI_TEMPERATURE = 0.7
 AI_DEFAULT_MODEL = "meta-llama/Llama-3.3-70B-Instruct"
 AI_TEST_MODE = False  # По умолчанию используем реальный API
 
+# HTTP-клиент ИИ: общий пул keep-alive соединений на процесс
+AI_HTTP_POOL_SIZE = int(os.getenv("AI_HTTP_POOL_SIZE", "10"))
+AI_MAX_CONCURRENT_REQUESTS = int(os.getenv("AI_MAX_CONCURRENT_REQUESTS", "8"))  # одновременных запросов к API
+AI_REQUEST_TIMEOUT = 60  # секунд на ответ модели
+AI_CONNECT_TIMEOUT = 10
+AI_ACQUIRE_TIMEOUT = 30  # сколько ждать свободный слот, прежде чем вернуть ответ о таймауте
+AI_CHAT_HISTORY_MESSAGES = 20  # максимум сообщений истории чата в запросе к модели (вместе с новым вопросом)
+AI_CHAT_CONTEXT_TOKENS = 1500  # бюджет истории чата в токенах (оценка food.chat_context.estimate_tokens)
+AI_CHAT_SUMMARY_ENABLED = True  # краткое содержание выпавших из контекста сообщений
+AI_CHAT_SUMMARY_TOKENS = 300
+
+# Очередь консультаций ИИ (обрабатывает manage.py run_ai_worker)
+AI_JOBS_INLINE = os.getenv("AI_JOBS_INLINE", "False") == "True"  # выполнять сразу в запросе, без воркера
+AI_JOBS_MAX_ATTEMPTS = 3
+AI_JOBS_RETRY_BASE_SECONDS = 30  # задержка повтора после ошибки: 30 с, 1 мин, 2 мин...
+AI_JOBS_RETRY_MAX_SECONDS = 900
+AI_JOBS_STALE_SECONDS = 600  # задача "в работе" дольше этого считается зависшей
+
+# Кэш рекомендаций ИИ по нормализованным параметрам лошади
+AI_RECOMMENDATION_CACHE = {
+    'ENABLED': True,
+    'BACKEND': os.getenv("AI_RECOMMENDATION_CACHE_BACKEND", "memory"),  # memory | django | file
+    'TIMEOUT': 60 * 60 * 24,  # сутки
+    'MAX_ENTRIES': 500,
+    'CACHE_ALIAS': 'default',  # для бэкенда django
+    'PATH': BASE_DIR / 'ai_cache',  # для бэкенда file
+}
+
+# Почта: если задан EMAIL_HOST - SMTP, иначе письма печатаются в консоль
+# (или пишутся в EMAIL_FILE_PATH с EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend).
+# В проде нужны EMAIL_HOST, EMAIL_HOST_USER, EMAIL_HOST_PASSWORD и DEFAULT_FROM_EMAIL
+EMAIL_HOST = os.getenv("EMAIL_HOST", "localhost")
+EMAIL_BACKEND = os.getenv(
+    "EMAIL_BACKEND",
+    "django.core.mail.backends.smtp.EmailBackend" if "EMAIL_HOST" in os.environ
+    else "django.core.mail.backends.console.EmailBackend"
+)
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
+EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "True") == "True"
+EMAIL_TIMEOUT = 30
+DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "noreply@localhost")
+
+# Очередь писем о бронях (отправляет manage.py dispatch_booking_notifications)
+BOOKING_NOTIFICATIONS_BATCH_SIZE = 50  # писем на одно соединение с почтовым сервером
+BOOKING_NOTIFICATIONS_MAX_ATTEMPTS = 5
+BOOKING_NOTIFICATIONS_RETRY_BASE_SECONDS = 60  # задержка повтора: 1, 2, 4, 8... минут
+BOOKING_NOTIFICATIONS_RETRY_MAX_SECONDS = 3600
+BOOKING_NOTIFICATIONS_STALE_SECONDS = 600  # письмо "в отправке" дольше этого возвращается в очередь
+
+# История бронирований пользователя (курсорная пагинация, выгрузка NDJSON)
+BOOKINGS_PAGE_SIZE = 20
+BOOKINGS_PAGE_SIZE_MAX = 100
+BOOKINGS_EXPORT_CHUNK_SIZE = 500  # строк, читаемых из базы за раз при выгрузке
+
+# Постраничный вывод каталога (курсорная пагинация)
+FOOD_PAGE_SIZE = 24
+FOOD_PAGE_SIZE_MAX = 100
+FOOD_SEARCH_PAGE_SIZE = 10
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -53,6 +115,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'user_profile.middleware.PricingContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
@@ -71,6 +134,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'user_profile.context_processors.pricing',
             ],
         },
     },
@@ -144,8 +208,38 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            # Тестовая база - файл, а не память: в тестах с потоками (cart.tests) запись ждёт
+            # освобождения базы, а не падает с "database table is locked"
+            'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
+        }
+    }
+
+if 'postgresql' in DATABASES['default'].get('ENGINE', ''):
+    # Поиск (SearchVector) и ограничения (ExclusionConstraint) PostgreSQL
+    INSTALLED_APPS.append('django.contrib.postgres')
+
+# Кэш общий для всех воркеров: Redis, если задан REDIS_URL, иначе файлы на диске сервера
+if 'REDIS_URL' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
         }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(BASE_DIR, 'django_cache'),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# Кэш каталога (подборки, категории, фрагменты страницы); сбрасывается сигналами при изменениях
+CATALOG_CACHE_TIMEOUT = 600
+
+# Кэш страницы профиля (user_profile.dashboard); сбрасывается сигналами заказов, лошадей и корзины
+PROFILE_DASHBOARD_CACHE_TIMEOUT = 300
 
 # CORS настройки (если будет фронтенд)
 CORS_ALLOWED_ORIGINS = [
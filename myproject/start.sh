@@ -0,0 +1,20 @@
+#!/bin/sh
+# start.sh - запуск на Railway (nixpacks): миграции, фоновые процессы (воркер ИИ и отправка писем) и gunicorn в одном сервисе.
+# Фоновые процессы перезапускаются, если упали; с платформой, читающей Procfile, они идут отдельными процессами.
+set -e
+
+python manage.py migrate --noinput
+
+run_forever() {
+    while true; do
+        python manage.py "$@" || echo "⚠️ $1 завершился с ошибкой, перезапуск"
+        sleep 5
+    done
+}
+
+# Очередь консультаций ИИ (без воркера задачи остались бы в статусе "ожидает")
+run_forever run_ai_worker &
+# Очередь писем о бронях
+run_forever dispatch_booking_notifications &
+
+exec gunicorn myproject.wsgi --workers 3 --worker-class gthread --threads 4
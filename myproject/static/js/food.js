@@ -11,18 +11,81 @@ document.addEventListener('DOMContentLoaded', function() {
 
 function setupSearch() {
     const searchInput = document.getElementById('searchInput');
-    let searchTimeout;
+    let suggestTimeout;
+    let suggestController;
     
     if (searchInput) {
+        const suggestBox = document.createElement('div');
+        suggestBox.className = 'search-suggestions';
+        suggestBox.style.display = 'none';
+        searchInput.parentNode.style.position = 'relative';
+        searchInput.parentNode.appendChild(suggestBox);
+        
+        // Подсказки по мере ввода, сам поиск - по Enter
         searchInput.addEventListener('input', function(e) {
-            clearTimeout(searchTimeout);
-            searchTimeout = setTimeout(() => {
-                performSearch(e.target.value);
-            }, 500);
+            clearTimeout(suggestTimeout);
+            suggestTimeout = setTimeout(() => {
+                if (suggestController) suggestController.abort();
+                suggestController = new AbortController();
+                loadSuggestions(e.target.value, suggestBox, suggestController.signal);
+            }, 150);
+        });
+        
+        searchInput.addEventListener('keydown', function(e) {
+            if (e.key === 'Enter') {
+                e.preventDefault();
+                suggestBox.style.display = 'none';
+                performSearch(searchInput.value.trim());
+            } else if (e.key === 'Escape') {
+                suggestBox.style.display = 'none';
+            }
+        });
+        
+        document.addEventListener('click', function(e) {
+            if (e.target !== searchInput && !suggestBox.contains(e.target)) {
+                suggestBox.style.display = 'none';
+            }
         });
     }
 }
 
+function loadSuggestions(query, suggestBox, signal) {
+    query = query.trim();
+    if (!query) {
+        suggestBox.style.display = 'none';
+        return;
+    }
+    
+    fetch(`/food/suggest/?q=${encodeURIComponent(query)}`, { signal })
+        .then(response => response.json())
+        .then(data => {
+            suggestBox.innerHTML = '';
+            if (!data.success || !data.suggestions.length) {
+                suggestBox.style.display = 'none';
+                return;
+            }
+            
+            const labels = { food: 'Товар', category: 'Категория', manufacturer: 'Производитель' };
+            data.suggestions.forEach(suggestion => {
+                const link = document.createElement('a');
+                link.href = suggestion.url;
+                link.className = `search-suggestion search-suggestion-${suggestion.type}`;
+                link.textContent = suggestion.text;
+                
+                const label = document.createElement('small');
+                label.textContent = ` ${labels[suggestion.type] || ''}`;
+                link.appendChild(label);
+                suggestBox.appendChild(link);
+            });
+            suggestBox.style.display = 'block';
+        })
+        .catch(error => {
+            if (error.name !== 'AbortError') {
+                console.error('Error loading suggestions:', error);
+            }
+        });
+}
+
 function performSearch(query) {
     if (query.length < 2 && query.length > 0) return;
     
@@ -34,57 +97,70 @@ function performSearch(query) {
         url.searchParams.delete('search');
     }
     
-    // Сбрасываем страницу при поиске
-    url.searchParams.delete('page');
+    // Сбрасываем курсор страницы при поиске
+    url.searchParams.delete('cursor');
     
     window.location.href = url.toString();
 }
 
 function setupInfiniteScroll() {
+    const foodGrid = document.getElementById('foodGrid');
+    if (!foodGrid) return;
+    
     let isLoading = false;
-    let page = 2;
-    let hasMore = true;
+    let nextCursor = foodGrid.dataset.nextCursor;
     
     window.addEventListener('scroll', function() {
-        if (isLoading || !hasMore) return;
+        if (isLoading || !nextCursor) return;
         
         const scrollPosition = window.innerHeight + window.scrollY;
         const pageHeight = document.documentElement.scrollHeight - 100;
         
         if (scrollPosition >= pageHeight) {
-            loadMoreItems(page);
-            page++;
+            isLoading = true;
+            loadMoreItems(nextCursor)
+                .then(cursor => {
+                    nextCursor = cursor;
+                    isLoading = false;
+                })
+                .catch(error => {
+                    console.error('Ошибка загрузки:', error);
+                    isLoading = false;
+                });
         }
     });
 }
 
-function loadMoreItems(page) {
-    isLoading = true;
-    
+function loadMoreItems(cursor) {
+    // Следующая страница по курсору: сервер продолжает с последнего показанного товара
     const url = new URL(window.location);
-    url.searchParams.set('page', page);
+    url.searchParams.set('cursor', cursor);
     
-    fetch(url.toString())
+    return fetch(url.toString())
         .then(response => response.text())
         .then(html => {
             const parser = new DOMParser();
             const doc = parser.parseFromString(html, 'text/html');
-            const newItems = doc.querySelectorAll('.food-card');
+            const newGrid = doc.getElementById('foodGrid');
+            const foodGrid = document.getElementById('foodGrid');
             
-            if (newItems.length === 0) {
-                hasMore = false;
-            } else {
-                const foodGrid = document.getElementById('foodGrid');
-                newItems.forEach(item => {
-                    foodGrid.appendChild(item);
-                });
-            }
+            doc.querySelectorAll('#foodGrid .food-card').forEach(item => {
+                foodGrid.appendChild(item);
+            });
             
-            isLoading = false;
-        })
-        .catch(error => {
-            console.error('Ошибка загрузки:', error);
-            isLoading = false;
+            const nextCursor = newGrid ? newGrid.dataset.nextCursor : '';
+            foodGrid.dataset.nextCursor = nextCursor;
+            
+            const loadMoreLink = document.getElementById('loadMoreLink');
+            const newLink = doc.getElementById('loadMoreLink');
+            if (loadMoreLink) {
+                if (newLink) {
+                    loadMoreLink.href = newLink.href;
+                } else {
+                    loadMoreLink.parentNode.remove();
+                }
+            }
+            return nextCursor;
         });
 }
 
@@ -95,6 +171,7 @@ function setupFilters() {
         sortSelect.addEventListener('change', function() {
             const url = new URL(window.location);
             url.searchParams.set('sort', this.value);
+            url.searchParams.delete('cursor');
             window.location.href = url.toString();
         });
     }
@@ -183,13 +260,13 @@ function showNotification(message, type = 'success') {
 }
 
 function updateCartCount() {
-    fetch('/cart/api/data/')
+    fetch('/cart/count/')
         .then(response => response.json())
         .then(data => {
             if (data.success) {
                 const cartCount = document.getElementById('cartCount');
                 if (cartCount) {
-                    cartCount.textContent = data.total_items;
+                    cartCount.textContent = data.count;
                 }
             }
         });
@@ -60,14 +60,22 @@ const SharedApp = {
     },
     
     // Загрузка бронирований лошадей
-    loadHorseBookings: function() {
-        return fetch('/horses/api/user-bookings/')
+    // (API отдаёт историю страницами по курсору - проходим по next_cursor)
+    loadHorseBookings: function(cursor = null, loaded = []) {
+        const url = cursor
+            ? `/horses/api/user-bookings/?cursor=${encodeURIComponent(cursor)}`
+            : '/horses/api/user-bookings/';
+        return fetch(url)
             .then(response => response.json())
             .then(data => {
-                if (data.success) {
-                    return data.bookings;
+                if (!data.success) {
+                    return loaded;
                 }
-                return [];
+                const bookings = loaded.concat(data.bookings);
+                if (data.has_next && data.next_cursor) {
+                    return SharedApp.loadHorseBookings(data.next_cursor, bookings);
+                }
+                return bookings;
             })
             .catch(error => {
                 console.error('Ошибка загрузки бронирований:', error);
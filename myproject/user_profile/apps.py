@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class UserProfileConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user_profile'
+
+    def ready(self):
+        # Импортируем сигналы
+        try:
+            import user_profile.signals
+        except ImportError:
+            pass
@@ -0,0 +1,10 @@
+# user_profile/context_processors.py
+from .pricing import get_pricing_context
+
+
+def pricing(request):
+    """{{ pricing.tier }}, {{ pricing.discount_percentage }}, {{ pricing.cart_count }} в шаблонах"""
+    context = getattr(request, 'pricing', None)
+    if context is None:
+        context = get_pricing_context(getattr(request, 'user', None))
+    return {'pricing': context}
@@ -0,0 +1,119 @@
+# user_profile/dashboard.py - данные страницы профиля
+"""
+Лошади, последние заказы (с числом позиций из одного запроса с Count),
+итоги заказов и корзины собираются в один словарь и кэшируются на пользователя.
+Ключ содержит версию пользователя и время изменения корзины: сигналы заказов
+и лошадей увеличивают версию, а любое изменение корзины меняет cart.updated_at
+(сигналы строк корзины в cart/signals.py, оформление заказа, пересчёт цен).
+
+Данные, зависящие от подписки (экономия), считаются при каждом запросе
+из контекста цен - смена подписки кэш не сбрасывает.
+"""
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from cart.models import FoodOrder
+from cart.pricing import get_cart_totals
+
+from .models import Horse
+
+
+DASHBOARD_ORDERS = 10
+
+
+def _version_key(user_id):
+    return f'profile:dashboard:{user_id}:version'
+
+
+def get_dashboard_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Если версия вытеснена из кэша, новое значение не совпадёт со старыми ключами
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key) or 0
+    return version
+
+
+def bump_dashboard_version(user_id):
+    """Сбросить кэш профиля пользователя"""
+    key = _version_key(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, None)
+        return version
+
+
+def serialize_horse(horse):
+    return {
+        'id': str(horse.id),
+        'name': horse.name,
+        'breed': horse.get_breed_display(),
+        'age': horse.age,
+        'color': horse.color,
+        'description': horse.description
+    }
+
+
+def serialize_order(order):
+    return {
+        'id': str(order.id),
+        'order_number': order.order_number,
+        'items_count': order.items_count,
+        'total': float(order.total),
+        'status': order.get_status_display(),
+        'status_class': order.status,
+        'created_at': order.created_at.strftime('%d.%m.%Y %H:%M')
+    }
+
+
+def recent_orders(user, limit=DASHBOARD_ORDERS):
+    """Последние заказы с числом позиций одним запросом"""
+    return FoodOrder.objects.filter(user=user).annotate(
+        items_count=Count('items')
+    ).order_by('-created_at')[:limit]
+
+
+def build_dashboard(user, cart=None, tier=''):
+    """Собрать данные профиля из базы (без кэша)"""
+    # Число заказов и сумма покупок - по всем заказам, а не только по последним на странице
+    order_totals = FoodOrder.objects.filter(user=user).order_by().aggregate(
+        orders_count=Count('id'),
+        total_spent=Sum('total')
+    )
+
+    cart_items_count = 0
+    cart_subtotal = Decimal('0')
+    if cart is not None:
+        # Итоги корзины - тот же расчёт, что на странице корзины
+        totals = get_cart_totals(cart, tier=tier)
+        cart_items_count = totals.item_count
+        cart_subtotal = totals.subtotal
+
+    return {
+        'horses': [serialize_horse(horse) for horse in Horse.objects.filter(owner=user)],
+        'orders': [serialize_order(order) for order in recent_orders(user)],
+        'orders_count': order_totals['orders_count'],
+        'total_spent': float(order_totals['total_spent'] or 0),
+        'cart_items_count': cart_items_count,
+        'cart_subtotal': float(cart_subtotal),
+    }
+
+
+def get_dashboard(user, pricing):
+    """Данные профиля из кэша; pricing - контекст цен запроса (профиль и корзина уже загружены)"""
+    cart = pricing.cart
+    cart_stamp = f'{cart.id}:{cart.updated_at.timestamp()}' if cart is not None else '-'
+    key = f'profile:dashboard:{user.id}:{get_dashboard_version(user.id)}:{cart_stamp}'
+
+    dashboard = cache.get(key)
+    if dashboard is None:
+        dashboard = build_dashboard(user, cart, pricing.tier)
+        cache.set(key, dashboard, getattr(settings, 'PROFILE_DASHBOARD_CACHE_TIMEOUT', 300))
+    return dashboard
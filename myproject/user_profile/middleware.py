@@ -0,0 +1,31 @@
+# user_profile/middleware.py
+from .pricing import get_pricing_context
+
+
+class RequestPricing:
+    """Контекст цен пользователя запроса. Каждое обращение берёт get_pricing_context(request.user),
+    поэтому после invalidate_pricing_context (смена подписки, изменение корзины) виден новый контекст."""
+
+    __slots__ = ('_request',)
+
+    def __init__(self, request):
+        self._request = request
+
+    def __getattr__(self, name):
+        return getattr(get_pricing_context(self._request.user), name)
+
+
+class PricingContextMiddleware:
+    """request.pricing - профиль, подписка и корзина пользователя, загружаемые одним запросом.
+
+    Контекст строится при первом обращении (к request.pricing или к ценам через
+    get_price_for_user) и запоминается на пользователе, поэтому запросы, которым цены
+    не нужны, ничего не платят. Должен стоять после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.pricing = RequestPricing(request)
+        return self.get_response(request)
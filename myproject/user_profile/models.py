@@ -83,4 +83,11 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     """Сохранить профиль пользователя"""
-    instance.profile.save()
\ No newline at end of file
+    instance.profile.save()
+
+@receiver(post_save, sender=UserProfile)
+def reset_pricing_context(sender, instance, **kwargs):
+    """После смены подписки цены в этом же запросе считаются по новому уровню"""
+    if instance._meta.get_field('user').is_cached(instance):
+        from .pricing import invalidate_pricing_context
+        invalidate_pricing_context(instance.user)
\ No newline at end of file
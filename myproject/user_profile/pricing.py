@@ -0,0 +1,102 @@
+# user_profile/pricing.py - контекст цен пользователя на время запроса
+"""
+Профиль, уровень подписки и счётчики корзины загружаются одним запросом
+(User + LEFT JOIN профиля и корзины) и запоминаются на объекте пользователя.
+Все расчёты цен (FoodItem, Horse, корзина) берут уровень подписки отсюда,
+а user.profile / user.shopping_cart после загрузки не обращаются к базе.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+
+from .models import UserProfile
+
+
+class PricingContext:
+    """Уровень подписки и сводка корзины пользователя"""
+
+    def __init__(self, profile=None, cart=None):
+        self.profile = profile
+        self.cart = cart
+
+        self.subscription = profile.subscription if profile is not None else 'free'
+        self.is_active = profile is not None and profile.is_premium()
+        # 'pro' / 'premium' для активной подписки, иначе ''
+        self.tier = self.subscription if self.is_active else ''
+
+        self.cart_count = cart.item_count if cart is not None else 0
+        self.cart_quantity = cart.total_quantity if cart is not None else 0
+
+    @property
+    def subscription_display(self):
+        if self.profile is not None:
+            return self.profile.get_subscription_display_name()
+        return dict(UserProfile.SUBSCRIPTION_CHOICES)['free']
+
+    @property
+    def discount_rate(self):
+        from cart.pricing import DISCOUNT_RATES
+        return DISCOUNT_RATES.get(self.tier, Decimal('0'))
+
+    @property
+    def discount_percentage(self):
+        return int(self.discount_rate * 100)
+
+    def as_dict(self):
+        return {
+            'subscription': self.subscription,
+            'subscription_display': self.subscription_display,
+            'is_premium': self.is_active,
+            'tier': self.tier,
+            'discount_percentage': self.discount_percentage,
+            'cart_count': self.cart_count,
+            'cart_quantity': self.cart_quantity,
+        }
+
+
+ANONYMOUS_CONTEXT = PricingContext()
+
+
+def _related_or_none(instance, name):
+    try:
+        return getattr(instance, name)
+    except Exception:
+        return None
+
+
+def get_pricing_context(user):
+    """Контекст цен пользователя; для одного объекта пользователя строится один раз"""
+    if user is None or not getattr(user, 'is_authenticated', False):
+        return ANONYMOUS_CONTEXT
+
+    context = getattr(user, '_pricing_context', None)
+    if context is not None:
+        return context
+
+    loaded = User.objects.select_related('profile', 'shopping_cart').filter(pk=user.pk).first()
+    profile = _related_or_none(loaded, 'profile') if loaded is not None else None
+    cart = _related_or_none(loaded, 'shopping_cart') if loaded is not None else None
+
+    # Подкладываем загруженные объекты в кэш связей - user.profile в шаблонах и
+    # представлениях больше не делает отдельный запрос
+    if profile is not None:
+        User.profile.related.set_cached_value(user, profile)
+        profile._meta.get_field('user').set_cached_value(profile, user)
+    if cart is not None:
+        User.shopping_cart.related.set_cached_value(user, cart)
+        cart._meta.get_field('user').set_cached_value(cart, user)
+
+    context = PricingContext(profile, cart)
+    user._pricing_context = context
+    return context
+
+
+def pricing_tier(user):
+    """'pro' / 'premium' для активной подписки, иначе ''"""
+    return get_pricing_context(user).tier
+
+
+def invalidate_pricing_context(user):
+    """Сбросить контекст после изменения подписки или корзины"""
+    if user is not None and getattr(user, '_pricing_context', None) is not None:
+        del user._pricing_context
@@ -0,0 +1,32 @@
+# user_profile/signals.py - сброс кэша страницы профиля
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from cart.models import FoodOrder, FoodOrderItem
+
+from .dashboard import bump_dashboard_version
+from .models import Horse
+
+
+def _bump_dashboard(user_id):
+    # После коммита: иначе параллельный запрос успеет закэшировать старые данные
+    if user_id:
+        transaction.on_commit(lambda: bump_dashboard_version(user_id))
+
+@receiver(post_save, sender=FoodOrder)
+@receiver(post_delete, sender=FoodOrder)
+def reset_dashboard_on_order(sender, instance, **kwargs):
+    _bump_dashboard(instance.user_id)
+
+@receiver(post_save, sender=FoodOrderItem)
+@receiver(post_delete, sender=FoodOrderItem)
+def reset_dashboard_on_order_item(sender, instance, **kwargs):
+    """Изменилось число позиций заказа"""
+    user_id = FoodOrder.objects.filter(pk=instance.order_id).values_list('user_id', flat=True).first()
+    _bump_dashboard(user_id)
+
+@receiver(post_save, sender=Horse)
+@receiver(post_delete, sender=Horse)
+def reset_dashboard_on_horse(sender, instance, **kwargs):
+    _bump_dashboard(instance.owner_id)
@@ -1,3 +1,147 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from cart.models import FoodOrder, FoodOrderItem
+from cart.views import add_to_cart
+from food.models import FoodItem
+
+from .dashboard import DASHBOARD_ORDERS
+from .middleware import PricingContextMiddleware
+from .models import Horse
+from .pricing import ANONYMOUS_CONTEXT, get_pricing_context
+
+
+def create_food(name='Овёс плющеный'):
+    return FoodItem.objects.create(
+        name=name, base_price=Decimal('100'), premium_price=Decimal('90'), pro_price=Decimal('80'), stock=10,
+    )
+
+
+class PricingContextTests(TestCase):
+    """request.pricing и контекст цен пользователя (user_profile.pricing)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('rider', password='pass')
+        self.factory = RequestFactory()
+
+    def run_middleware(self, view, request=None):
+        request = request or self.factory.get('/')
+        request.user = User.objects.get(pk=self.user.pk)
+        return PricingContextMiddleware(view)(request)
+
+    def test_context_is_loaded_once_per_user_object(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            context = get_pricing_context(user)
+            self.assertIs(get_pricing_context(user), context)
+            # Профиль уже в кэше связи
+            self.assertEqual(user.profile.subscription, 'free')
+        self.assertIs(get_pricing_context(None), ANONYMOUS_CONTEXT)
+
+    def test_subscription_change_is_visible_in_same_request(self):
+        def view(request):
+            before = (request.pricing.tier, request.pricing.discount_percentage)
+            profile = request.user.profile
+            profile.subscription = 'pro'
+            profile.subscription_active = True
+            profile.save()
+            return before, (request.pricing.tier, request.pricing.discount_percentage)
+
+        before, after = self.run_middleware(view)
+
+        self.assertEqual(before, ('', 0))
+        self.assertEqual(after, ('pro', 20))
+
+    def test_cart_change_is_visible_in_same_request(self):
+        food = create_food()
+
+        def view(request):
+            before = request.pricing.cart_count, request.pricing.cart_quantity
+            response = add_to_cart(request)
+            self.assertTrue(json.loads(response.content)['success'])
+            return before, (request.pricing.cart_count, request.pricing.cart_quantity)
+
+        request = self.factory.post('/cart/add/', data=json.dumps({'food_id': str(food.id), 'quantity': 3}),
+                                    content_type='application/json')
+        before, after = self.run_middleware(view, request)
+
+        self.assertEqual(before, (0, 0))
+        self.assertEqual(after, (1, 3))
+
+
+def create_order(user, number, total):
+    return FoodOrder.objects.create(
+        user=user, order_number=f'FO{number:06d}', customer_name='Покупатель', customer_phone='+70000000000',
+        delivery_city='Алексин', delivery_street='Заводская', delivery_house='1',
+        subtotal=Decimal(total), delivery_cost=Decimal('0'), assembly_cost=Decimal('0'), total=Decimal(total),
+    )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardCacheTests(TestCase):
+    """Кэш страницы профиля: итоги по всем заказам, сброс версией и временем изменения корзины"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('rider', password='pass')
+        self.client.force_login(self.user)
+        self.url = reverse('profile_data')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.orders = [create_order(self.user, number, '100') for number in range(DASHBOARD_ORDERS + 2)]
+
+    def stats(self):
+        return self.client.get(self.url).json()['stats']
+
+    def test_totals_cover_all_orders(self):
+        data = self.client.get(self.url).json()
+
+        self.assertEqual(len(data['orders']), DASHBOARD_ORDERS)
+        self.assertEqual(data['stats']['orders_count'], DASHBOARD_ORDERS + 2)
+        self.assertEqual(data['stats']['total_spent'], 100.0 * (DASHBOARD_ORDERS + 2))
+
+    def test_cached_until_order_changes(self):
+        self.stats()
+        with self.assertNumQueries(3):  # сессия, пользователь, контекст цен
+            self.assertEqual(self.stats()['orders_count'], DASHBOARD_ORDERS + 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_order(self.user, 999, '50')
+        self.assertEqual(self.stats()['total_spent'], 100.0 * (DASHBOARD_ORDERS + 2) + 50)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.orders[0].delete()
+        self.assertEqual(self.stats()['total_spent'], 100.0 * (DASHBOARD_ORDERS + 1) + 50)
+
+    def test_order_item_and_horse_changes_reset_cache(self):
+        food = create_food()
+        order = self.orders[-1]  # последний созданный заказ - первый в списке
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FoodOrderItem.objects.create(order=order, food=food, quantity=2, price=Decimal('50'))
+            Horse.objects.create(owner=self.user, name='Гром', breed='orlov', age=8)
+        data = self.client.get(self.url).json()
+
+        self.assertEqual(data['orders'][0]['items_count'], 1)
+        self.assertEqual(data['stats']['horses_count'], 1)
+
+    def test_cart_change_resets_cache_without_version_bump(self):
+        food = create_food()
+        self.assertEqual(self.stats()['cart_items_count'], 0)
+
+        # Корзина меняется без on_commit-сигналов: ключ меняет cart.updated_at
+        response = self.client.post(reverse('add_to_cart'), data=json.dumps({'food_id': str(food.id), 'quantity': 2}),
+                                    content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        stats = self.stats()
+        self.assertEqual((stats['cart_items_count'], stats['cart_subtotal']), (1, 200.0))
+
+        item = self.user.shopping_cart.items.get()
+        self.client.post(reverse('update_cart_item'), data=json.dumps({'item_id': str(item.id), 'quantity': 3}),
+                         content_type='application/json')
+        self.assertEqual(self.stats()['cart_subtotal'], 300.0)
@@ -4,40 +4,35 @@ from django.http import JsonResponse
 import json
 from django.views.decorators.csrf import csrf_exempt
 from .models import UserProfile, Horse
-from cart.models import FoodOrder
+from cart.pricing import reprice_user_cart
+from .dashboard import get_dashboard
 from django.contrib.auth import logout as auth_logout
 
 @login_required
 def profile_view(request):
     """Страница профиля пользователя с динамическими данными"""
     user = request.user
-    profile = user.profile
-    
-    # Получаем лошадей пользователя
-    user_horses = Horse.objects.filter(owner=user)
-    
-    # Получаем заказы кормов пользователя
-    user_food_orders = FoodOrder.objects.filter(user=user).order_by('-created_at')[:10]
+    # Профиль, подписка и корзина - из контекста цен запроса (один запрос с JOIN)
+    pricing = request.pricing
+    profile = pricing.profile or user.profile
+
+    # Лошади, последние заказы и итоги корзины - из кэша профиля
+    dashboard = get_dashboard(user, pricing)
     
     # Получаем корзину пользователя
-    from cart.models import Cart
-    try:
-        user_cart = Cart.objects.get(user=user)
-        cart_items = user_cart.items.all()
-    except Cart.DoesNotExist:
-        user_cart = None
-        cart_items = []
+    user_cart = pricing.cart
+    cart_items = user_cart.items.all() if user_cart is not None else []
     
     # Подготавливаем данные для контекста
     context = {
         'user': user,
         'profile': profile,
-        'horses': user_horses,
-        'orders': user_food_orders,
+        'horses': dashboard['horses'],
+        'orders': dashboard['orders'],
         'cart': user_cart,
         'cart_items': cart_items,
-        'subscription_display': profile.get_subscription_display_name(),
-        'is_premium': profile.is_premium(),
+        'subscription_display': pricing.subscription_display,
+        'is_premium': pricing.is_active,
     }
     
     return render(request, 'user_profile/profile.html', context)
@@ -113,6 +108,9 @@ def update_subscription(request):
             profile.subscription_active = True
             profile.save()
             
+            # Цены в корзине пересчитываем сразу по новому тарифу
+            reprice_user_cart(request.user)
+            
             return JsonResponse({
                 'success': True,
                 'message': f'Подписка изменена на {subscription_type}',
@@ -132,57 +130,18 @@ def update_subscription(request):
 def get_profile_data(request):
     """Получение данных профиля для AJAX"""
     user = request.user
-    profile = user.profile
-    
-    # Получаем лошадей пользователя
-    horses = Horse.objects.filter(owner=user)
-    horses_data = [
-        {
-            'id': str(horse.id),
-            'name': horse.name,
-            'breed': horse.get_breed_display(),
-            'age': horse.age,
-            'color': horse.color,
-            'description': horse.description
-        }
-        for horse in horses
-    ]
-    
-    # Получаем заказы кормов пользователя
-    from cart.models import FoodOrder
-    orders = FoodOrder.objects.filter(user=user).order_by('-created_at')[:10]
-    orders_data = [
-        {
-            'id': str(order.id),
-            'order_number': order.order_number,
-            'items_count': order.items.count(),
-            'total': float(order.total),
-            'status': order.get_status_display(),
-            'status_class': order.status,
-            'created_at': order.created_at.strftime('%d.%m.%Y %H:%M')
-        }
-        for order in orders
-    ]
-    
-    # Получаем корзину
-    from cart.models import Cart
-    try:
-        cart = Cart.objects.get(user=user)
-        cart_items_count = cart.total_items
-        cart_subtotal = float(cart.subtotal)
-    except Cart.DoesNotExist:
-        cart_items_count = 0
-        cart_subtotal = 0
+    pricing = request.pricing
+    profile = pricing.profile or user.profile
     
-    # Рассчитываем статистику
-    total_orders = orders.count()
-    total_spent = sum([float(order.total) for order in orders])
+    # Лошади, заказы, итоги заказов и корзины - один кэшированный словарь
+    dashboard = get_dashboard(user, pricing)
     
     # Расчет лет с нами
     from datetime import datetime
     years_with_us = max(1, (datetime.now().date() - user.date_joined.date()).days // 365)
     
-    # Расчет экономии
+    # Расчет экономии по текущей подписке (не кэшируется - зависит от тарифа)
+    total_spent = dashboard['total_spent']
     total_savings = 0
     if profile.subscription == 'premium':
         total_savings = total_spent * 0.15
@@ -205,17 +164,17 @@ def get_profile_data(request):
             'joined_date': user.date_joined.strftime('%d.%m.%Y')
         },
         'stats': {
-            'horses_count': horses.count(),
-            'orders_count': total_orders,
-            'cart_items_count': cart_items_count,
-            'cart_subtotal': cart_subtotal,
+            'horses_count': len(dashboard['horses']),
+            'orders_count': dashboard['orders_count'],
+            'cart_items_count': dashboard['cart_items_count'],
+            'cart_subtotal': dashboard['cart_subtotal'],
             'years_count': years_with_us,
             'total_spent': total_spent,
             'total_savings': total_savings,
             'rating': 4.8
         },
-        'horses': horses_data,
-        'orders': orders_data
+        'horses': dashboard['horses'],
+        'orders': dashboard['orders']
     })
 
 @login_required